@@ -0,0 +1,61 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class _MatchHandler(BaseHTTPRequestHandler):
+    """
+    模拟 OSRM /match/v1/driving/{coords} 接口：直接把输入坐标作为匹配几何返回，
+    响应结构与 osrm_map_matching.osrm_map_matching 所需的字段一致。
+    """
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        prefix = '/match/v1/driving/'
+        if not path.startswith(prefix):
+            self.send_error(404)
+            return
+        coordinates = [[float(value) for value in pair.split(',')] for pair in path[len(prefix):].split(';')]
+        body = json.dumps({
+            'code': 'Ok',
+            'matchings': [{
+                'distance': 10.0 * (len(coordinates) - 1),
+                'duration': 1.0 * (len(coordinates) - 1),
+                'confidence': 0.9,
+                'geometry': {'type': 'LineString', 'coordinates': coordinates},
+            }],
+            'tracepoints': [{'location': coordinate} for coordinate in coordinates],
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OsrmStubServer:
+    """
+    在后台线程中运行的本地 OSRM 替身服务，用于离线测试客户端的请求构造和响应解析开销。
+
+    用法:
+        with OsrmStubServer() as stub:
+            osrm_map_matching(df, osrm_url=stub.url)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = ThreadingHTTPServer((host, port), _MatchHandler)
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'OsrmStubServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
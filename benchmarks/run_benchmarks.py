@@ -0,0 +1,430 @@
+"""
+离线基准测试：在合成路网和合成轨迹上为各个热点函数计时，并与保存的基线比较。
+
+在仓库根目录下运行:
+    python -m benchmarks.run_benchmarks --size small
+    python -m benchmarks.run_benchmarks --size small --filter filter.      # 只运行名称包含 filter. 的用例
+    python -m benchmarks.run_benchmarks --size small --save-baseline       # 用本次结果覆盖基线
+
+某个用例的最短耗时超过基线的 (1 + tolerance) 倍时记为性能回退，存在回退时进程返回码为 1。
+缺少可选依赖（requests、frechetdist、geopandas 等）的用例会被跳过。
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+import networkx as nx
+
+from benchmarks.synthetic_data import make_grid_network, make_noisy_trajectories, write_network_csv
+from benchmarks.osrm_stub import OsrmStubServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, 'baselines')
+RESULT_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+# 不同规模的合成数据参数
+SIZES = {
+    'small': {'rows': 20, 'cols': 20, 'n_orders': 100, 'points_per_order': 60, 'k_pairs': 10},
+    'medium': {'rows': 50, 'cols': 50, 'n_orders': 1000, 'points_per_order': 120, 'k_pairs': 30},
+    'large': {'rows': 100, 'cols': 100, 'n_orders': 5000, 'points_per_order': 200, 'k_pairs': 60},
+}
+
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(name: str, repeat: int = 5):
+    """
+    注册一个基准用例。被装饰的函数接收 BenchmarkData，返回 (待计时的无参函数, 处理的条目数)。
+    """
+    def decorator(func):
+        BENCHMARKS[name] = {'setup': func, 'repeat': repeat}
+        return func
+    return decorator
+
+
+class BenchmarkData:
+    """
+    按需生成并缓存各用例共用的合成数据。
+    """
+
+    def __init__(self, size: str, seed: int = 0):
+        self.size = size
+        self.params = SIZES[size]
+        self.seed = seed
+        self._cache = {}
+
+    def _get(self, key, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    @property
+    def network(self) -> tuple:
+        return self._get('network', lambda: make_grid_network(self.params['rows'], self.params['cols'],
+                                                              seed=self.seed))
+
+    @property
+    def trajectories(self) -> pd.DataFrame:
+        nodes_df, edges_df = self.network
+        return self._get('trajectories', lambda: make_noisy_trajectories(
+            nodes_df, edges_df, n_orders=self.params['n_orders'],
+            points_per_order=self.params['points_per_order'], seed=self.seed))
+
+    @property
+    def trajectories_datetime(self) -> pd.DataFrame:
+        def factory():
+            df = self.trajectories[['driver_id', 'order_id', 'gps_time', 'longitude', 'latitude']].copy()
+            df['gps_time'] = pd.to_datetime(df['gps_time'], unit='s')
+            return df
+        return self._get('trajectories_datetime', factory)
+
+    @property
+    def graph(self) -> nx.Graph:
+        def factory():
+            # 与 k_shortest_paths.py 中的构图方式一致
+            nodes_df, edges_df = self.network
+            G = nx.Graph()
+            for osmid, x, y in zip(nodes_df['osmid'], nodes_df['x'], nodes_df['y']):
+                G.add_node(osmid, lon=x, lat=y)
+            for u, v, length, osmid in zip(edges_df['u'], edges_df['v'], edges_df['length'], edges_df['osmid']):
+                G.add_edge(u, v, weight=length, osmid=osmid)
+            return G
+        return self._get('graph', factory)
+
+    @property
+    def node_pairs(self) -> list:
+        def factory():
+            rng = np.random.default_rng(self.seed)
+            nodes = self.network[0]['osmid'].to_numpy()
+            picks = rng.choice(len(nodes), size=(self.params['k_pairs'], 2), replace=False)
+            return [(int(nodes[a]), int(nodes[b])) for a, b in picks]
+        return self._get('node_pairs', factory)
+
+    @property
+    def shared_network(self):
+        from utils.shared_network_utils import SharedRoadNetwork
+        return self._get('shared_network', lambda: SharedRoadNetwork.from_dataframes(*self.network))
+
+
+# ---------------------------------------------------------------------------
+# 过滤函数（utils/filter_data_utils.py）
+# ---------------------------------------------------------------------------
+
+def _filter_case(func_name: str, **kwargs):
+    def setup(data: BenchmarkData):
+        from utils import filter_data_utils
+        func = getattr(filter_data_utils, func_name)
+        df = data.trajectories_datetime
+        return (lambda: func(df, **kwargs)), len(df)
+    return setup
+
+
+for _name, _kwargs in [('filter_gps_data_by_interval', {}),
+                       ('filter_orders_by_max_interval', {}),
+                       ('filter_orders_by_length', {}),
+                       ('remove_duplicate_gps_points', {}),
+                       ('filter_orders_by_distance', {}),
+                       ('filter_orders_by_max_segment_distance', {}),
+                       ('detect_gps_loops', {}),
+                       ('filter_orders_by_loops', {})]:
+    benchmark(f'filter.{_name}')(_filter_case(_name, **_kwargs))
+
+
+# ---------------------------------------------------------------------------
+# 候选路段搜索
+# ---------------------------------------------------------------------------
+
+@benchmark('candidates.build_shared_network', repeat=3)
+def bench_build_shared_network(data: BenchmarkData):
+    from utils.shared_network_utils import build_network_arrays
+    nodes_df, edges_df = data.network
+    return (lambda: build_network_arrays(nodes_df, edges_df)), len(edges_df)
+
+
+@benchmark('candidates.shared_network_radius_50m')
+def bench_candidate_edges(data: BenchmarkData):
+    network = data.shared_network
+    df = data.trajectories
+    lon, lat = df['longitude'].to_numpy(), df['latitude'].to_numpy()
+    return (lambda: network.candidate_edges(lon, lat, 50.0)), len(df)
+
+
+@benchmark('candidates.geopandas_sjoin_radius_50m', repeat=3)
+def bench_candidate_sjoin(data: BenchmarkData):
+    # 与 make_dataset.py 相同的缓冲区 + sjoin 方式
+    try:
+        import geopandas as gpd
+        from shapely.wkt import loads
+    except ImportError:
+        raise SkipBenchmark('需要 geopandas 和 shapely')
+    _, edges_df = data.network
+    roads = gpd.GeoDataFrame(edges_df, geometry=edges_df['geometry'].apply(loads), crs='EPSG:4326').to_crs('EPSG:3857')
+    df = data.trajectories
+
+    def run():
+        points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['longitude'], df['latitude']), crs='EPSG:4326')
+        points = points.to_crs('EPSG:3857')
+        points['geometry'] = points.geometry.buffer(50)
+        return gpd.sjoin(points, roads, how='inner', predicate='intersects')
+
+    return run, len(df)
+
+
+# ---------------------------------------------------------------------------
+# 最近节点
+# ---------------------------------------------------------------------------
+
+@benchmark('nearest_node.node_snapper')
+def bench_node_snapper(data: BenchmarkData):
+    from utils.path_candidate_utils import NodeSnapper
+    nodes_df, _ = data.network
+    snapper = NodeSnapper(nodes_df['osmid'], nodes_df['x'], nodes_df['y'])
+    df = data.trajectories
+    lon, lat = df['longitude'].to_numpy(), df['latitude'].to_numpy()
+    return (lambda: snapper.snap(lon, lat)), len(df)
+
+
+@benchmark('nearest_node.one_to_many_scan')
+def bench_nearest_scan(data: BenchmarkData):
+    # 与 k_shortest_paths.find_nearest_node 相同：每个点对所有节点做一次向量化距离计算
+    from utils.geo_utils import one_to_many_distances
+    nodes_df, _ = data.network
+    node_lon, node_lat = nodes_df['x'].to_numpy(), nodes_df['y'].to_numpy()
+    df = data.trajectories.head(200)
+    points = list(zip(df['longitude'], df['latitude']))
+
+    def run():
+        return [int(np.argmin(one_to_many_distances(lon, lat, node_lon, node_lat))) for lon, lat in points]
+
+    return run, len(points)
+
+
+# ---------------------------------------------------------------------------
+# k 条最短路径
+# ---------------------------------------------------------------------------
+
+def _k_shortest_case(use_simplified: bool):
+    def setup(data: BenchmarkData):
+        from utils.path_candidate_utils import PathCandidateService
+        from utils.simplified_graph_utils import SimplifiedRoutingGraph
+        graph = SimplifiedRoutingGraph(data.graph) if use_simplified else data.graph
+        pairs = data.node_pairs
+
+        def run():
+            # 每次使用新的服务，测量未命中缓存时的计算耗时
+            service = PathCandidateService(graph, k=4)
+            return [service.get_paths(source, target) for source, target in pairs]
+
+        return run, len(pairs)
+    return setup
+
+
+benchmark('k_shortest.raw_graph', repeat=3)(_k_shortest_case(False))
+benchmark('k_shortest.simplified_graph', repeat=3)(_k_shortest_case(True))
+
+
+# ---------------------------------------------------------------------------
+# OSRM 客户端（本地替身服务）
+# ---------------------------------------------------------------------------
+
+@benchmark('osrm_client.match_single_order_stub', repeat=3)
+def bench_osrm_client(data: BenchmarkData):
+    try:
+        from osrm_map_matching import match_single_order
+    except ImportError:
+        raise SkipBenchmark('需要 requests')
+    df = data.trajectories
+    orders = list(itertools.islice(df.groupby('order_id'), 50))
+    stub = OsrmStubServer().__enter__()
+    data._cache.setdefault('_stubs', []).append(stub)
+
+    def run():
+        return [match_single_order(order_id, group, osrm_url=stub.url) for order_id, group in orders]
+
+    return run, int(sum(len(group) for _, group in orders))
+
+
+# ---------------------------------------------------------------------------
+# 匹配结果评估
+# ---------------------------------------------------------------------------
+
+@benchmark('evaluation.frechet_frdist', repeat=3)
+def bench_frechet(data: BenchmarkData):
+    # 与 osrm_result_statics.ipynb 相同：按订单计算原始轨迹与匹配轨迹的离散弗雷歇距离
+    try:
+        from frechetdist import frdist
+    except ImportError:
+        raise SkipBenchmark('需要 frechetdist')
+    df = data.trajectories
+    orders = [(group[['longitude', 'latitude']].to_numpy(), group[['true_longitude', 'true_latitude']].to_numpy())
+              for _, group in itertools.islice(df.groupby('order_id'), 20)]
+
+    def run():
+        return [frdist(original, matched) for original, matched in orders]
+
+    return run, int(sum(len(original) for original, _ in orders))
+
+
+@benchmark('evaluation.projection_errors')
+def bench_projection_errors(data: BenchmarkData):
+    from utils.projection_utils import project_orders_to_routes
+    df = data.trajectories
+    route_df = pd.DataFrame({
+        'order_id': df['order_id'],
+        'point_sequence': df.groupby('order_id').cumcount(),
+        'matched_longitude': df['true_longitude'],
+        'matched_latitude': df['true_latitude'],
+    })
+    return (lambda: project_orders_to_routes(df, route_df)), len(df)
+
+
+# ---------------------------------------------------------------------------
+# 运行与比较
+# ---------------------------------------------------------------------------
+
+def _measure(func, repeat: int) -> list:
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()  # 预热
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(size: str = 'small', name_filter: str = None, repeat: int = None, seed: int = 0) -> dict:
+    """
+    运行所有（或名称包含 name_filter 的）用例，返回 {用例名: 结果字典}。
+    """
+    data = BenchmarkData(size, seed)
+    results = {}
+    try:
+        for name, spec in BENCHMARKS.items():
+            if name_filter and name_filter not in name:
+                continue
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    func, n_items = spec['setup'](data)
+            except SkipBenchmark as e:
+                print(f"{name:<45} 跳过（{e}）")
+                results[name] = {'skipped': str(e)}
+                continue
+            timings = _measure(func, repeat or spec['repeat'])
+            best = min(timings)
+            results[name] = {
+                'min_seconds': best,
+                'median_seconds': statistics.median(timings),
+                'repeat': len(timings),
+                'n_items': n_items,
+                'items_per_sec': n_items / best if best > 0 else None,
+            }
+            print(f"{name:<45} {best * 1000:>10.2f} ms  {n_items / best:>14.0f} 条/秒")
+    finally:
+        for stub in data._cache.get('_stubs', []):
+            stub.__exit__(None, None, None)
+    return results
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float = 0.25) -> list:
+    """
+    比较本次结果与基线，返回回退的用例列表 [(用例名, 基线耗时, 本次耗时, 比值), ...]。
+    """
+    regressions = []
+    print(f"\n{'用例':<45} {'基线(ms)':>10} {'本次(ms)':>10} {'比值':>7}")
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if 'min_seconds' not in result or not base or 'min_seconds' not in base:
+            continue
+        ratio = result['min_seconds'] / base['min_seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  <-- 回退'
+            regressions.append((name, base['min_seconds'], result['min_seconds'], ratio))
+        elif ratio < 1 / (1 + tolerance):
+            flag = '  (提升)'
+        print(f"{name:<45} {base['min_seconds'] * 1000:>10.2f} {result['min_seconds'] * 1000:>10.2f} "
+              f"{ratio:>7.2f}{flag}")
+    return regressions
+
+
+def _environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'networkx': nx.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='离线合成数据基准测试')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--filter', dest='name_filter', default=None, help='只运行名称包含该字符串的用例')
+    parser.add_argument('--repeat', type=int, default=None, help='覆盖每个用例的重复次数')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许的相对变慢比例')
+    parser.add_argument('--baseline', default=None, help='基线文件路径，默认为 benchmarks/baselines/<size>.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--write-csv', default=None, help='把合成路网和轨迹写入该目录，便于手动运行其他脚本')
+    args = parser.parse_args(argv)
+
+    if args.write_csv:
+        data = BenchmarkData(args.size)
+        write_network_csv(*data.network, args.write_csv)
+        data.trajectories.to_csv(os.path.join(args.write_csv, 'synthetic_orders.csv'), index=False)
+        print(f"合成数据已写入: {args.write_csv}")
+
+    print(f"规模: {args.size} {SIZES[args.size]}")
+    results = run_benchmarks(args.size, args.name_filter, args.repeat)
+    report = {
+        'size': args.size,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'results': results,
+    }
+
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    with open(os.path.join(RESULT_DIR, f'{args.size}_latest.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f'{args.size}.json')
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到: {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"\n未找到基线文件 {baseline_path}，可使用 --save-baseline 生成。")
+        return 0
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('environment', {}).get('platform') != report['environment']['platform']:
+        print("\n注意: 基线来自不同的运行环境，比值仅供参考。")
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n发现 {len(regressions)} 个性能回退（超过基线 {args.tolerance:.0%}）。")
+        return 1
+    print("\n没有发现性能回退。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+from utils.geo_utils import EARTH_RADIUS_METERS, haversine_distance
+
+# 合成路网的默认原点（成都，与 roadnetwork_download.py 中的 bbox 一致）
+DEFAULT_ORIGIN = (104.04, 30.655)
+
+
+def make_grid_network(rows: int = 30, cols: int = 30, spacing_meters: float = 200.0, subdivisions: int = 2,
+                      origin: tuple = DEFAULT_ORIGIN, jitter_meters: float = 10.0, seed: int = 0) -> tuple:
+    """
+    生成与 road_network_nodes.csv / road_network_edges.csv 结构相同的合成网格路网。
+
+    每两个相邻路口之间插入 subdivisions 个度为 2 的折线顶点（对应 simplify=False 导出的路网），
+    每条道路在两个方向上各有一条边（reversed 为 False / True），几何为两点的 LINESTRING。
+
+    参数:
+    - rows, cols (int): 路口网格的行数和列数。
+    - spacing_meters (float): 相邻路口的间距（米）。
+    - subdivisions (int): 相邻路口之间的中间节点数。
+    - origin (tuple): 网格左下角的 (经度, 纬度)。
+    - jitter_meters (float): 路口坐标的随机扰动（米），避免网格过于规则。
+    - seed (int): 随机种子。
+
+    返回:
+    - tuple: (nodes_df, edges_df)，列与 osmnx 导出的CSV一致（nodes_df 不设索引，'osmid' 为普通列）。
+    """
+    rng = np.random.default_rng(seed)
+    lon0, lat0 = origin
+    deg_lat = 180.0 / np.pi / EARTH_RADIUS_METERS
+    deg_lon = deg_lat / np.cos(np.radians(lat0))
+
+    # 1. 路口坐标（带扰动）
+    iy, ix = np.divmod(np.arange(rows * cols), cols)
+    junction_x = lon0 + (ix * spacing_meters + rng.normal(0, jitter_meters, rows * cols)) * deg_lon
+    junction_y = lat0 + (iy * spacing_meters + rng.normal(0, jitter_meters, rows * cols)) * deg_lat
+
+    # 2. 相邻路口对：水平方向和竖直方向
+    junction = np.arange(rows * cols).reshape(rows, cols)
+    pairs = np.concatenate([
+        np.stack([junction[:, :-1].ravel(), junction[:, 1:].ravel()], axis=1),
+        np.stack([junction[:-1, :].ravel(), junction[1:, :].ravel()], axis=1),
+    ])
+
+    # 3. 在每对路口之间等间距插入中间节点
+    n_junctions = rows * cols
+    frac = np.arange(1, subdivisions + 1) / (subdivisions + 1)
+    mid_x = junction_x[pairs[:, :1]] + frac * (junction_x[pairs[:, 1:]] - junction_x[pairs[:, :1]])
+    mid_y = junction_y[pairs[:, :1]] + frac * (junction_y[pairs[:, 1:]] - junction_y[pairs[:, :1]])
+    mid_ids = n_junctions + np.arange(len(pairs) * subdivisions).reshape(len(pairs), subdivisions)
+
+    node_x = np.concatenate([junction_x, mid_x.ravel()])
+    node_y = np.concatenate([junction_y, mid_y.ravel()])
+    # osmid 从一个较大的数开始，与真实 OSM 节点编号的量级相近
+    node_osmid = 1_000_000_000 + np.arange(len(node_x), dtype=np.int64)
+
+    # 4. 每条道路拆成 subdivisions + 1 段原始边
+    chain = np.concatenate([pairs[:, :1], mid_ids, pairs[:, 1:]], axis=1)
+    u = chain[:, :-1].ravel()
+    v = chain[:, 1:].ravel()
+    street = np.repeat(np.arange(len(pairs)), subdivisions + 1)
+    length = haversine_distance(node_x[u], node_y[u], node_x[v], node_y[v])
+
+    degree = np.bincount(np.concatenate([u, v]), minlength=len(node_x))
+    nodes_df = pd.DataFrame({
+        'osmid': node_osmid,
+        'y': node_y,
+        'x': node_x,
+        'street_count': degree,
+        'highway': None,
+        'railway': None,
+        'ref': None,
+        'geometry': [f'POINT ({x!r} {y!r})' for x, y in zip(node_x.tolist(), node_y.tolist())],
+    })
+
+    def edge_frame(a, b, reversed_flag):
+        return pd.DataFrame({
+            'u': node_osmid[a],
+            'v': node_osmid[b],
+            'key': 0,
+            'osmid': 500_000_000 + street,
+            'highway': np.where(street % 5 == 0, 'primary', 'residential'),
+            'oneway': False,
+            'reversed': reversed_flag,
+            'length': np.round(length, 3),
+            'name': [f'合成道路{s}' for s in street],
+            'geometry': [f'LINESTRING ({x0!r} {y0!r}, {x1!r} {y1!r})' for x0, y0, x1, y1 in
+                         zip(node_x[a].tolist(), node_y[a].tolist(), node_x[b].tolist(), node_y[b].tolist())],
+        })
+
+    edges_df = pd.concat([edge_frame(u, v, False), edge_frame(v, u, True)], ignore_index=True)
+    return nodes_df, edges_df
+
+
+def write_network_csv(nodes_df: pd.DataFrame, edges_df: pd.DataFrame, directory: str) -> tuple:
+    """
+    按 roadnetwork_download.py 的文件名和编码把合成路网写入 directory，返回两个文件路径。
+    """
+    os.makedirs(directory, exist_ok=True)
+    nodes_path = os.path.join(directory, 'road_network_nodes.csv')
+    edges_path = os.path.join(directory, 'road_network_edges.csv')
+    nodes_df.to_csv(nodes_path, index=False, encoding='utf-8-sig')
+    edges_df.to_csv(edges_path, index=False, encoding='utf-8-sig')
+    return nodes_path, edges_path
+
+
+def make_noisy_trajectories(nodes_df: pd.DataFrame, edges_df: pd.DataFrame, n_orders: int = 200,
+                            points_per_order: int = 60, interval_seconds: float = 3.0, speed_mps: float = 10.0,
+                            noise_meters: float = 8.0, start_time: int = 1538352000, seed: int = 0) -> pd.DataFrame:
+    """
+    在合成路网上生成带噪声的GPS轨迹。
+
+    每个订单从随机节点出发做不回头的随机游走，按 speed_mps 匀速行驶，每 interval_seconds 秒采样一次，
+    再叠加标准差为 noise_meters 的高斯噪声。
+
+    返回:
+    - pd.DataFrame: 列 ['driver_id', 'order_id', 'gps_time', 'longitude', 'latitude',
+      'true_longitude', 'true_latitude']，gps_time 为Unix时间戳（秒），按订单和时间排序。
+    """
+    rng = np.random.default_rng(seed)
+    osmid = nodes_df['osmid'].to_numpy()
+    node_x = nodes_df['x'].to_numpy()
+    node_y = nodes_df['y'].to_numpy()
+    index_of = pd.Series(np.arange(len(osmid)), index=osmid)
+
+    # CSR 邻接表
+    u = index_of[edges_df['u'].to_numpy()].to_numpy()
+    v = index_of[edges_df['v'].to_numpy()].to_numpy()
+    order = np.argsort(u, kind='stable')
+    neighbors = v[order]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(u, minlength=len(osmid)))))
+
+    deg_lat = 180.0 / np.pi / EARTH_RADIUS_METERS
+    deg_lon = deg_lat / np.cos(np.radians(node_y.mean()))
+    route_meters = points_per_order * interval_seconds * speed_mps
+    sample_offsets = np.arange(points_per_order) * interval_seconds * speed_mps
+
+    frames = []
+    for order_id in range(n_orders):
+        # 1. 随机游走直到路径长度足够
+        path = [int(rng.integers(len(osmid)))]
+        travelled = 0.0
+        while travelled < route_meters:
+            current = path[-1]
+            options = neighbors[indptr[current]:indptr[current + 1]]
+            if len(path) > 1 and len(options) > 1:
+                options = options[options != path[-2]]
+            nxt = int(options[rng.integers(len(options))])
+            travelled += float(haversine_distance(node_x[current], node_y[current], node_x[nxt], node_y[nxt]))
+            path.append(nxt)
+
+        # 2. 沿路径按累计距离插值得到采样点
+        path = np.array(path)
+        step = haversine_distance(node_x[path[:-1]], node_y[path[:-1]], node_x[path[1:]], node_y[path[1:]])
+        cumulative = np.concatenate(([0.0], np.cumsum(step)))
+        true_x = np.interp(sample_offsets, cumulative, node_x[path])
+        true_y = np.interp(sample_offsets, cumulative, node_y[path])
+
+        frames.append(pd.DataFrame({
+            'driver_id': f'driver_{order_id % max(n_orders // 3, 1)}',
+            'order_id': f'order_{order_id:06d}',
+            'gps_time': start_time + order_id * 7 + np.arange(points_per_order) * int(interval_seconds),
+            'longitude': true_x + rng.normal(0, noise_meters, points_per_order) * deg_lon,
+            'latitude': true_y + rng.normal(0, noise_meters, points_per_order) * deg_lat,
+            'true_longitude': true_x,
+            'true_latitude': true_y,
+        }))
+
+    return pd.concat(frames, ignore_index=True)
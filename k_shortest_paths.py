@@ -1,68 +1,80 @@
 import pandas as pd
+import numpy as np
 import networkx as nx
-from haversine import haversine, Unit
-import itertools
+from utils.geo_utils import haversine_distance, one_to_many_distances
+from utils.path_candidate_utils import PathCandidateService
+from utils.simplified_graph_utils import SimplifiedRoutingGraph
+from utils.instrument_utils import Stage
 
 NODE_FILE = 'road_network_nodes.csv'
 EDGE_FILE = 'road_network_edges.csv'
 
 # --- 2. 加载数据 ---
 print("正在加载CSV文件...")
-try:
-    nodes_df = pd.read_csv(NODE_FILE)
-    edges_df = pd.read_csv(EDGE_FILE)
-    print("文件加载成功。")
-    # 确保列名正确，如果你的列名不同，请在这里修改
-    # 例如: nodes_df.rename(columns={'id': 'node_id', 'longitude': 'lon', 'latitude': 'lat'}, inplace=True)
-except FileNotFoundError as e:
-    print(f"错误: {e}")
-    print("请确保CSV文件与脚本在同一目录下，或者提供完整路径。")
-    exit()
+with Stage('k_shortest_paths.load') as stage:
+    try:
+        nodes_df = pd.read_csv(NODE_FILE)
+        edges_df = pd.read_csv(EDGE_FILE)
+        print("文件加载成功。")
+        # 确保列名正确，如果你的列名不同，请在这里修改
+        # 例如: nodes_df.rename(columns={'id': 'node_id', 'longitude': 'lon', 'latitude': 'lat'}, inplace=True)
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        print("请确保CSV文件与脚本在同一目录下，或者提供完整路径。")
+        exit()
+
+    stage.rows_out = len(edges_df)
 
 # --- 3. 构建路网图 ---
 print("正在构建路网图...")
-G = nx.Graph()
-
-# 添加节点，并存储经纬度信息
-for _, row in nodes_df.iterrows():
-    G.add_node(row['osmid'], lon=row['x'], lat=row['y'])
-
-# 添加边，并设置权重
-if 'length' in edges_df.columns:
-    print("使用CSV中提供的 'length' 作为权重。")
-    for _, row in edges_df.iterrows():
-        G.add_edge(row['u'], row['v'], weight=row['length'])
-else:
-    # 如果edges.csv中没有length列，我们可以自己计算
-    print("警告: 'length' 列未在edges.csv中找到。")
-    print("正在根据节点坐标计算边的权重（直线距离）。")
-    node_coords = {row['node_id']: (row['lat'], row['lon']) for _, row in nodes_df.iterrows()}
-    for _, row in edges_df.iterrows():
-        try:
-            coord1 = node_coords[row['u']]
-            coord2 = node_coords[row['v']]
-            # 计算两点间的哈弗赛因距离（单位：米）
-            distance = haversine(coord1, coord2, unit=Unit.METERS)
-            G.add_edge(row['u'], row['v'], weight=distance)
-        except KeyError as e:
-            print(f"警告: 节点 {e} 在edges文件中存在，但在nodes文件中未找到。该边将被忽略。")
-
-
-print(f"图构建完成。节点数: {G.number_of_nodes()}, 边数: {G.number_of_edges()}")
+with Stage('k_shortest_paths.build_graph', rows_in=len(edges_df)) as stage:
+    G = nx.Graph()
+
+    # 添加节点，并存储经纬度信息
+    for _, row in nodes_df.iterrows():
+        G.add_node(row['osmid'], lon=row['x'], lat=row['y'])
+
+    # 添加边，并设置权重
+    if 'length' in edges_df.columns:
+        print("使用CSV中提供的 'length' 作为权重。")
+        for _, row in edges_df.iterrows():
+            G.add_edge(row['u'], row['v'], weight=row['length'], osmid=row['osmid'])
+    else:
+        # 如果edges.csv中没有length列，我们可以自己计算
+        print("警告: 'length' 列未在edges.csv中找到。")
+        print("正在根据节点坐标计算边的权重（直线距离）。")
+        node_coords = {row['node_id']: (row['lat'], row['lon']) for _, row in nodes_df.iterrows()}
+        for _, row in edges_df.iterrows():
+            try:
+                coord1 = node_coords[row['u']]
+                coord2 = node_coords[row['v']]
+                # 计算两点间的哈弗赛因距离（单位：米）
+                distance = float(haversine_distance(coord1[1], coord1[0], coord2[1], coord2[0]))
+                G.add_edge(row['u'], row['v'], weight=distance)
+            except KeyError as e:
+                print(f"警告: 节点 {e} 在edges文件中存在，但在nodes文件中未找到。该边将被忽略。")
+
+
+    print(f"图构建完成。节点数: {G.number_of_nodes()}, 边数: {G.number_of_edges()}")
+
+    # 折叠度为2的链状节点，得到拓扑简化的路由图；路由结果仍为原始节点序列
+    routing_graph = SimplifiedRoutingGraph(G, weight='weight')
+    print(f"简化路由图构建完成。节点数: {routing_graph.number_of_nodes()}, 边数: {routing_graph.number_of_edges()}")
+    stage.rows_out = routing_graph.number_of_edges()
 
 # --- 4. 寻找最近的节点 ---
 def find_nearest_node(graph, lat, lon):
     """
     在图中找到距离给定经纬度最近的节点
     """
-    min_dist = float('inf')
-    nearest_node = None
-    for node, data in graph.nodes(data=True):
-        dist = haversine((lat, lon), (data['lat'], data['lon']), unit=Unit.METERS)
-        if dist < min_dist:
-            min_dist = dist
-            nearest_node = node
-    return nearest_node
+    if graph.number_of_nodes() == 0:
+        return None
+    nodes = list(graph.nodes(data=True))
+    node_lon = np.array([data['lon'] for _, data in nodes])
+    node_lat = np.array([data['lat'] for _, data in nodes])
+    # 一次性计算到所有节点的距离，取最小值
+    distances = one_to_many_distances(lon, lat, node_lon, node_lat)
+    return nodes[int(np.argmin(distances))][0]
 
 
 # 你的两个经纬度坐标 (纬度, 经度)
@@ -85,8 +97,9 @@ elif start_node == end_node:
 else:
     print(f"\n正在计算从节点 {start_node} 到 {end_node} 的4条最短路径...")
     try:
-        paths_generator = nx.shortest_simple_paths(G, source=start_node, target=end_node, weight='weight')
-        k_shortest_paths = list(itertools.islice(paths_generator, 4))
+        # 路径候选服务会缓存 (起点节点, 终点节点) 的结果，可通过 store_path 持久化到磁盘供后续运行复用
+        path_service = PathCandidateService(routing_graph, k=4, weight='weight')
+        k_shortest_paths = [path for path, _ in path_service.get_paths(start_node, end_node)]
 
         # --- 6. 显示结果并准备保存数据 ---
         if not k_shortest_paths:
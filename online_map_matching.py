@@ -0,0 +1,98 @@
+import asyncio
+
+import pandas as pd
+
+from utils.shared_network_utils import SharedRoadNetwork
+from utils.online_matching_utils import OnlineMapMatcher, AsyncMatchingService, serve_ndjson, DECISION_FIELDS
+from utils.instrument_utils import Stage
+
+NODE_FILE = 'road_network_nodes.csv'
+EDGE_FILE = 'road_network_edges.csv'
+
+# 'replay'：把 REPLAY_CSV 按 gps_time 顺序回放为实时数据流；'server'：启动本地 NDJSON TCP 服务
+MODE = 'replay'
+REPLAY_CSV = 'filtered_orders.csv'
+OUTPUT_CSV = 'online_matched_points.csv'
+# 回放倍速：None 表示不等待，尽快推送所有点；例如 10 表示按GPS时间的 10 倍速推送
+REPLAY_SPEED = None
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# 匹配参数
+SEARCH_RADIUS_METERS = 50
+LAG_POINTS = 5
+IDLE_TIMEOUT_SECONDS = 60
+# 相邻两点之间允许的最大路网距离（米），超出视为不可达
+MAX_ROUTE_DISTANCE_METERS = 500
+
+
+async def replay(service: AsyncMatchingService, csv_path: str, speed: float = None) -> pd.DataFrame:
+    """
+    把历史轨迹按 gps_time 的先后顺序交错推送给在线匹配服务，模拟多个司机同时上报数据。
+    """
+    df = pd.read_csv(csv_path, usecols=['order_id', 'gps_time', 'longitude', 'latitude'])
+    # gps_time 可能是时间字符串或Unix时间戳（秒），统一换算成秒用于排序和按倍速等待，推送的点保留原始值
+    gps_time = df['gps_time']
+    if pd.api.types.is_numeric_dtype(gps_time):
+        gps_time = pd.to_datetime(gps_time, unit='s')
+    else:
+        gps_time = pd.to_datetime(gps_time)
+    df['_seconds'] = gps_time.to_numpy(dtype='datetime64[ns]').astype('int64') / 1e9
+    df = df.sort_values(by=['_seconds', 'order_id'], kind='stable').reset_index(drop=True)
+    print(f"正在回放 {len(df)} 个GPS点，共 {df['order_id'].nunique()} 个订单...")
+
+    results = []
+    service.add_listener(results.extend)
+    await service.start()
+
+    # 每个订单的最后一个点推送之后立即请求提交剩余结果
+    last_index = set(df.groupby('order_id').tail(1).index)
+    seconds = df.pop('_seconds').to_numpy()
+    previous_time = None
+    for index, point in enumerate(df.to_dict('records')):
+        if speed is not None and previous_time is not None and seconds[index] > previous_time:
+            await asyncio.sleep((seconds[index] - previous_time) / speed)
+        previous_time = seconds[index]
+        await service.submit(point)
+        if index in last_index:
+            await service.flush(point['order_id'])
+        if index % 1000 == 0:
+            await asyncio.sleep(0)
+
+    await service.stop()
+    return pd.DataFrame(results, columns=DECISION_FIELDS)
+
+
+async def run_server(service: AsyncMatchingService):
+    await service.start()
+    server = await serve_ndjson(service, HOST, PORT)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    network = SharedRoadNetwork.from_csv(NODE_FILE, EDGE_FILE)
+    matcher = OnlineMapMatcher(network, search_radius=SEARCH_RADIUS_METERS, lag=LAG_POINTS,
+                               idle_timeout=IDLE_TIMEOUT_SECONDS, max_route_distance=MAX_ROUTE_DISTANCE_METERS)
+    service = AsyncMatchingService(matcher)
+
+    if MODE == 'server':
+        try:
+            asyncio.run(run_server(service))
+        except KeyboardInterrupt:
+            print("服务已停止。")
+        return
+
+    with Stage('online_map_matching.replay') as stage:
+        results_df = asyncio.run(replay(service, REPLAY_CSV, REPLAY_SPEED))
+        stage.rows_out = len(results_df)
+    results_df.to_csv(OUTPUT_CSV, index=False, encoding='utf-8')
+    stats = matcher.stats()
+    print(f"匹配完成，共提交 {stats['points_committed']} 个点，结果已保存到 {OUTPUT_CSV}")
+    print(f"未匹配的点: {int(results_df['osmid'].isna().sum())}")
+    print(f"单点延迟（毫秒）: P50 = {stats['p50']:.2f}, P90 = {stats['p90']:.2f}, P99 = {stats['p99']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
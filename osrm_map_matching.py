@@ -3,6 +3,9 @@ import requests
 import json
 import math
 
+from utils.region_scheduler_utils import run_region_scheduler
+from utils.instrument_utils import Stage
+
 def read_trajectory_data(csv_path):
     """
     从 CSV 文件中读取轨迹数据。
@@ -48,6 +51,70 @@ def osrm_map_matching(trajectory_df, osrm_url="http://localhost:5000"):
         return None
 
 
+def match_single_order(order_id, trajectory_df, chunk_size=95, osrm_url="http://localhost:5000"):
+    """
+    对单个订单分块调用 OSRM 匹配，并将匹配几何分解为每个点一行的结果。
+    匹配失败时返回空列表。
+    """
+    print(f"--- 正在处理订单: {order_id} (共 {len(trajectory_df)} 个点) ---")
+
+    all_matchings_for_order = []
+    num_chunks = math.ceil(len(trajectory_df) / chunk_size)
+
+    for i in range(num_chunks):
+        start_index = i * chunk_size
+        end_index = (i + 1) * chunk_size
+        chunk_df = trajectory_df.iloc[start_index:end_index]  # 使用 iloc 进行分块 [12]
+
+        match_result = osrm_map_matching(chunk_df, osrm_url)
+
+        if match_result and match_result.get('code') == 'Ok':
+            all_matchings_for_order.extend(match_result.get('matchings', []))
+        else:
+            print(f"  块 {i + 1} 地图匹配失败。")
+
+    points_rows = []
+
+    # 4. *** 修改：分解几何路径并为每个点创建行 ***
+    if all_matchings_for_order:
+        # 首先，计算整个订单的聚合信息
+        total_distance = sum(m.get('distance', 0) for m in all_matchings_for_order)
+        total_duration = sum(m.get('duration', 0) for m in all_matchings_for_order)
+        average_confidence = sum(m.get('confidence', 0) for m in all_matchings_for_order) / len(
+            all_matchings_for_order)
+
+        # 获取 driver_id (对于同一个订单，driver_id 应该是相同的)
+        driver_id = trajectory_df['driver_id'].iloc[0]
+
+        point_sequence = 0  # 用于标记点在路径中的顺序
+
+        # 遍历每个匹配分段
+        for matching in all_matchings_for_order:
+            geometry = matching.get('geometry')
+            if geometry and 'coordinates' in geometry:
+                # 遍历该分段几何路径中的每一个坐标点
+                for coord in geometry['coordinates']:
+                    point_row = {
+                        'order_id': order_id,
+                        'driver_id': driver_id,
+                        'matched_longitude': coord[0],
+                        'matched_latitude': coord[1],
+                        'point_sequence': point_sequence,
+                        'total_order_distance_m': round(total_distance, 2),
+                        'total_order_duration_s': round(total_duration, 2),
+                        'order_avg_confidence': round(average_confidence, 4)
+                    }
+                    points_rows.append(point_row)
+                    point_sequence += 1
+
+        print(f"订单 {order_id} 匹配成功，生成了 {point_sequence} 个匹配点。")
+
+    else:
+        print(f"订单 {order_id} 未能成功进行地图匹配，将不会写入文件。")
+
+    return points_rows
+
+
 def main():
     """
     主函数，执行读取、分块匹配，并将结果以每个点一行的格式保存到 CSV。
@@ -55,81 +122,39 @@ def main():
     input_csv_path = 'filtered_orders.csv'
     output_csv_path = 'matched_points_for_qgis.csv'  # 新的输出文件名
 
-    CHUNK_SIZE = 95
+    # 并行进程数；大于 1 时按空间瓦片划分订单，由区域调度器分配给各进程
+    NUM_WORKERS = 1
+    TILE_SIZE_DEG = 0.02
 
-
-
-    trajectories = read_trajectory_data(input_csv_path)
+    with Stage('osrm_map_matching.read') as stage:
+        trajectories = read_trajectory_data(input_csv_path)
+        stage.rows_out = 0 if trajectories is None else len(trajectories)
     if trajectories is None:
         return
 
-    orders = trajectories.groupby('order_id')
-
-    # *** 新增：用于存储所有匹配点的行数据的列表 ***
-    all_points_rows = []
-
-    for order_id, trajectory_df in orders:
-        print(f"--- 正在处理订单: {order_id} (共 {len(trajectory_df)} 个点) ---")
-
-        all_matchings_for_order = []
-        num_chunks = math.ceil(len(trajectory_df) / CHUNK_SIZE)
-
-        for i in range(num_chunks):
-            start_index = i * CHUNK_SIZE
-            end_index = (i + 1) * CHUNK_SIZE
-            chunk_df = trajectory_df.iloc[start_index:end_index]  # 使用 iloc 进行分块 [12]
-
-            match_result = osrm_map_matching(chunk_df)
-
-            if match_result and match_result.get('code') == 'Ok':
-                all_matchings_for_order.extend(match_result.get('matchings', []))
-            else:
-                print(f"  块 {i + 1} 地图匹配失败。")
-
-        # 4. *** 修改：分解几何路径并为每个点创建行 ***
-        if all_matchings_for_order:
-            # 首先，计算整个订单的聚合信息
-            total_distance = sum(m.get('distance', 0) for m in all_matchings_for_order)
-            total_duration = sum(m.get('duration', 0) for m in all_matchings_for_order)
-            average_confidence = sum(m.get('confidence', 0) for m in all_matchings_for_order) / len(
-                all_matchings_for_order)
-
-            # 获取 driver_id (对于同一个订单，driver_id 应该是相同的)
-            driver_id = trajectory_df['driver_id'].iloc[0]
-
-            point_sequence = 0  # 用于标记点在路径中的顺序
-
-            # 遍历每个匹配分段
-            for matching in all_matchings_for_order:
-                geometry = matching.get('geometry')
-                if geometry and 'coordinates' in geometry:
-                    # 遍历该分段几何路径中的每一个坐标点
-                    for coord in geometry['coordinates']:
-                        point_row = {
-                            'order_id': order_id,
-                            'driver_id': driver_id,
-                            'matched_longitude': coord[0],
-                            'matched_latitude': coord[1],
-                            'point_sequence': point_sequence,
-                            'total_order_distance_m': round(total_distance, 2),
-                            'total_order_duration_s': round(total_duration, 2),
-                            'order_avg_confidence': round(average_confidence, 4)
-                        }
-                        all_points_rows.append(point_row)
-                        point_sequence += 1
-
-            print(f"订单 {order_id} 匹配成功，生成了 {point_sequence} 个匹配点。")
-
+    with Stage('osrm_map_matching.match', rows_in=len(trajectories),
+               extra={'num_workers': NUM_WORKERS}) as match_stage:
+        if NUM_WORKERS > 1:
+            results_df, _, _ = run_region_scheduler(trajectories, match_single_order, tile_size_deg=TILE_SIZE_DEG,
+                                                    max_workers=NUM_WORKERS)
+            all_points_rows = results_df.to_dict('records')
         else:
-            print(f"订单 {order_id} 未能成功进行地图匹配，将不会写入文件。")
+            orders = trajectories.groupby('order_id')
+
+            # *** 新增：用于存储所有匹配点的行数据的列表 ***
+            all_points_rows = []
 
-        print("\n" + "=" * 40 + "\n")
+            for order_id, trajectory_df in orders:
+                all_points_rows.extend(match_single_order(order_id, trajectory_df))
+                print("\n" + "=" * 40 + "\n")
+        match_stage.rows_out = len(all_points_rows)
 
     # 5. *** 修改：将所有点的数据保存到 CSV 文件 ***
     if all_points_rows:
         print(f"正在将 {len(all_points_rows)} 个匹配点保存到 {output_csv_path}...")
-        results_df = pd.DataFrame(all_points_rows)
-        results_df.to_csv(output_csv_path, index=False, encoding='utf-8')
+        with Stage('osrm_map_matching.save', rows_in=len(all_points_rows)):
+            results_df = pd.DataFrame(all_points_rows)
+            results_df.to_csv(output_csv_path, index=False, encoding='utf-8')
         print("文件保存成功！")
     else:
         print("没有可供保存的匹配点。")
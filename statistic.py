@@ -1,4 +1,6 @@
 import pandas as pd
+from utils.streaming_stats_utils import summarize_gps_file, flag_outliers_streaming
+from utils.instrument_utils import Stage
 
 
 def analyze_gps_data(file_path):
@@ -125,9 +127,80 @@ def analyze_gps_data(file_path):
         return None
 
 
+def analyze_gps_data_streaming(file_path, chunksize=100000):
+    """
+    analyze_gps_data 的流式版本：单次分块遍历得到统计摘要，第二次遍历筛选异常值。
+
+    内存中只保留可合并的摘要（计数、边界、每个订单的间隔统计、经纬度的 t-digest 草图），
+    IQR 边界由草图估计的四分位数给出。返回的字典与 analyze_gps_data 相同。
+
+    参数:
+    file_path (str): CSV文件的路径。
+    chunksize (int): 分块读取的行数。
+
+    返回:
+    dict: 包含分析结果的字典。
+    """
+    try:
+        # 1. 第一遍：流式统计
+        print("--- 数据基本特性分析（流式） ---")
+        summary = summarize_gps_file(file_path, chunksize=chunksize)
+
+        num_drivers = len(summary.driver_ids)
+        num_orders = len(summary.order_ids)
+        time_range = (summary.time_min, summary.time_max)
+
+        print(f"总行数: {summary.num_rows}")
+        print(f"\n司机数量: {num_drivers}")
+        print(f"订单数量: {num_orders}")
+        print(f"GPS时间范围: 从 {time_range[0]} 到 {time_range[1]}")
+
+        # 2. 经纬度边界
+        bounding_box = summary.bounding_box()
+        print("\n--- 矩形边界的四个经纬度点 ---")
+        print(bounding_box)
+
+        # 3. 每个订单的GPS采样间隔
+        print("\n--- 每个订单GPS采样间隔分析 ---")
+        sampling_interval_stats = summary.sampling_interval_stats()
+        print("每个订单GPS采样间隔统计（单位：秒）:")
+        print(sampling_interval_stats.head())
+
+        print("\n所有订单采样间隔的总体描述性统计（单位：秒）:")
+        print(sampling_interval_stats.describe())
+
+        # 4. 第二遍：按近似IQR边界流式筛选异常值
+        print(f"\n--- 异常数据集识别 ---")
+        bounds = summary.iqr_bounds(factor=1.5)
+        outliers = flag_outliers_streaming(file_path, bounds, chunksize=chunksize)
+
+        print(f"根据IQR方法，共发现 {len(outliers)} 个潜在的异常数据点。")
+        if not outliers.empty:
+            print("异常数据示例:")
+            print(outliers.head())
+
+        return {
+            "num_drivers": num_drivers,
+            "num_orders": num_orders,
+            "time_range": time_range,
+            "bounding_box": bounding_box,
+            "sampling_interval_stats": sampling_interval_stats,
+            "outliers": outliers
+        }
+
+    except FileNotFoundError:
+        print(f"错误: 文件未找到，请检查文件路径 '{file_path}'。")
+        return None
+    except Exception as e:
+        print(f"发生错误: {e}")
+        return None
+
 
 file_path = 'filtered_orders.csv'
-results = analyze_gps_data(file_path)
+with Stage('statistic.analyze_gps_data_streaming') as stage:
+    results = analyze_gps_data_streaming(file_path)
+    if results:
+        stage.rows_out = len(results['outliers'])
 
 # 您可以接下来使用 'results' 字典中的数据进行进一步的处理和分析
 if results:
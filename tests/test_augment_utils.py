@@ -0,0 +1,38 @@
+import pandas as pd
+
+from benchmarks.synthetic_data import make_grid_network, make_noisy_trajectories
+from utils.augment_utils import iter_augmented_batches
+
+
+def _collect(df, orders_per_batch):
+    grid = {}
+    for params, batch_df in iter_augmented_batches(df, noise_levels=(5, 20), rules=(None, '10s'), seeds=(0, 1),
+                                                   orders_per_batch=orders_per_batch):
+        grid.setdefault((params['noise_level'], params['rule'], params['seed']), []).append(batch_df)
+    return {key: pd.concat(frames) for key, frames in grid.items()}
+
+
+def test_noise_does_not_depend_on_batch_size():
+    nodes_df, edges_df = make_grid_network(rows=6, cols=6)
+    df = make_noisy_trajectories(nodes_df, edges_df, n_orders=25, points_per_order=20)
+    df['gps_time'] = pd.to_datetime(df['gps_time'], unit='s')
+
+    reference = _collect(df, orders_per_batch=2000)
+    for orders_per_batch in (1, 7):
+        grid = _collect(df, orders_per_batch)
+        for key, frame in reference.items():
+            pd.testing.assert_frame_equal(grid[key], frame)
+
+
+def test_noise_does_not_depend_on_other_orders():
+    nodes_df, edges_df = make_grid_network(rows=6, cols=6)
+    df = make_noisy_trajectories(nodes_df, edges_df, n_orders=25, points_per_order=20)
+    df['gps_time'] = pd.to_datetime(df['gps_time'], unit='s')
+
+    reference = _collect(df, orders_per_batch=7)
+    kept = df['order_id'].drop_duplicates().iloc[3::4]
+    subset = _collect(df[df['order_id'].isin(kept)], orders_per_batch=7)
+    for key, frame in subset.items():
+        expected = reference[key]
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True),
+                                      expected[expected['order_id'].isin(kept)].reset_index(drop=True))
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from utils.filter_data_utils import detect_gps_loops, filter_orders_by_loops
+from utils.geo_utils import EARTH_RADIUS_METERS
+
+DEG_LAT = 180.0 / np.pi / EARTH_RADIUS_METERS
+DEG_LON = DEG_LAT / np.cos(np.radians(30.66))
+
+
+def _trajectory(order_id, x, y):
+    return pd.DataFrame({
+        'order_id': order_id,
+        'gps_time': pd.Timestamp('2016-11-01') + pd.to_timedelta(np.arange(len(x)) * 3, unit='s'),
+        'longitude': 104.05 + x * DEG_LON,
+        'latitude': 30.66 + y * DEG_LAT,
+    })
+
+
+def _stop_with_jitter(order_id, seed, n_drive=70, n_stop=10, step_meters=30.0, jitter_meters=6.0):
+    """
+    匀速直行的订单，中途等红灯停留 n_stop 个点，所有点带有 jitter_meters 的GPS抖动。
+    """
+    rng = np.random.default_rng(seed)
+    half = n_drive // 2
+    along = np.r_[np.arange(half) * step_meters, np.full(n_stop, half * step_meters),
+                  np.arange(half, n_drive) * step_meters]
+    return _trajectory(order_id, along + rng.normal(0, jitter_meters, len(along)),
+                       rng.normal(0, jitter_meters, len(along)))
+
+
+def test_stop_with_jitter_is_not_a_loop():
+    df = pd.concat([_stop_with_jitter(f'order_{seed}', seed) for seed in range(20)], ignore_index=True)
+
+    assert not detect_gps_loops(df)['is_loop'].any()
+    assert filter_orders_by_loops(df, max_loop_points=0)['order_id'].nunique() == 20
+
+
+def test_backtracking_spike_is_still_detected():
+    x = np.arange(60) * 30.0
+    x[30] -= 60
+    flags = detect_gps_loops(_trajectory('order_spike', x, np.zeros(60)))
+
+    assert flags['is_reversal'].iloc[29:31].all()
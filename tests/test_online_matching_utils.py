@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_grid_network, make_noisy_trajectories
+from online_map_matching import replay
+from utils.online_matching_utils import OnlineMapMatcher, AsyncMatchingService, serve_ndjson
+from utils.shared_network_utils import SharedRoadNetwork
+
+
+def _make_service():
+    nodes_df, edges_df = make_grid_network(rows=8, cols=8)
+    network = SharedRoadNetwork.from_dataframes(nodes_df, edges_df)
+    return AsyncMatchingService(OnlineMapMatcher(network)), nodes_df, edges_df
+
+
+def test_replay_outputs_every_submitted_point(tmp_path):
+    service, nodes_df, edges_df = _make_service()
+    trajectories = make_noisy_trajectories(nodes_df, edges_df, n_orders=7, points_per_order=360)
+    csv_path = tmp_path / 'replay.csv'
+    trajectories.to_csv(csv_path, index=False)
+
+    results_df = asyncio.run(asyncio.wait_for(replay(service, str(csv_path)), timeout=60))
+
+    assert len(results_df) == len(trajectories)
+    expected = trajectories.set_index(['order_id', 'gps_time']).index
+    assert set(results_df.set_index(['order_id', 'gps_time']).index) == set(expected)
+
+
+def test_stop_processes_points_still_being_batched():
+    service, nodes_df, _ = _make_service()
+    results = []
+    service.add_listener(results.extend)
+
+    async def run():
+        await service.start()
+        await service.submit({'order_id': 'a', 'gps_time': 0,
+                              'longitude': nodes_df['x'].iloc[0], 'latitude': nodes_df['y'].iloc[0]})
+        await asyncio.sleep(0.01)
+        await service.submit({'order_id': 'a', 'gps_time': 3,
+                              'longitude': nodes_df['x'].iloc[1], 'latitude': nodes_df['y'].iloc[1]})
+        await service.stop()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert pd.DataFrame(results)['gps_time'].tolist() == [0, 3]
+
+
+def test_paced_replay_accepts_datetime_strings(tmp_path):
+    service, nodes_df, edges_df = _make_service()
+    trajectories = make_noisy_trajectories(nodes_df, edges_df, n_orders=3, points_per_order=20)
+    trajectories['gps_time'] = pd.to_datetime(trajectories['gps_time'], unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
+    csv_path = tmp_path / 'replay.csv'
+    trajectories.to_csv(csv_path, index=False)
+
+    results_df = asyncio.run(asyncio.wait_for(replay(service, str(csv_path), speed=1000), timeout=60))
+
+    assert len(results_df) == len(trajectories)
+
+
+def test_transition_does_not_jump_between_unconnected_parallel_roads():
+    # 两条相距 30 米、互不连通的平行道路，GPS点交替偏向两条道路
+    lon = 104.05 + np.arange(11) * 0.001
+    nodes_df = pd.DataFrame({'osmid': np.arange(22), 'x': np.r_[lon, lon],
+                             'y': np.r_[np.full(11, 30.66), np.full(11, 30.66 + 30 / 111132.0)]})
+    u = np.r_[np.arange(10), np.arange(11, 21)]
+    edges_df = pd.DataFrame({'u': np.r_[u, u + 1], 'v': np.r_[u + 1, u],
+                             'osmid': np.r_[np.full(10, 1), np.full(10, 2), np.full(10, 1), np.full(10, 2)]})
+    matcher = OnlineMapMatcher(SharedRoadNetwork.from_dataframes(nodes_df, edges_df), search_radius=40)
+
+    offsets = np.where(np.arange(30) % 2 == 0, 10.0, 17.0) / 111132.0
+    records = [{'order_id': 'a', 'gps_time': i, 'longitude': 104.0505 + i * 0.0003, 'latitude': 30.66 + offsets[i]}
+               for i in range(30)]
+    decisions = matcher.add_points(records) + matcher.flush()
+
+    assert len(decisions) == 30
+    assert len({decision['osmid'] for decision in decisions}) == 1
+
+
+def test_server_rejects_invalid_points_without_dropping_the_connection():
+    service, nodes_df, _ = _make_service()
+    point = {'order_id': 'a', 'gps_time': 0, 'longitude': float(nodes_df['x'].iloc[0]),
+             'latitude': float(nodes_df['y'].iloc[0])}
+
+    async def run():
+        await service.start()
+        server = await serve_ndjson(service, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for message in [{'gps_time': 0, 'longitude': 104.0, 'latitude': 30.6},
+                        {'order_id': 'b', 'longitude': 'x', 'latitude': 30.6},
+                        [1, 2], point, {'type': 'flush', 'order_id': 'a'}]:
+            writer.write((json.dumps(message) + '\n').encode('utf-8'))
+        await writer.drain()
+        replies = [json.loads(await reader.readline()) for _ in range(4)]
+        writer.close()
+        server.close()
+        await service.stop()
+        return replies
+
+    replies = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert [reply.get('error') for reply in replies[:3]] == [
+        'missing fields', 'longitude and latitude must be numbers', 'message must be a json object']
+    assert replies[3]['order_id'] == 'a'
@@ -0,0 +1,45 @@
+import networkx as nx
+import numpy as np
+
+from utils.geo_utils import one_to_many_distances
+from utils.path_candidate_utils import NodeSnapper, PathCandidateService
+
+
+def test_snap_matches_brute_force():
+    rng = np.random.default_rng(0)
+    node_lon = 104.0 + rng.random(500) * 0.05
+    node_lat = 30.6 + rng.random(500) * 0.05
+    snapper = NodeSnapper(np.arange(500) + 1000, node_lon, node_lat, cell_size_meters=100)
+
+    # 点分布在很多网格单元中，部分落在路网范围之外
+    lon = 103.99 + rng.random(3000) * 0.07
+    lat = 30.59 + rng.random(3000) * 0.07
+    node_ids, distance = snapper.snap(lon, lat)
+
+    for i in range(len(lon)):
+        expected = one_to_many_distances(lon[i], lat[i], node_lon, node_lat)
+        # 局部平面近似与球面距离之间只有亚米级差异
+        assert abs(distance[i] - expected.min()) < 0.5
+        assert expected[node_ids[i] - 1000] - expected.min() < 0.5
+
+
+def test_store_accepts_numpy_node_ids(tmp_path):
+    graph = nx.Graph()
+    node_ids = np.arange(10, 15, dtype=np.int64)
+    for u, v in zip(node_ids[:-1], node_ids[1:]):
+        graph.add_edge(u, v, weight=100.0)
+    graph.add_edge(node_ids[0], node_ids[-1], weight=500.0)
+    store_path = str(tmp_path / 'paths.sqlite')
+
+    service = PathCandidateService(graph, k=2, store_path=store_path)
+    paths = service.get_paths(node_ids[4], node_ids[1])
+    assert [length for _, length in paths] == [300.0, 600.0]
+    # numpy 标量与 Python 整数查询的是同一条缓存记录
+    assert service.get_paths(14, 11) == paths
+    assert service.stats()['memory_hits'] == 1
+    service.close()
+
+    reopened = PathCandidateService(graph, k=2, store_path=store_path)
+    assert reopened.get_paths(node_ids[1], node_ids[4]) == [(path[::-1], length) for path, length in paths]
+    assert reopened.stats()['store_hits'] == 1
+    reopened.close()
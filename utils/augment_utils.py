@@ -0,0 +1,162 @@
+import hashlib
+import os
+
+import pandas as pd
+import numpy as np
+
+from utils.downsample_utils import compute_downsample_masks
+
+# 米和度之间的转换常数（与 add_gps_noise 保持一致）
+METERS_PER_DEGREE_LAT = 111132.0
+METERS_PER_DEGREE_LON_AT_EQUATOR = 111320.0
+
+
+def _prepare_base_arrays(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    将输入数据按 (order_id, gps_time) 排序一次，作为所有增强组合共享的基础数据。
+    """
+    required_columns = ['order_id', 'gps_time', 'longitude', 'latitude']
+    if not all(col in df.columns for col in required_columns):
+        raise KeyError(f"输入DataFrame中缺少必需的列。需要 {required_columns}。")
+
+    data = df.copy()
+    if not pd.api.types.is_datetime64_any_dtype(data['gps_time']):
+        data['gps_time'] = pd.to_datetime(data['gps_time'])
+    return data.sort_values(by=['order_id', 'gps_time'], kind='stable').reset_index(drop=True)
+
+
+def _order_seed_keys(order_ids) -> list:
+    """
+    将每个订单ID映射为稳定的 64 位整数，作为该订单随机数生成器的种子分量。
+
+    使用 blake2b 而不是内置 hash()：后者对字符串加盐，每次运行结果不同。
+    """
+    return [int.from_bytes(hashlib.blake2b(str(order_id).encode('utf-8'), digest_size=8).digest(), 'little')
+            for order_id in order_ids]
+
+
+def iter_augmented_batches(df: pd.DataFrame, noise_levels=(5, 10, 20, 50), rules=(None, '5s', '10s', '20s', '60s'),
+                           seeds=(0,), orders_per_batch: int = 2000):
+    """
+    按订单分块，惰性地生成 (噪声水平 × 降采样频率 × 随机种子) 网格上的增强数据。
+
+    基础数据只排序一次，降采样掩码一次性算好，经纬度换算系数也只计算一次；
+    对每个种子，每个订单只生成一次标准正态噪声，再按噪声水平缩放、按降采样掩码取子集，
+    因此不会为每个组合复制整份数据。
+    每个订单的噪声由 np.random.default_rng([seed, 订单ID的哈希]) 生成，只取决于种子和订单ID，
+    与遍历顺序、orders_per_batch 以及输入中包含哪些其他订单都无关，可完全复现；
+    同一个点在不同降采样频率下得到的噪声相同。
+
+    参数:
+    - df (pd.DataFrame): 包含GPS数据的DataFrame。
+      必须包含列: ['order_id', 'gps_time', 'longitude', 'latitude']。
+    - noise_levels (list): 噪声标准差列表（单位：米），0 表示不加噪声。
+    - rules (list): 降采样规则列表，None 表示保留原始采样频率。
+    - seeds (list): 随机种子列表。
+    - orders_per_batch (int): 每个批次包含的订单数，默认为 2000。
+
+    返回:
+    - generator: 逐个产出 (params, batch_df)。params 为包含
+      'noise_level'、'rule'、'seed'、'batch_index' 的字典；
+      batch_df 为该订单块在此组合下的增强数据，列与输入一致。
+    """
+    if orders_per_batch < 1:
+        raise ValueError("orders_per_batch 必须大于等于1。")
+
+    data = _prepare_base_arrays(df)
+    n = len(data)
+    if n == 0:
+        return
+
+    rules = list(rules)
+    base_lon = data['longitude'].to_numpy(dtype=np.float64)
+    base_lat = data['latitude'].to_numpy(dtype=np.float64)
+
+    # 1. 共享的降采样掩码（None 表示保留全部点）
+    timed_rules = [rule for rule in rules if rule is not None]
+    order_ids = data['order_id'].to_numpy()
+    times_ns = data['gps_time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    timed_masks = compute_downsample_masks(order_ids, times_ns, timed_rules)
+    rule_masks = {}
+    for rule in rules:
+        rule_masks[rule] = np.ones(n, dtype=bool) if rule is None else timed_masks[:, timed_rules.index(rule)]
+
+    # 2. 共享的米->度换算系数
+    lat_scale = 1.0 / METERS_PER_DEGREE_LAT
+    lon_scale = 1.0 / (METERS_PER_DEGREE_LON_AT_EQUATOR * np.cos(np.radians(base_lat)))
+
+    # 3. 订单和订单块的行区间
+    order_starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    order_ends = np.append(order_starts[1:], n)
+    order_keys = _order_seed_keys(order_ids[order_starts])
+    batch_starts = order_starts[::orders_per_batch]
+    batch_ends = np.append(batch_starts[1:], n)
+
+    for batch_index, (start, end) in enumerate(zip(batch_starts, batch_ends)):
+        batch_orders = range(batch_index * orders_per_batch,
+                             min((batch_index + 1) * orders_per_batch, len(order_starts)))
+        for seed in seeds:
+            # 按订单生成噪声，使同一订单的噪声不随分块方式和输入子集变化
+            gaussian = np.empty((end - start, 2))
+            for order_position in batch_orders:
+                lo, hi = order_starts[order_position] - start, order_ends[order_position] - start
+                rng = np.random.default_rng([seed, order_keys[order_position]])
+                gaussian[lo:hi] = rng.standard_normal(size=(hi - lo, 2))
+
+            for rule in rules:
+                rows = np.flatnonzero(rule_masks[rule][start:end])
+                base_batch = data.iloc[start + rows]
+                lat_unit = gaussian[rows, 0] * lat_scale
+                lon_unit = gaussian[rows, 1] * lon_scale[start + rows]
+
+                for noise_level in noise_levels:
+                    batch_df = base_batch.assign(
+                        longitude=base_lon[start + rows] + lon_unit * noise_level,
+                        latitude=base_lat[start + rows] + lat_unit * noise_level
+                    )
+                    params = {
+                        'noise_level': noise_level,
+                        'rule': rule,
+                        'seed': seed,
+                        'batch_index': batch_index,
+                    }
+                    yield params, batch_df
+
+
+def write_augmentation_grid(df: pd.DataFrame, output_dir: str, noise_levels=(5, 10, 20, 50),
+                            rules=(None, '5s', '10s', '20s', '60s'), seeds=(0,), orders_per_batch: int = 2000) -> list:
+    """
+    将增强网格按分区目录写出为 Parquet 列式文件。
+
+    目录结构为 output_dir/noise=<噪声>/rate=<频率>/seed=<种子>/part-<块序号>.parquet，
+    可被 pandas.read_parquet / pyarrow.dataset 直接按分区读取。需要安装 pyarrow。
+
+    参数:
+    - df (pd.DataFrame): 输入GPS数据，要求同 iter_augmented_batches。
+    - output_dir (str): 输出根目录。
+    - 其余参数同 iter_augmented_batches。
+
+    返回:
+    - list: 写出的文件路径列表。
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("写出Parquet文件需要安装 pyarrow：pip install pyarrow") from e
+
+    written_files = []
+    for params, batch_df in iter_augmented_batches(df, noise_levels, rules, seeds, orders_per_batch):
+        rate = 'raw' if params['rule'] is None else params['rule']
+        partition_dir = os.path.join(
+            output_dir,
+            f"noise={params['noise_level']}",
+            f"rate={rate}",
+            f"seed={params['seed']}"
+        )
+        os.makedirs(partition_dir, exist_ok=True)
+        file_path = os.path.join(partition_dir, f"part-{params['batch_index']:05d}.parquet")
+        batch_df.to_parquet(file_path, index=False)
+        written_files.append(file_path)
+
+    print(f"增强数据已写出 {len(written_files)} 个分区文件到: {output_dir}")
+    return written_files
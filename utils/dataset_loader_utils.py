@@ -0,0 +1,284 @@
+import ast
+import json
+import os
+import queue
+import threading
+
+import pandas as pd
+import numpy as np
+
+from utils.geo_utils import EARTH_RADIUS_METERS
+
+# 缓存目录中各数组的文件名
+CACHE_ARRAYS = ['order_offsets', 'longitude', 'latitude', 'time_s', 'candidate_ids', 'labels']
+VOCAB_FILE = 'osmid_vocab.json'
+META_FILE = 'meta.json'
+
+
+def _parse_osmid_list(value) -> list:
+    """
+    将CSV中的候选路段列（如 "[123, 456]"）解析为字符串列表。
+    """
+    if isinstance(value, list):
+        items = value
+    elif isinstance(value, str) and value.strip():
+        try:
+            items = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            items = [value]
+    else:
+        return []
+    if not isinstance(items, (list, tuple)):
+        items = [items]
+    return [str(item) for item in items]
+
+
+def build_window_cache(csv_path: str, cache_dir: str, max_candidates: int = 16, chunksize: int = 200000) -> dict:
+    """
+    将 map_matching_dataset.csv 一次性解析为可内存映射的 NumPy 数组缓存。
+
+    CSV 中的候选路段列表只在这里解析一次；路段 osmid 被编码为整数ID（词表保存为 JSON），
+    所有点按 (order_id, gps_time) 排序后保存为 .npy 文件，训练时通过 np.load(mmap_mode='r')
+    直接映射，不再重复解析CSV。
+
+    参数:
+    - csv_path (str): 数据集CSV路径，必须包含列
+      ['order_id', 'gps_time', 'longitude', 'latitude', 'ture_candidate_osmid', 'candidate_roads_osmid']。
+    - cache_dir (str): 缓存输出目录。
+    - max_candidates (int): 每个点最多保留的候选路段数，多余的截断，不足的用 -1 填充。
+    - chunksize (int): 分块读取CSV的行数。
+
+    返回:
+    - dict: 缓存的元信息（点数、订单数、词表大小等）。
+    """
+    required_columns = ['order_id', 'gps_time', 'longitude', 'latitude',
+                        'ture_candidate_osmid', 'candidate_roads_osmid']
+
+    vocab = {}
+    order_codes = {}
+    parts = {'order': [], 'time': [], 'lon': [], 'lat': [], 'cand': [], 'label': []}
+
+    print(f"正在解析数据集: {csv_path}")
+    for chunk in pd.read_csv(csv_path, usecols=required_columns, chunksize=chunksize):
+        n = len(chunk)
+        candidate_ids = np.full((n, max_candidates), -1, dtype=np.int32)
+        labels = np.full(n, -1, dtype=np.int16)
+
+        true_osmids = chunk['ture_candidate_osmid'].astype(str).to_numpy()
+        for i, raw in enumerate(chunk['candidate_roads_osmid'].to_numpy()):
+            candidates = _parse_osmid_list(raw)[:max_candidates]
+            for j, osmid in enumerate(candidates):
+                code = vocab.setdefault(osmid, len(vocab))
+                candidate_ids[i, j] = code
+                if osmid == true_osmids[i] and labels[i] < 0:
+                    labels[i] = j
+
+        parts['order'].append(np.array([order_codes.setdefault(o, len(order_codes)) for o in chunk['order_id']],
+                                       dtype=np.int64))
+        parts['time'].append(pd.to_datetime(chunk['gps_time']).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9)
+        parts['lon'].append(chunk['longitude'].to_numpy(dtype=np.float64))
+        parts['lat'].append(chunk['latitude'].to_numpy(dtype=np.float64))
+        parts['cand'].append(candidate_ids)
+        parts['label'].append(labels)
+
+    order = np.concatenate(parts['order']) if parts['order'] else np.zeros(0, dtype=np.int64)
+    time_s = np.concatenate(parts['time']) if parts['time'] else np.zeros(0)
+
+    # 按订单、时间排序，并生成订单的 CSR 偏移量
+    sort_idx = np.lexsort((time_s, order))
+    order = order[sort_idx]
+    counts = np.bincount(order, minlength=len(order_codes))
+    arrays = {
+        'order_offsets': np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+        'longitude': np.concatenate(parts['lon'])[sort_idx] if parts['lon'] else np.zeros(0),
+        'latitude': np.concatenate(parts['lat'])[sort_idx] if parts['lat'] else np.zeros(0),
+        'time_s': time_s[sort_idx],
+        'candidate_ids': (np.concatenate(parts['cand'])[sort_idx] if parts['cand']
+                          else np.zeros((0, max_candidates), dtype=np.int32)),
+        'labels': np.concatenate(parts['label'])[sort_idx] if parts['label'] else np.zeros(0, dtype=np.int16),
+    }
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in CACHE_ARRAYS:
+        np.save(os.path.join(cache_dir, f'{name}.npy'), arrays[name])
+
+    order_ids = [None] * len(order_codes)
+    for order_id, code in order_codes.items():
+        order_ids[code] = str(order_id)
+    with open(os.path.join(cache_dir, VOCAB_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'osmid': list(vocab.keys()), 'order_id': order_ids}, f, ensure_ascii=False)
+
+    meta = {
+        'num_points': int(len(order)),
+        'num_orders': int(len(order_codes)),
+        'vocab_size': int(len(vocab)),
+        'max_candidates': int(max_candidates),
+    }
+    with open(os.path.join(cache_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    print(f"缓存已保存到: {cache_dir}，共 {meta['num_points']} 个点，{meta['num_orders']} 个订单，"
+          f"{meta['vocab_size']} 个路段。")
+    return meta
+
+
+class WindowBatchLoader:
+    """
+    从内存映射缓存中产出定长GPS窗口批次的数据加载器。
+
+    每个订单按 window_size / stride 切分为定长窗口，不足部分用0填充并由掩码标记；
+    每个 epoch 在订单级别打乱顺序（同一订单的窗口保持连续），批次由后台线程
+    并行组装并预取，训练循环只需消费现成的 NumPy 数组。
+
+    每个批次是一个字典：
+    - 'features' (B, W, 3) float32: 相对窗口首点的东向/北向偏移（米）和时间差（秒）；
+    - 'point_mask' (B, W) bool: 有效点掩码；
+    - 'candidate_ids' (B, W, C) int32: 候选路段的整数ID，填充位为 -1；
+    - 'candidate_mask' (B, W, C) bool: 有效候选掩码；
+    - 'labels' (B, W) int64: 真值路段在候选列表中的下标，无真值或填充位为 -1；
+    - 'order_index' (B,) int64: 窗口所属订单在缓存中的编号。
+    """
+
+    def __init__(self, cache_dir: str, window_size: int = 32, stride: int = None, batch_size: int = 64,
+                 shuffle: bool = True, seed: int = 0, num_workers: int = 2, prefetch: int = 4,
+                 drop_last: bool = False):
+        self.cache_dir = cache_dir
+        self.window_size = window_size
+        self.stride = stride or window_size
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_workers = max(1, num_workers)
+        self.prefetch = max(1, prefetch)
+        self.drop_last = drop_last
+        self.epoch = 0
+
+        self.arrays = {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r')
+                       for name in CACHE_ARRAYS}
+        with open(os.path.join(cache_dir, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        # 预先计算所有窗口的 (订单编号, 起始行, 有效长度)
+        offsets = np.asarray(self.arrays['order_offsets'])
+        lengths = np.diff(offsets)
+        window_counts = np.where(lengths <= self.window_size, (lengths > 0).astype(np.int64),
+                                 -(-(lengths - self.window_size) // self.stride) + 1)
+        self.window_order = np.repeat(np.arange(len(lengths)), window_counts)
+        first_window = np.concatenate(([0], np.cumsum(window_counts)[:-1]))
+        local_index = np.arange(len(self.window_order)) - np.repeat(first_window, window_counts)
+        self.window_start = offsets[self.window_order] + local_index * self.stride
+        self.window_length = np.minimum(self.window_size, offsets[self.window_order + 1] - self.window_start)
+        self._order_first_window = first_window
+        self._order_window_counts = window_counts
+
+    def __len__(self) -> int:
+        num_windows = len(self.window_order)
+        if self.drop_last:
+            return num_windows // self.batch_size
+        return -(-num_windows // self.batch_size)
+
+    def _epoch_window_order(self) -> np.ndarray:
+        """
+        生成本 epoch 的窗口顺序：在订单级别打乱，订单内部的窗口保持原有顺序。
+        """
+        if not self.shuffle:
+            return np.arange(len(self.window_order))
+        rng = np.random.default_rng([self.seed, self.epoch])
+        orders = np.flatnonzero(self._order_window_counts)
+        orders = orders[rng.permutation(len(orders))]
+        counts = self._order_window_counts[orders]
+        starts = np.repeat(self._order_first_window[orders], counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return starts + local
+
+    def _assemble_batch(self, window_indices: np.ndarray) -> dict:
+        """
+        向量化地从内存映射数组中组装一个批次。
+        """
+        starts = self.window_start[window_indices]
+        lengths = self.window_length[window_indices]
+        steps = np.arange(self.window_size)
+        point_mask = steps[None, :] < lengths[:, None]
+        rows = np.where(point_mask, starts[:, None] + steps[None, :], starts[:, None])
+
+        lon = np.asarray(self.arrays['longitude'][rows.ravel()]).reshape(rows.shape)
+        lat = np.asarray(self.arrays['latitude'][rows.ravel()]).reshape(rows.shape)
+        time_s = np.asarray(self.arrays['time_s'][rows.ravel()]).reshape(rows.shape)
+        candidate_ids = np.asarray(self.arrays['candidate_ids'][rows.ravel()]).reshape(rows.shape + (-1,))
+        labels = np.asarray(self.arrays['labels'][rows.ravel()]).reshape(rows.shape).astype(np.int64)
+
+        # 以窗口首点为原点的局部米制坐标
+        lat0 = np.radians(lat[:, :1])
+        features = np.empty(rows.shape + (3,), dtype=np.float32)
+        features[..., 0] = np.radians(lon - lon[:, :1]) * EARTH_RADIUS_METERS * np.cos(lat0)
+        features[..., 1] = np.radians(lat - lat[:, :1]) * EARTH_RADIUS_METERS
+        features[..., 2] = time_s - time_s[:, :1]
+        features[~point_mask] = 0.0
+
+        candidate_ids[~point_mask] = -1
+        labels[~point_mask] = -1
+
+        return {
+            'features': features,
+            'point_mask': point_mask,
+            'candidate_ids': candidate_ids,
+            'candidate_mask': candidate_ids >= 0,
+            'labels': labels,
+            'order_index': self.window_order[window_indices].astype(np.int64),
+        }
+
+    def __iter__(self):
+        window_sequence = self._epoch_window_order()
+        self.epoch += 1
+        batches = [window_sequence[i:i + self.batch_size] for i in range(0, len(window_sequence), self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        if not batches:
+            return
+
+        # 后台线程按批次序号组装数据，结果按原顺序交给消费者
+        task_queue = queue.Queue()
+        for batch_index, window_indices in enumerate(batches):
+            task_queue.put((batch_index, window_indices))
+        results = {}
+        ready = threading.Condition()
+        slots = threading.Semaphore(self.prefetch)
+        stop = threading.Event()
+
+        def worker():
+            while True:
+                # 先占用预取名额再领取任务，保证名额按批次顺序分配，不会死锁
+                slots.acquire()
+                if stop.is_set():
+                    return
+                try:
+                    batch_index, window_indices = task_queue.get_nowait()
+                except queue.Empty:
+                    slots.release()
+                    return
+                try:
+                    batch = self._assemble_batch(window_indices)
+                except Exception as e:
+                    batch = e
+                with ready:
+                    results[batch_index] = batch
+                    ready.notify_all()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.num_workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for batch_index in range(len(batches)):
+                with ready:
+                    while batch_index not in results:
+                        ready.wait()
+                    batch = results.pop(batch_index)
+                slots.release()
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            for _ in threads:
+                slots.release()
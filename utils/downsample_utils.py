@@ -0,0 +1,99 @@
+import pandas as pd
+import numpy as np
+
+# 一天的纳秒数，用于对齐 pandas resample 默认的 origin='start_day'
+NANOSECONDS_PER_DAY = 86400 * 10**9
+
+
+def _rule_to_nanoseconds(rule) -> int:
+    """
+    将降采样规则（如 '5s'、'1min' 或 pd.Timedelta）转换为纳秒整数。
+    """
+    step = pd.to_timedelta(rule).value
+    if step <= 0:
+        raise ValueError(f"降采样间隔必须大于0，收到: {rule}")
+    return int(step)
+
+
+def compute_downsample_masks(order_ids: np.ndarray, times_ns: np.ndarray, rules) -> np.ndarray:
+    """
+    在已按 (order_id, gps_time) 排序的数据上，一次性计算多个降采样频率的保留掩码。
+
+    对每个频率，时间桶编号为 (t - origin) // step，其中 origin 为该订单第一个点
+    所在日期的零点（与 resample 默认的 origin='start_day' 一致）。
+    每个 (订单, 时间桶) 只保留第一个点。
+
+    参数:
+    - order_ids (np.ndarray): 排序后的订单ID数组，长度为 n。
+    - times_ns (np.ndarray): 排序后的GPS时间（int64 纳秒），长度为 n。
+    - rules (list): 降采样规则列表，例如 ['5s', '10s', '20s', '60s']。
+
+    返回:
+    - np.ndarray: 形状为 (n, len(rules)) 的布尔数组，第 j 列为第 j 个频率的保留掩码。
+    """
+    n = len(order_ids)
+    steps = np.array([_rule_to_nanoseconds(rule) for rule in rules], dtype=np.int64)
+    if n == 0:
+        return np.zeros((0, len(steps)), dtype=bool)
+
+    # 1. 找出每个订单的起始行
+    order_start = np.ones(n, dtype=bool)
+    order_start[1:] = order_ids[1:] != order_ids[:-1]
+
+    # 2. 将每个订单第一个点的日期零点广播到整个订单
+    first_pos = np.maximum.accumulate(np.where(order_start, np.arange(n), 0))
+    first_time = times_ns[first_pos]
+    origin = first_time - first_time % NANOSECONDS_PER_DAY
+
+    # 3. 所有频率的时间桶一次性计算：形状 (n, k)
+    buckets = (times_ns - origin)[:, None] // steps[None, :]
+
+    # 4. 订单变化或时间桶变化的位置即为每个 (订单, 时间桶) 的第一个点
+    masks = np.empty((n, len(steps)), dtype=bool)
+    masks[0, :] = True
+    masks[1:, :] = buckets[1:] != buckets[:-1]
+    masks |= order_start[:, None]
+    return masks
+
+
+def downsample_gps_multi_rate(df: pd.DataFrame, rules=('5s', '10s', '20s', '60s')) -> dict:
+    """
+    对GPS轨迹数据按订单进行多频率时间降采样，只排序和扫描一次。
+
+    与逐订单 groupby + resample(rule).first() 的做法相比，这里先把数据按
+    (order_id, gps_time) 排序，再用整数运算计算所有频率的时间桶，
+    最后对每个频率用布尔掩码一次性取出每个 (订单, 时间桶) 的第一个点。
+    注意：输出中的 'gps_time' 是被保留点的原始时间，而不是时间桶的起点。
+
+    参数:
+    - df (pd.DataFrame): 包含GPS数据的DataFrame。
+      必须包含列: ['order_id', 'gps_time', 'longitude', 'latitude']。
+    - rules (list): 降采样规则列表，默认为 ('5s', '10s', '20s', '60s')。
+
+    返回:
+    - dict: 键为降采样规则，值为该频率下降采样后的DataFrame（列顺序与输入一致）。
+    """
+    # 检查必需的列是否存在
+    required_columns = ['order_id', 'gps_time', 'longitude', 'latitude']
+    if not all(col in df.columns for col in required_columns):
+        raise KeyError(f"输入DataFrame中缺少必需的列。需要 {required_columns}。")
+
+    rules = list(rules)
+
+    # 1. 确保 'gps_time' 是 datetime 类型，并按订单和时间排序
+    data = df.copy()
+    if not pd.api.types.is_datetime64_any_dtype(data['gps_time']):
+        data['gps_time'] = pd.to_datetime(data['gps_time'])
+    data = data.sort_values(by=['order_id', 'gps_time'], kind='stable').reset_index(drop=True)
+
+    # 2. 一次扫描计算所有频率的保留掩码
+    order_ids = data['order_id'].to_numpy()
+    times_ns = data['gps_time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    masks = compute_downsample_masks(order_ids, times_ns, rules)
+
+    # 3. 按频率输出各自的数据集
+    results = {}
+    for j, rule in enumerate(rules):
+        results[rule] = data[masks[:, j]].reset_index(drop=True)
+
+    return results
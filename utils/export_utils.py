@@ -0,0 +1,162 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+# 支持的输出格式：GeoPackage 在一个文件中保存多个图层；FlatGeobuf 每个图层一个文件
+EXPORT_DRIVERS = {'GPKG': '.gpkg', 'FlatGeobuf': '.fgb'}
+
+
+def find_candidate_edges_bulk(points_gdf, road_network_gdf, search_radius_meters: float = 20):
+    """
+    find_candidate_edges 的批量版本：一次空间索引查询得到所有点的候选路段。
+
+    直接复用 road_network_gdf 上已经构建好的 R-tree 索引（build_road_network_spatial_index 中的 .sindex），
+    对所有点的缓冲区做一次 sindex.query(..., predicate='intersects')，结果与逐点调用 find_candidate_edges 相同。
+
+    参数:
+    - points_gdf (GeoDataFrame): GPS点，坐标系不同时会先转换到路网的坐标系。
+    - road_network_gdf (GeoDataFrame): 路网（米制投影坐标系，如 EPSG:3857）。
+    - search_radius_meters (float): 搜索半径（米）。
+
+    返回:
+    - pd.DataFrame: 列 ['point_position', 'road_position']，分别为点和路段在各自GeoDataFrame中的位置下标。
+    """
+    if points_gdf.crs != road_network_gdf.crs:
+        points_gdf = points_gdf.to_crs(road_network_gdf.crs)
+    buffers = points_gdf.geometry.buffer(search_radius_meters).values
+    sindex = road_network_gdf.sindex
+    try:
+        point_position, road_position = sindex.query(buffers, predicate='intersects')
+    except (TypeError, ValueError):
+        # 旧版本 geopandas 的批量查询接口
+        point_position, road_position = sindex.query_bulk(buffers, predicate='intersects')
+    return pd.DataFrame({'point_position': point_position, 'road_position': road_position})
+
+
+def _sanitize_columns(gdf):
+    """
+    将列表、字典等无法写入 GeoPackage/FlatGeobuf 的单元格转换为字符串。
+    """
+    for col in gdf.columns:
+        if col == gdf.geometry.name or gdf[col].dtype != object:
+            continue
+        if gdf[col].map(lambda value: isinstance(value, (list, tuple, set, dict))).any():
+            gdf[col] = gdf[col].map(lambda value: str(value) if isinstance(value, (list, tuple, set, dict)) else value)
+    return gdf
+
+
+def _write_layers(layers: dict, output_path: str, driver: str) -> dict:
+    """
+    写出所有图层并返回 {图层名: 文件路径}。GeoPackage 写入同一个文件的多个图层，
+    FlatGeobuf 为每个图层写一个 <文件名>_<图层名>.fgb。两种格式都会生成空间索引。
+    """
+    stem, _ = os.path.splitext(output_path)
+    paths = {}
+    if driver == 'GPKG':
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        for name, gdf in layers.items():
+            gdf.to_file(output_path, layer=name, driver='GPKG', SPATIAL_INDEX='YES')
+            paths[name] = output_path
+    else:
+        for name, gdf in layers.items():
+            path = f'{stem}_{name}.fgb'
+            gdf.to_file(path, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+            paths[name] = path
+    return paths
+
+
+def export_orders_for_inspection(output_path: str, gps_df: pd.DataFrame, road_network_gdf, matched_df: pd.DataFrame = None,
+                                 order_ids=None, search_radius_meters: float = 30, driver: str = 'GPKG') -> dict:
+    """
+    批量导出多个订单的GPS点、匹配点和候选路段，便于在QGIS中直接打开检查。
+
+    与 visualize_single_order_candidates 逐个订单、逐个点查询并输出两个CSV不同，这里对所有选中订单的点
+    做一次批量空间索引查询，几何直接以二进制形式写入带空间索引的 GeoPackage（或 FlatGeobuf），
+    每个要素都带有 order_id 属性，在QGIS中可以按订单筛选。
+
+    输出图层（坐标系均为 EPSG:4326）:
+    - gps_points:      原始GPS点，附加 point_sequence 和 n_candidates（候选路段数）；
+    - matched_points:  匹配点（提供 matched_df 时）；
+    - matched_paths:   每个订单的匹配路径折线（提供 matched_df 时）；
+    - candidate_roads: 每个订单的候选路段（同一路段在同一订单中只出现一次），附加 n_points（命中的GPS点数）。
+
+    参数:
+    - output_path (str): 输出路径，例如 'abnormal_orders.gpkg'；FlatGeobuf 时作为文件名前缀。
+    - gps_df (pd.DataFrame): 原始GPS点，必须包含列 ['order_id', 'longitude', 'latitude']。
+    - road_network_gdf (GeoDataFrame): build_road_network_spatial_index 返回的路网（已构建空间索引）。
+    - matched_df (pd.DataFrame): 匹配结果，需包含列 ['order_id', 'matched_longitude', 'matched_latitude']，
+      有 'point_sequence' 列时按其排序。
+    - order_ids (list): 需要导出的订单ID，默认为 gps_df 中的全部订单。
+    - search_radius_meters (float): 候选路段搜索半径（米）。
+    - driver (str): 'GPKG' 或 'FlatGeobuf'。
+
+    返回:
+    - dict: {图层名: 要素数量}。
+    """
+    import geopandas as gpd
+    from shapely.geometry import LineString
+
+    if driver not in EXPORT_DRIVERS:
+        raise ValueError(f"不支持的输出格式: {driver}，可选 {list(EXPORT_DRIVERS)}。")
+    required_columns = ['order_id', 'longitude', 'latitude']
+    if not all(col in gps_df.columns for col in required_columns):
+        raise KeyError(f"gps_df中缺少必需的列。需要 {required_columns}。")
+
+    # 1. 选出需要导出的订单
+    if order_ids is not None:
+        order_ids = pd.unique(pd.Series(list(order_ids)))
+        gps_df = gps_df[gps_df['order_id'].isin(order_ids)]
+        if matched_df is not None:
+            matched_df = matched_df[matched_df['order_id'].isin(order_ids)]
+    gps_df = gps_df.reset_index(drop=True).copy()
+    gps_df['point_sequence'] = gps_df.groupby('order_id').cumcount()
+    print(f"正在导出 {gps_df['order_id'].nunique()} 个订单，共 {len(gps_df)} 个GPS点...")
+
+    gps_gdf = gpd.GeoDataFrame(gps_df, geometry=gpd.points_from_xy(gps_df['longitude'], gps_df['latitude']),
+                               crs='EPSG:4326')
+
+    # 2. 一次批量查询所有点的候选路段
+    pairs = find_candidate_edges_bulk(gps_gdf, road_network_gdf, search_radius_meters)
+    gps_gdf['n_candidates'] = np.bincount(pairs['point_position'], minlength=len(gps_gdf))
+
+    pairs['order_id'] = gps_df['order_id'].to_numpy()[pairs['point_position'].to_numpy()]
+    order_roads = pairs.groupby(['order_id', 'road_position']).size().rename('n_points').reset_index()
+
+    # 只对用到的路段转换一次坐标系
+    used_positions = np.unique(order_roads['road_position'])
+    used_roads = road_network_gdf.iloc[used_positions].to_crs('EPSG:4326')
+    road_lookup = pd.Series(np.arange(len(used_positions)), index=used_positions)
+    candidate_roads = used_roads.iloc[road_lookup[order_roads['road_position']].to_numpy()].reset_index(drop=True)
+    candidate_roads.insert(0, 'order_id', order_roads['order_id'].to_numpy())
+    candidate_roads['n_points'] = order_roads['n_points'].to_numpy()
+
+    layers = {'gps_points': gps_gdf, 'candidate_roads': candidate_roads}
+
+    # 3. 匹配点和匹配路径
+    if matched_df is not None and not matched_df.empty:
+        sort_columns = ['order_id', 'point_sequence'] if 'point_sequence' in matched_df.columns else ['order_id']
+        matched_df = matched_df.sort_values(by=sort_columns, kind='stable').reset_index(drop=True)
+        matched_gdf = gpd.GeoDataFrame(
+            matched_df,
+            geometry=gpd.points_from_xy(matched_df['matched_longitude'], matched_df['matched_latitude']),
+            crs='EPSG:4326'
+        )
+        paths = [(order_id, LineString(group[['matched_longitude', 'matched_latitude']].to_numpy()), len(group))
+                 for order_id, group in matched_df.groupby('order_id', sort=False) if len(group) >= 2]
+        layers['matched_points'] = matched_gdf
+        layers['matched_paths'] = gpd.GeoDataFrame(
+            {'order_id': [p[0] for p in paths], 'n_points': [p[2] for p in paths]},
+            geometry=[p[1] for p in paths], crs='EPSG:4326'
+        )
+
+    layers = {name: _sanitize_columns(gdf) for name, gdf in layers.items()}
+    paths = _write_layers(layers, output_path, driver)
+
+    counts = {name: len(gdf) for name, gdf in layers.items()}
+    print("-" * 30)
+    for name, count in counts.items():
+        print(f"图层 {name}: {count} 个要素 -> {paths[name]}")
+    print("在QGIS中直接打开该文件即可加载所有图层，可按 order_id 属性筛选订单。")
+    return counts
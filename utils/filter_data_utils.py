@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from utils.geo_utils import haversine_distance, to_local_meters
+
 def filter_gps_data_by_interval(df: pd.DataFrame, time_threshold: int = 4) -> pd.DataFrame:
     """
     筛选出GPS平均采样间隔大于指定阈值的订单。
@@ -186,19 +188,10 @@ def haversine_np(lon1: pd.Series, lat1: pd.Series, lon2: pd.Series, lat2: pd.Ser
     返回:
     一个包含两点之间距离（单位：米）的Pandas Series。
     """
-    # 地球半径（米）
-    R = 6371000
-
-    # 将十进制度数转换为弧度
-    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
-
-    # Haversine公式
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-
-    distance = R * c
+    # 距离计算统一由 utils.geo_utils 提供，这里只负责保留 Series 的索引
+    distance = haversine_distance(lon1, lat1, lon2, lat2)
+    if isinstance(lon1, pd.Series):
+        return pd.Series(distance, index=lon1.index)
     return distance
 
 def filter_orders_by_distance(df: pd.DataFrame, min_distance_meters: int = 1000) -> pd.DataFrame:
@@ -299,4 +292,175 @@ def filter_orders_by_max_segment_distance(df: pd.DataFrame, max_segment_meters:
     # 6. 从原始DataFrame中筛选出这些“好”订单的数据
     result_df = df[df['order_id'].isin(orders_to_keep)].copy()
 
-    return result_df
\ No newline at end of file
+    return result_df
+
+def detect_gps_loops(df: pd.DataFrame, cell_size_meters: float = 20, min_revisit_gap: int = 4,
+                     reversal_angle_deg: float = 150, min_step_meters: float = 15,
+                     dwell_radius_meters: float = 20, dwell_window: int = 2) -> pd.DataFrame:
+    """
+    检测GPS噪声造成的“序列回环”：重新回到之前经过的网格单元的点，以及航向突然反转的点。
+
+    所有订单一起向量化处理：
+    1. 将经纬度转换为局部平面坐标（米），并识别停留点：前 dwell_window 个点与后 dwell_window 个点的
+       平均位置相距小于 dwell_radius_meters 的点（如等红灯时的GPS抖动），以及与相邻停留点距离小于该阈值的点。
+       停留点不参与后续检测，也不会被标记；
+    2. 按 cell_size_meters 划分网格，订单内连续落在同一网格的点合并为一个“段”，若某段所在的网格在同一订单中
+       更早出现过，并且两次出现之间至少经过了 min_revisit_gap 个段（即确实离开过），
+       则该段的点标记为回访点；
+    3. 对每个点，若（跳过停留点后的）进入向量和离开向量的长度都不小于 min_step_meters，
+       且两者夹角大于 reversal_angle_deg，则标记为航向反转点。
+
+    参数:
+    - df (pd.DataFrame): 输入的DataFrame。
+      必须包含列: ['order_id', 'gps_time', 'longitude', 'latitude']。
+    - cell_size_meters (float): 网格边长（米），默认为 20。
+    - min_revisit_gap (int): 判定为回访所需的最小间隔段数，默认为 4。
+      间隔为 2 表示 A→B→A 这种在网格边界上的来回抖动，不计为回环。
+    - reversal_angle_deg (float): 判定为航向反转的最小转角（度），默认为 150。
+    - min_step_meters (float): 参与航向判断的最小位移（米），默认为 15，需高于城市中常见的GPS抖动。
+    - dwell_radius_meters (float): 停留点判定的位移阈值（米），默认为 20。
+    - dwell_window (int): 停留点判定时向前、向后取平均的点数，默认为 2。
+
+    返回:
+    - pd.DataFrame: 与输入索引对齐的标记表，包含布尔列
+      ['is_revisit', 'is_reversal', 'is_loop']，其中 is_loop = is_revisit | is_reversal。
+    """
+    # 检查必需的列是否存在
+    required_columns = ['order_id', 'gps_time', 'longitude', 'latitude']
+    if not all(col in df.columns for col in required_columns):
+        raise KeyError(f"输入DataFrame中缺少必需的列。需要 {required_columns}。")
+
+    n = len(df)
+    if n == 0:
+        return pd.DataFrame({'is_revisit': [], 'is_reversal': [], 'is_loop': []}, index=df.index, dtype=bool)
+
+    # 1. 按订单和时间排序（只排序位置，不复制整张表）
+    gps_time = df['gps_time']
+    if not pd.api.types.is_datetime64_any_dtype(gps_time):
+        gps_time = pd.to_datetime(gps_time)
+    order_codes = pd.factorize(df['order_id'])[0]
+    sort_idx = np.lexsort((gps_time.to_numpy(), order_codes))
+    orders = order_codes[sort_idx]
+    lon = df['longitude'].to_numpy(dtype=np.float64)[sort_idx]
+    lat = df['latitude'].to_numpy(dtype=np.float64)[sort_idx]
+
+    # 2. 局部平面坐标（米）
+    x, y = to_local_meters(lon, lat)
+
+    # 识别停留点：比较该点之前 dwell_window 个点与之后 dwell_window 个点的平均位置（窗口在订单边界处截断），
+    # 取平均可以抵消停车时的随机抖动，且不包含该点本身，因此单个漂移点不会被当成停留点
+    positions = np.arange(n)
+    is_order_start = np.r_[True, orders[1:] != orders[:-1]]
+    order_start = np.flatnonzero(is_order_start)
+    order_end = np.r_[order_start[1:], n]
+    order_rank = np.cumsum(is_order_start) - 1
+    back_lo = np.maximum(positions - dwell_window, order_start[order_rank])
+    ahead_hi = np.minimum(positions + 1 + dwell_window, order_end[order_rank])
+    cum_x = np.r_[0.0, np.cumsum(x)]
+    cum_y = np.r_[0.0, np.cumsum(y)]
+
+    def window_mean(lo, hi):
+        # 窗口为空（订单首尾点）时使用该点自身的坐标
+        empty = hi == lo
+        lo = np.where(empty, positions, lo)
+        hi = np.where(empty, positions + 1, hi)
+        return (cum_x[hi] - cum_x[lo]) / (hi - lo), (cum_y[hi] - cum_y[lo]) / (hi - lo)
+
+    back_x, back_y = window_mean(back_lo, positions)
+    ahead_x, ahead_y = window_mean(positions + 1, ahead_hi)
+    is_dwell = np.hypot(ahead_x - back_x, ahead_y - back_y) < dwell_radius_meters
+
+    # 停留段的首尾点一侧窗口仍在行驶段上，逐步把与相邻停留点距离小于阈值的点并入停留段
+    close_to_prev = ~is_order_start & (np.hypot(np.r_[0.0, np.diff(x)], np.r_[0.0, np.diff(y)]) < dwell_radius_meters)
+    close_to_next = np.r_[close_to_prev[1:], False]
+    for _ in range(dwell_window):
+        is_dwell = is_dwell | (close_to_prev & np.r_[False, is_dwell[:-1]]) | (close_to_next & np.r_[is_dwell[1:], False])
+
+    # 后续检测只在非停留点上进行
+    moving = np.flatnonzero(~is_dwell)
+    orders, x, y = orders[moving], x[moving], y[moving]
+    same_order_prev = np.r_[False, orders[1:] == orders[:-1]]
+
+    # 3. 网格回访检测
+    cx = np.floor(x / cell_size_meters).astype(np.int64)
+    cy = np.floor(y / cell_size_meters).astype(np.int64)
+    new_run = ~same_order_prev | np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])]
+    run_id = np.cumsum(new_run) - 1
+    run_start = np.flatnonzero(new_run)
+    run_order, run_cx, run_cy = orders[run_start], cx[run_start], cy[run_start]
+
+    # 按 (订单, 网格, 段号) 排序后，相邻且键相同的段就是同一网格的前后两次访问
+    key_sort = np.lexsort((run_start, run_cy, run_cx, run_order))
+    same_key = np.r_[False, (run_order[key_sort][1:] == run_order[key_sort][:-1]) &
+                     (run_cx[key_sort][1:] == run_cx[key_sort][:-1]) &
+                     (run_cy[key_sort][1:] == run_cy[key_sort][:-1])]
+    sorted_runs = np.arange(len(run_start))[key_sort]
+    gap = np.r_[0, sorted_runs[1:] - sorted_runs[:-1]]
+    revisit_run = np.zeros(len(run_start), dtype=bool)
+    revisit_run[sorted_runs] = same_key & (gap >= min_revisit_gap)
+    is_revisit = revisit_run[run_id]
+
+    # 4. 航向反转检测
+    dx_in = np.r_[np.nan, np.diff(x)]
+    dy_in = np.r_[np.nan, np.diff(y)]
+    dx_in[~same_order_prev] = np.nan
+    dy_in[~same_order_prev] = np.nan
+    dx_out = np.r_[dx_in[1:], np.nan]
+    dy_out = np.r_[dy_in[1:], np.nan]
+    len_in = np.hypot(dx_in, dy_in)
+    len_out = np.hypot(dx_out, dy_out)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos_turn = (dx_in * dx_out + dy_in * dy_out) / (len_in * len_out)
+    is_reversal = ((len_in >= min_step_meters) & (len_out >= min_step_meters) &
+                   (cos_turn < np.cos(np.radians(reversal_angle_deg))))
+
+    # 5. 将结果写回原始行顺序
+    flags = pd.DataFrame(index=df.index)
+    revisit = np.zeros(n, dtype=bool)
+    reversal = np.zeros(n, dtype=bool)
+    revisit[sort_idx[moving]] = is_revisit
+    reversal[sort_idx[moving]] = is_reversal
+    flags['is_revisit'] = revisit
+    flags['is_reversal'] = reversal
+    flags['is_loop'] = revisit | reversal
+    return flags
+
+
+def filter_orders_by_loops(df: pd.DataFrame, max_loop_points: int = 0, **detect_kwargs) -> pd.DataFrame:
+    """
+    移除存在“序列回环”的订单。
+
+    使用 detect_gps_loops 标记回环点，回环点数量超过 max_loop_points 的订单被整个移除。
+
+    参数:
+    - df (pd.DataFrame): 输入的DataFrame。
+      必须包含列: ['order_id', 'gps_time', 'longitude', 'latitude']。
+    - max_loop_points (int): 每个订单允许的最大回环点数，默认为 0。
+    - **detect_kwargs: 传递给 detect_gps_loops 的参数。
+
+    返回:
+    - pd.DataFrame: 一个新的DataFrame，仅包含回环点数不超过阈值的订单记录。
+    """
+    flags = detect_gps_loops(df, **detect_kwargs)
+
+    # 按订单统计回环点数量
+    loop_counts = flags['is_loop'].groupby(df['order_id']).sum()
+    orders_to_keep = loop_counts[loop_counts <= max_loop_points].index
+
+    return df[df['order_id'].isin(orders_to_keep)].copy()
+
+
+def remove_loop_points(df: pd.DataFrame, **detect_kwargs) -> pd.DataFrame:
+    """
+    点级修复：只删除被标记为“序列回环”的GPS点，保留订单中的其余点。
+
+    参数:
+    - df (pd.DataFrame): 输入的DataFrame。
+      必须包含列: ['order_id', 'gps_time', 'longitude', 'latitude']。
+    - **detect_kwargs: 传递给 detect_gps_loops 的参数。
+
+    返回:
+    - pd.DataFrame: 一个新的DataFrame，其中回环点已被移除。
+    """
+    flags = detect_gps_loops(df, **detect_kwargs)
+    return df[~flags['is_loop']].copy()
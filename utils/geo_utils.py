@@ -0,0 +1,227 @@
+import numpy as np
+
+# 地球半径（米）
+EARTH_RADIUS_METERS = 6371000.0
+
+# 支持的距离计算方法
+#   'haversine'       精确的球面大圆距离；
+#   'equirectangular' 局部等距矩形近似，只需一次 cos 和一次 sqrt，
+#                     在城市尺度（两点相距 < 50 km、纬度 < 60°）下相对误差小于 0.1%。
+DISTANCE_METHODS = ('haversine', 'equirectangular')
+
+
+def _as_arrays(dtype, *arrays):
+    """
+    将输入（标量、列表、NumPy数组或Pandas Series）转换为指定精度的NumPy数组，
+    dtype 相同时不复制数据。
+    """
+    return [np.asarray(a, dtype=dtype) for a in arrays]
+
+
+def _prepare_out(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape:
+        raise ValueError(f"out 的形状 {out.shape} 与计算结果的形状 {shape} 不一致。")
+    return out
+
+
+def to_local_meters(lon, lat, lat0: float = None, dtype=np.float64, out_x=None, out_y=None) -> tuple:
+    """
+    将经纬度转换为以 lat0 为参考纬度的局部等距矩形平面坐标（单位：米）。
+
+    参数:
+    - lon, lat (array-like): 经纬度（度）。
+    - lat0 (float): 参考纬度，默认为输入纬度的平均值。
+    - dtype: 计算精度，np.float64 或 np.float32。
+    - out_x, out_y (np.ndarray): 可选的预分配输出数组。
+
+    返回:
+    - tuple: (x, y) 两个数组。
+    """
+    lon, lat = _as_arrays(dtype, lon, lat)
+    if lat0 is None:
+        lat0 = float(np.nanmean(lat))
+    shape = np.broadcast_shapes(lon.shape, lat.shape)
+    out_x = _prepare_out(out_x, shape, dtype)
+    out_y = _prepare_out(out_y, shape, dtype)
+    np.multiply(lon, dtype(np.pi / 180.0 * EARTH_RADIUS_METERS * np.cos(np.radians(lat0))), out=out_x)
+    np.multiply(lat, dtype(np.pi / 180.0 * EARTH_RADIUS_METERS), out=out_y)
+    return out_x, out_y
+
+
+def haversine_distance(lon1, lat1, lon2, lat2, dtype=np.float64, out=None) -> np.ndarray:
+    """
+    使用NumPy向量化计算Haversine距离（单位：米），支持广播。
+
+    参数:
+    - lon1, lat1, lon2, lat2 (array-like): WGS84经纬度（度）。
+    - dtype: 计算精度，np.float64 或 np.float32（float32 更省内存，但误差约为米级）。
+    - out (np.ndarray): 可选的预分配输出数组，结果将直接写入其中。
+
+    返回:
+    - np.ndarray: 两点之间的距离（米），任一输入为 NaN 时结果为 NaN。
+    """
+    lon1, lat1, lon2, lat2 = _as_arrays(dtype, lon1, lat1, lon2, lat2)
+    shape = np.broadcast_shapes(lon1.shape, lat1.shape, lon2.shape, lat2.shape)
+    out = _prepare_out(out, shape, dtype)
+    half_rad = dtype(np.pi / 360.0)
+
+    # a = sin²(Δlat/2) + cos(lat1)·cos(lat2)·sin²(Δlon/2)
+    scratch = np.empty(shape, dtype=dtype)
+    np.subtract(lat2, lat1, out=out)
+    out *= half_rad
+    np.sin(out, out=out)
+    np.square(out, out=out)
+
+    np.subtract(lon2, lon1, out=scratch)
+    scratch *= half_rad
+    np.sin(scratch, out=scratch)
+    np.square(scratch, out=scratch)
+    scratch *= np.cos(lat1 * (2 * half_rad))
+    scratch *= np.cos(lat2 * (2 * half_rad))
+    out += scratch
+
+    # c = 2·asin(√a)
+    np.clip(out, 0.0, 1.0, out=out)
+    np.sqrt(out, out=out)
+    np.arcsin(out, out=out)
+    out *= dtype(2.0 * EARTH_RADIUS_METERS)
+    return out
+
+
+def equirectangular_distance(lon1, lat1, lon2, lat2, dtype=np.float64, out=None) -> np.ndarray:
+    """
+    使用局部等距矩形近似计算两点距离（单位：米），支持广播。
+
+    以两点的平均纬度计算经度缩放，比 Haversine 少了大部分三角函数运算；
+    在城市尺度下（两点相距 < 50 km、纬度 < 60°）相对误差小于 0.1%。
+
+    参数与返回值同 haversine_distance。
+    """
+    lon1, lat1, lon2, lat2 = _as_arrays(dtype, lon1, lat1, lon2, lat2)
+    shape = np.broadcast_shapes(lon1.shape, lat1.shape, lon2.shape, lat2.shape)
+    out = _prepare_out(out, shape, dtype)
+    rad = dtype(np.pi / 180.0)
+
+    scratch = np.empty(shape, dtype=dtype)
+    # Δx = Δlon·cos(平均纬度)，Δy = Δlat
+    np.add(lat1, lat2, out=scratch)
+    scratch *= rad / 2
+    np.cos(scratch, out=scratch)
+    np.subtract(lon2, lon1, out=out)
+    out *= scratch
+    np.square(out, out=out)
+
+    np.subtract(lat2, lat1, out=scratch)
+    np.square(scratch, out=scratch)
+    out += scratch
+
+    np.sqrt(out, out=out)
+    out *= dtype(rad * EARTH_RADIUS_METERS)
+    return out
+
+
+def point_distance(lon1, lat1, lon2, lat2, method: str = 'haversine', dtype=np.float64, out=None) -> np.ndarray:
+    """
+    按 method（'haversine' 或 'equirectangular'）计算两组点之间的逐元素距离（米）。
+    """
+    if method == 'haversine':
+        return haversine_distance(lon1, lat1, lon2, lat2, dtype=dtype, out=out)
+    if method == 'equirectangular':
+        return equirectangular_distance(lon1, lat1, lon2, lat2, dtype=dtype, out=out)
+    raise ValueError(f"不支持的距离计算方法: {method}，可选 {DISTANCE_METHODS}。")
+
+
+def consecutive_distances(lon, lat, group_ids=None, method: str = 'haversine', dtype=np.float64,
+                          out=None) -> np.ndarray:
+    """
+    计算序列中每个点与前一个点之间的距离（米）。
+
+    参数:
+    - lon, lat (array-like): 按顺序排列的经纬度，长度为 n。
+    - group_ids (array-like): 可选的分组（如 order_id），需已按组连续排列；
+      每组第一个点没有前一个点，结果为 NaN。
+    - method (str): 'haversine' 或 'equirectangular'。
+    - dtype: 计算精度。
+    - out (np.ndarray): 可选的预分配输出数组，长度为 n。
+
+    返回:
+    - np.ndarray: 长度为 n 的距离数组，第一个点（以及每组的第一个点）为 NaN。
+    """
+    lon, lat = _as_arrays(dtype, lon, lat)
+    n = len(lon)
+    out = _prepare_out(out, (n,), dtype)
+    if n == 0:
+        return out
+    out[0] = np.nan
+    point_distance(lon[:-1], lat[:-1], lon[1:], lat[1:], method=method, dtype=dtype, out=out[1:])
+    if group_ids is not None:
+        group_ids = np.asarray(group_ids)
+        out[1:][group_ids[1:] != group_ids[:-1]] = np.nan
+    return out
+
+
+def pairwise_distances(lon1, lat1, lon2, lat2, method: str = 'haversine', dtype=np.float64, out=None) -> np.ndarray:
+    """
+    计算两组点之间的两两距离矩阵（米）。
+
+    参数:
+    - lon1, lat1 (array-like): 第一组点，长度为 n。
+    - lon2, lat2 (array-like): 第二组点，长度为 m。
+    - method, dtype: 同 point_distance。
+    - out (np.ndarray): 可选的预分配输出数组，形状为 (n, m)。
+
+    返回:
+    - np.ndarray: 形状为 (n, m) 的距离矩阵。
+    """
+    lon1, lat1, lon2, lat2 = _as_arrays(dtype, lon1, lat1, lon2, lat2)
+    return point_distance(lon1[:, None], lat1[:, None], lon2[None, :], lat2[None, :],
+                          method=method, dtype=dtype, out=out)
+
+
+def one_to_many_distances(lon, lat, lons, lats, method: str = 'haversine', dtype=np.float64, out=None) -> np.ndarray:
+    """
+    计算一个点到一组点的距离（米），返回长度为 m 的数组。
+    """
+    return point_distance(lon, lat, lons, lats, method=method, dtype=dtype, out=out)
+
+
+def point_to_segment_distance(lon, lat, lon_a, lat_a, lon_b, lat_b, dtype=np.float64, out=None) -> tuple:
+    """
+    计算点到线段 AB 的最短距离（米），支持广播。
+
+    在以各自点的纬度为参考的局部等距矩形平面中求投影，城市尺度下误差与
+    equirectangular_distance 相同量级。
+
+    参数:
+    - lon, lat (array-like): 点的经纬度。
+    - lon_a, lat_a, lon_b, lat_b (array-like): 线段端点的经纬度。
+    - dtype: 计算精度。
+    - out (np.ndarray): 可选的预分配距离输出数组。
+
+    返回:
+    - tuple: (距离数组, 投影参数 t 数组)，t ∈ [0, 1]，0 表示 A 端，1 表示 B 端。
+    """
+    lon, lat, lon_a, lat_a, lon_b, lat_b = _as_arrays(dtype, lon, lat, lon_a, lat_a, lon_b, lat_b)
+    shape = np.broadcast_shapes(lon.shape, lat.shape, lon_a.shape, lat_a.shape, lon_b.shape, lat_b.shape)
+    out = _prepare_out(out, shape, dtype)
+    rad = dtype(np.pi / 180.0)
+
+    # 以点为原点的局部平面坐标（单位：度，经度方向已按纬度缩放）
+    scale = np.cos(lat * rad)
+    ax = (lon_a - lon) * scale
+    ay = lat_a - lat
+    dx = (lon_b - lon_a) * scale
+    dy = lat_b - lat_a
+
+    len2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(len2 > 0, -(ax * dx + ay * dy) / np.where(len2 > 0, len2, 1), 0)
+    t = np.clip(t, 0.0, 1.0).astype(dtype, copy=False)
+
+    qx = ax + t * dx
+    qy = ay + t * dy
+    np.hypot(qx, qy, out=out)
+    out *= dtype(rad * EARTH_RADIUS_METERS)
+    return out, np.broadcast_to(t, shape)
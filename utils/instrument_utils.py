@@ -0,0 +1,217 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 阶段指标默认写入的 JSON Lines 文件，可通过环境变量覆盖
+DEFAULT_LOG_PATH = os.environ.get('MAP_MATCHING_STAGE_LOG', 'stage_metrics.jsonl')
+# 全局开启分析器：'cprofile' 或 'pyinstrument'，为空时不启用
+DEFAULT_PROFILER = os.environ.get('MAP_MATCHING_PROFILE') or None
+# 分析结果的输出目录
+DEFAULT_PROFILE_DIR = os.environ.get('MAP_MATCHING_PROFILE_DIR', 'stage_profiles')
+
+
+def current_rss_mb() -> float:
+    """
+    当前进程的常驻内存（MB）。优先使用 psutil，其次读取 /proc/self/statm，都不可用时返回 NaN。
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+def max_rss_mb() -> float:
+    """
+    进程启动以来的峰值常驻内存（MB），来自 getrusage；不支持的平台返回 NaN。
+    """
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class _RssSampler(threading.Thread):
+    """
+    后台线程按固定间隔采样常驻内存，记录阶段内的峰值。
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_mb())
+        return self.peak
+
+
+class Stage:
+    """
+    记录一个流水线阶段的墙钟时间、CPU时间、内存和处理行数，结束时以一行JSON追加写入日志。
+
+    既可以作为上下文管理器：
+        with Stage('make_dataset.load', rows_in=len(df)) as stage:
+            ...
+            stage.rows_out = len(result)
+    也可以在不便缩进的脚本中显式调用 start() / finish()：
+        stage = Stage('make_dataset.load').start()
+        ...
+        stage.finish(rows_out=len(result))
+    显式调用时阶段内的异常和 exit() 不会被记录，需要自行 try/finally 并调用 stage.finish(status='error', ...)，
+    因此流水线脚本应优先使用上下文管理器，失败的运行也会以 status='error' 写入日志。
+
+    参数:
+    - name (str): 阶段名称，建议使用 '脚本名.步骤名'。
+    - rows_in, rows_out (int): 输入、输出的行数，也可以在阶段内部设置。
+    - log_path (str): JSON Lines 日志路径，为 None 时只打印不写文件。
+    - profile (str): 'cprofile' 或 'pyinstrument'，为该阶段保存分析结果；默认取环境变量 MAP_MATCHING_PROFILE。
+    - profile_dir (str): 分析结果输出目录。
+    - sample_interval (float): 内存采样间隔（秒）。
+    - extra (dict): 附加写入日志的字段。
+    """
+
+    def __init__(self, name: str, rows_in: int = None, rows_out: int = None, log_path: str = DEFAULT_LOG_PATH,
+                 profile: str = DEFAULT_PROFILER, profile_dir: str = DEFAULT_PROFILE_DIR,
+                 sample_interval: float = 0.05, extra: dict = None):
+        if profile not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"不支持的分析器: {profile}，可选 'cprofile' 或 'pyinstrument'。")
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.log_path = log_path
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.extra = dict(extra or {})
+        self.record = None
+        self._profiler = None
+
+    def start(self) -> 'Stage':
+        self._started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self._rss_start = current_rss_mb()
+        self._sampler = _RssSampler(self.sample_interval)
+        self._sampler.start()
+        self._start_profiler()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def _start_profiler(self):
+        if self.profile == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                raise ImportError("使用 pyinstrument 分析需要安装 pyinstrument：pip install pyinstrument") from e
+            self._profiler = Profiler()
+            self._profiler.start()
+
+    def _stop_profiler(self) -> str:
+        if self._profiler is None:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        if self.profile == 'cprofile':
+            self._profiler.disable()
+            path = os.path.join(self.profile_dir, f'{self.name}_{stamp}.prof')
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.stop()
+            path = os.path.join(self.profile_dir, f'{self.name}_{stamp}.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output_html())
+        self._profiler = None
+        return path
+
+    def finish(self, rows_out: int = None, rows_in: int = None, status: str = 'ok', error: str = None) -> dict:
+        """
+        结束计时，写出并返回该阶段的指标记录。
+        """
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        profile_path = self._stop_profiler()
+        rss_peak = self._sampler.stop()
+        if rows_in is not None:
+            self.rows_in = rows_in
+        if rows_out is not None:
+            self.rows_out = rows_out
+
+        # 吞吐量以输入行数计算，没有输入行数时使用输出行数
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        self.record = {
+            'stage': self.name,
+            'started_at': self._started_at,
+            'status': status,
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'rss_start_mb': round(self._rss_start, 2),
+            'rss_peak_mb': round(rss_peak, 2),
+            'rss_end_mb': round(current_rss_mb(), 2),
+            'process_max_rss_mb': round(max_rss_mb(), 2),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_sec': round(rows / wall, 2) if rows is not None and wall > 0 else None,
+            'pid': os.getpid(),
+            'profile_path': profile_path,
+            'error': error,
+            **self.extra,
+        }
+        self._write()
+        return self.record
+
+    def _write(self):
+        record = self.record
+        rate = f"，{record['rows_per_sec']:.1f} 行/秒" if record['rows_per_sec'] is not None else ''
+        print(f"[阶段] {record['stage']}: 耗时 {record['wall_seconds']:.2f} 秒，CPU {record['cpu_seconds']:.2f} 秒，"
+              f"峰值内存 {record['rss_peak_mb']:.1f} MB{rate}")
+        if self.log_path is None:
+            return
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def __enter__(self) -> 'Stage':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.finish(status='error', error=f'{exc_type.__name__}: {exc}')
+        return False
+
+
+def read_stage_log(log_path: str = DEFAULT_LOG_PATH):
+    """
+    读取阶段指标日志为 DataFrame，便于按阶段汇总耗时。
+    """
+    import pandas as pd
+    return pd.read_json(log_path, lines=True)
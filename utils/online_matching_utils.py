@@ -0,0 +1,502 @@
+import asyncio
+import heapq
+import json
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from utils.geo_utils import equirectangular_distance
+from utils.streaming_stats_utils import TDigest
+
+# 匹配结果中每个点的字段
+DECISION_FIELDS = ['order_id', 'gps_time', 'longitude', 'latitude', 'osmid', 'edge_index',
+                   'matched_longitude', 'matched_latitude', 'distance_m', 'latency_ms']
+
+# 在线匹配服务接收的GPS点必需字段
+POINT_FIELDS = ['order_id', 'longitude', 'latitude']
+
+# 停止信号：放在输入队列末尾，接入任务处理完它之前的所有点后退出
+_STOP = {'_control': 'stop'}
+
+
+class _OrderState:
+    """
+    单个订单的在线匹配状态：尚未提交的格点列（滑动窗口）和最近一次收到数据的时间。
+    """
+    __slots__ = ('columns', 'last_seen')
+
+    def __init__(self):
+        self.columns = deque()
+        self.last_seen = 0.0
+
+
+class OnlineMapMatcher:
+    """
+    基于隐马尔可夫模型（HMM）的在线地图匹配器，每个订单维护一个滑动窗口。
+
+    每收到一个点，就在 SharedRoadNetwork 上查询半径内的候选路段，并做一步 Viterbi 递推：
+    - 观测概率：点到路段的距离服从高斯分布 N(0, sigma²)；
+    - 转移概率：相邻两点的GPS直线距离与两个投影点之间的路网距离之差服从尺度为 beta 的指数分布。
+      路网距离沿 CSR 邻接表做有界 Dijkstra 得到（同一条边上向前行驶时直接取沿边距离），
+      超过 max_route_distance 的转移视为不可达；每个起点节点的 Dijkstra 结果放入容量为
+      route_cache_size 的 LRU 缓存，相邻点和同一区域的订单可以复用。
+    当窗口中未提交的点超过 lag 个时，从当前最优状态回溯，提交窗口中最早的点（固定滞后平滑），
+    因此每个点最多等待 lag 个后续点即可输出结果。没有候选路段的点会截断当前链：
+    之前的点全部提交，该点作为未匹配点输出；所有候选都无法从上一个点到达时同样截断，
+    该点作为新链的起点。超过 idle_timeout 秒没有新数据的订单由
+    evict_idle() 提交剩余点后释放。
+
+    同一批次中所有订单的点只做一次向量化的候选查询，单进程即可同时处理数千个订单。
+    """
+
+    def __init__(self, network, search_radius: float = 50.0, max_candidates: int = 8, sigma: float = 5.0,
+                 beta: float = 5.0, lag: int = 5, idle_timeout: float = 60.0, max_route_distance: float = 500.0,
+                 route_cache_size: int = 20000):
+        self.network = network
+        self.search_radius = search_radius
+        self.max_candidates = max_candidates
+        self.sigma = sigma
+        self.beta = beta
+        self.lag = lag
+        self.idle_timeout = idle_timeout
+        self.max_route_distance = max_route_distance
+        self.route_cache_size = route_cache_size
+        self.route_cache = OrderedDict()
+        self.route_cache_hits = 0
+        self.route_cache_misses = 0
+
+        self.orders = {}
+        self.latency = TDigest()
+        self.points_in = 0
+        self.points_committed = 0
+        self.orders_evicted = 0
+
+    def _candidates(self, records: list) -> list:
+        """
+        批量查询候选路段，返回与 records 对齐的候选数组字典列表（没有候选时为 None）。
+        """
+        lon = np.array([record['longitude'] for record in records], dtype=np.float64)
+        lat = np.array([record['latitude'] for record in records], dtype=np.float64)
+        found = self.network.candidate_edges(lon, lat, self.search_radius)
+
+        point_index = found['point_index'].to_numpy()
+        starts = np.searchsorted(point_index, np.arange(len(records)), side='left')
+        ends = np.searchsorted(point_index, np.arange(len(records)), side='right')
+        columns = {name: found[name].to_numpy() for name in
+                   ['edge_index', 'osmid', 'distance_m', 'projected_longitude', 'projected_latitude',
+                    'edge_offset_m']}
+
+        candidates = []
+        for start, end in zip(starts, ends):
+            # 结果已按距离排序，只保留最近的 max_candidates 条
+            end = min(end, start + self.max_candidates)
+            if end <= start:
+                candidates.append(None)
+            else:
+                candidates.append({name: values[start:end] for name, values in columns.items()})
+        return candidates
+
+    def _distances_from(self, source: int) -> dict:
+        """
+        从节点下标 source 出发、距离不超过 max_route_distance 的有界 Dijkstra，返回 {节点下标: 距离}。
+        """
+        distances = self.route_cache.get(source)
+        if distances is not None:
+            self.route_cache_hits += 1
+            self.route_cache.move_to_end(source)
+            return distances
+
+        self.route_cache_misses += 1
+        indptr, indices, weights = self.network.adj_indptr, self.network.adj_indices, self.network.adj_weight
+        distances = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            start, end = indptr[node], indptr[node + 1]
+            for neighbor, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+                candidate = distance + weight
+                if candidate <= self.max_route_distance and candidate < distances.get(neighbor, np.inf):
+                    distances[neighbor] = candidate
+                    heapq.heappush(heap, (candidate, neighbor))
+
+        self.route_cache[source] = distances
+        if len(self.route_cache) > self.route_cache_size:
+            self.route_cache.popitem(last=False)
+        return distances
+
+    def _route_distances(self, prev_cand: dict, cand: dict) -> np.ndarray:
+        """
+        上一个点的每个候选到当前点每个候选的路网距离矩阵（米），不可达为 inf。
+        """
+        edge_u, edge_v, edge_length = self.network.edge_u, self.network.edge_v, self.network.edge_length
+        target_nodes = edge_u[cand['edge_index']].tolist()
+        routes = np.full((len(prev_cand['edge_index']), len(target_nodes)), np.inf)
+        for i, (edge, offset) in enumerate(zip(prev_cand['edge_index'], prev_cand['edge_offset_m'])):
+            # 先驶完当前边到达终点 v，再经最短路到达候选边的起点 u，最后沿候选边行驶到投影点
+            distances = self._distances_from(int(edge_v[edge]))
+            to_start = np.array([distances.get(node, np.inf) for node in target_nodes])
+            routes[i] = (edge_length[edge] - offset) + to_start + cand['edge_offset_m']
+            # 同一条边上向前行驶
+            forward = (cand['edge_index'] == edge) & (cand['edge_offset_m'] >= offset)
+            routes[i, forward] = cand['edge_offset_m'][forward] - offset
+        routes[routes > self.max_route_distance] = np.inf
+        return routes
+
+    def _decision(self, column: dict, choice: int, now: float) -> dict:
+        record = column['point']
+        latency_ms = (now - record['_received']) * 1000.0
+        decision = {
+            'order_id': record['order_id'],
+            'gps_time': record.get('gps_time'),
+            'longitude': float(record['longitude']),
+            'latitude': float(record['latitude']),
+            'osmid': None,
+            'edge_index': None,
+            'matched_longitude': None,
+            'matched_latitude': None,
+            'distance_m': None,
+            'latency_ms': latency_ms,
+        }
+        cand = column['cand']
+        if cand is not None:
+            decision.update({
+                'osmid': int(cand['osmid'][choice]),
+                'edge_index': int(cand['edge_index'][choice]),
+                'matched_longitude': float(cand['projected_longitude'][choice]),
+                'matched_latitude': float(cand['projected_latitude'][choice]),
+                'distance_m': float(cand['distance_m'][choice]),
+            })
+        return decision
+
+    def _backtrack(self, columns: deque) -> list:
+        """
+        从最后一列的最优状态回溯，返回每一列选择的候选下标。
+        """
+        choices = [0] * len(columns)
+        if columns[-1]['cand'] is None:
+            return choices
+        state = int(np.argmax(columns[-1]['score']))
+        for i in range(len(columns) - 1, -1, -1):
+            choices[i] = state
+            if columns[i]['back'] is None:
+                break
+            state = int(columns[i]['back'][state])
+        return choices
+
+    def _commit(self, state: _OrderState, count: int, now: float) -> list:
+        """
+        提交窗口中最早的 count 个点。
+        """
+        count = min(count, len(state.columns))
+        if count == 0:
+            return []
+        choices = self._backtrack(state.columns)
+        decisions = []
+        for i in range(count):
+            decisions.append(self._decision(state.columns.popleft(), choices[i], now))
+        # 新的窗口头部不再回溯到已提交的列
+        if state.columns:
+            state.columns[0]['back'] = None
+        self.points_committed += len(decisions)
+        self.latency.update([decision['latency_ms'] for decision in decisions])
+        return decisions
+
+    def _step(self, state: _OrderState, record: dict, cand: dict, now: float) -> list:
+        """
+        对一个订单加入一个新点并做一步 Viterbi 递推，返回因此提交的结果。
+        """
+        decisions = []
+        column = {'point': record, 'cand': cand, 'score': None, 'back': None}
+
+        if cand is None:
+            # 没有候选路段：截断当前链
+            decisions.extend(self._commit(state, len(state.columns), now))
+            state.columns.append(column)
+            decisions.extend(self._commit(state, 1, now))
+            return decisions
+
+        emission = -0.5 * (cand['distance_m'] / self.sigma) ** 2
+        prev = state.columns[-1] if state.columns else None
+        total = None
+        if prev is not None and prev['cand'] is not None:
+            prev_record = prev['point']
+            gps_step = equirectangular_distance(prev_record['longitude'], prev_record['latitude'],
+                                                record['longitude'], record['latitude'])
+            route_step = self._route_distances(prev['cand'], cand)
+            total = prev['score'][:, None] - np.abs(route_step - gps_step) / self.beta
+            if not np.isfinite(total).any():
+                # 所有候选都无法从上一个点的可能状态到达：提交之前的点，当前点作为新链的起点
+                decisions.extend(self._commit(state, len(state.columns), now))
+                total = None
+
+        if total is None:
+            column['score'] = emission
+        else:
+            column['back'] = np.argmax(total, axis=0)
+            score = total[column['back'], np.arange(len(emission))] + emission
+            # 归一化避免长订单的分数下溢
+            column['score'] = score - score.max()
+        state.columns.append(column)
+
+        if len(state.columns) > self.lag:
+            decisions.extend(self._commit(state, len(state.columns) - self.lag, now))
+        return decisions
+
+    def add_points(self, records: list) -> list:
+        """
+        按到达顺序加入一批GPS点（可以来自不同订单），返回本批次中被提交的匹配结果。
+
+        参数:
+        - records (list): [{'order_id', 'gps_time', 'longitude', 'latitude'}, ...]。
+          可选的 '_received' 为到达时刻（time.perf_counter()），用于统计延迟，缺省时取当前时刻。
+
+        返回:
+        - list: 匹配结果字典列表，字段见 DECISION_FIELDS；未匹配的点 osmid 等字段为 None。
+        """
+        if not records:
+            return []
+        received = time.perf_counter()
+        for record in records:
+            record.setdefault('_received', received)
+        candidates = self._candidates(records)
+
+        now_wall = time.monotonic()
+        decisions = []
+        for record, cand in zip(records, candidates):
+            state = self.orders.get(record['order_id'])
+            if state is None:
+                state = self.orders[record['order_id']] = _OrderState()
+            state.last_seen = now_wall
+            decisions.extend(self._step(state, record, cand, time.perf_counter()))
+        self.points_in += len(records)
+        return decisions
+
+    def flush(self, order_id=None) -> list:
+        """
+        提交指定订单（默认为所有订单）窗口中剩余的点并释放其状态，通常在订单结束时调用。
+        """
+        order_ids = list(self.orders) if order_id is None else [order_id]
+        decisions = []
+        for oid in order_ids:
+            state = self.orders.pop(oid, None)
+            if state is not None:
+                decisions.extend(self._commit(state, len(state.columns), time.perf_counter()))
+        return decisions
+
+    def evict_idle(self, now: float = None) -> list:
+        """
+        提交并释放超过 idle_timeout 秒没有新数据的订单。
+        """
+        now = time.monotonic() if now is None else now
+        idle = [oid for oid, state in self.orders.items() if now - state.last_seen > self.idle_timeout]
+        decisions = []
+        for oid in idle:
+            decisions.extend(self.flush(oid))
+        self.orders_evicted += len(idle)
+        return decisions
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        """
+        每个点从到达到提交的延迟分位数（毫秒），例如 {'p50': ..., 'p90': ..., 'p99': ...}。
+        """
+        return {f'p{p}': self.latency.quantile(p / 100.0) for p in percentiles}
+
+    def stats(self) -> dict:
+        return {
+            'active_orders': len(self.orders),
+            'pending_points': sum(len(state.columns) for state in self.orders.values()),
+            'points_in': self.points_in,
+            'points_committed': self.points_committed,
+            'orders_evicted': self.orders_evicted,
+            'route_cache_hits': self.route_cache_hits,
+            'route_cache_misses': self.route_cache_misses,
+            **self.latency_percentiles(),
+        }
+
+
+class AsyncMatchingService:
+    """
+    OnlineMapMatcher 的 asyncio 接入层。
+
+    submit() 把点放入输入队列；后台任务把队列中积累的点（最多 batch_size 个，或等待 max_batch_delay 秒）
+    作为一个批次交给匹配器，并定期执行空闲订单淘汰。提交的结果会传给通过 add_listener 注册的回调，
+    没有注册回调时放入 output 队列，可用 `async for decision in service.decisions()` 读取。
+    flush 请求与点共用同一个输入队列，因此会在该订单之前提交的点处理完之后执行。
+    """
+
+    def __init__(self, matcher: OnlineMapMatcher, batch_size: int = 1024, max_batch_delay: float = 0.005,
+                 evict_interval: float = 5.0):
+        self.matcher = matcher
+        self.batch_size = batch_size
+        self.max_batch_delay = max_batch_delay
+        self.evict_interval = evict_interval
+        self.input = None
+        self.output = None
+        self._listeners = []
+        self._tasks = []
+
+    def add_listener(self, callback):
+        """
+        注册结果回调 callback(decisions: list)，在事件循环中同步调用。
+        """
+        self._listeners.append(callback)
+
+    def _publish(self, decisions: list):
+        if not decisions:
+            return
+        if self._listeners:
+            for callback in self._listeners:
+                callback(decisions)
+        else:
+            for decision in decisions:
+                self.output.put_nowait(decision)
+
+    async def start(self):
+        self.input = asyncio.Queue()
+        self.output = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._ingest_loop()), asyncio.create_task(self._evict_loop())]
+
+    async def submit(self, point: dict):
+        """
+        提交一个GPS点：{'order_id', 'gps_time', 'longitude', 'latitude'}。
+        """
+        point = dict(point)
+        point['_received'] = time.perf_counter()
+        await self.input.put(point)
+
+    async def flush(self, order_id=None):
+        """
+        请求提交并释放订单（默认为所有订单）的剩余点。
+        """
+        await self.input.put({'_control': 'flush', 'order_id': order_id})
+
+    async def _next_batch(self) -> list:
+        batch = [await self.input.get()]
+        deadline = time.perf_counter() + self.max_batch_delay
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self.input.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.input.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _process(self, batch: list):
+        points = []
+        for item in batch:
+            if item is _STOP:
+                break
+            if '_control' in item:
+                self._publish(self.matcher.add_points(points))
+                points = []
+                self._publish(self.matcher.flush(item['order_id']))
+            else:
+                points.append(item)
+        self._publish(self.matcher.add_points(points))
+
+    async def _ingest_loop(self):
+        while True:
+            batch = await self._next_batch()
+            self._process(batch)
+            if batch[-1] is _STOP:
+                return
+            # 让出事件循环，避免持续高负载时饿死网络读写
+            await asyncio.sleep(0)
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            self._publish(self.matcher.evict_idle())
+
+    async def decisions(self):
+        while True:
+            yield await self.output.get()
+
+    async def stop(self):
+        """
+        处理完队列中剩余的点，提交所有订单的剩余结果后停止后台任务。
+
+        接入任务不会被取消（取消可能丢失正在组批的点），而是在输入队列末尾放入停止信号，
+        等它处理完信号之前的所有点后自行退出；只有淘汰任务被取消。
+        """
+        ingest_task, evict_task = self._tasks
+        evict_task.cancel()
+        await self.input.put(_STOP)
+        try:
+            await ingest_task
+        finally:
+            await asyncio.gather(evict_task, return_exceptions=True)
+            self._tasks = []
+        self._publish(self.matcher.flush())
+
+
+async def serve_ndjson(service: AsyncMatchingService, host: str = '127.0.0.1', port: int = 8765):
+    """
+    用于本地测试的 TCP 服务：每行一个 JSON（NDJSON）。
+
+    请求:
+    - GPS点: {"order_id": ..., "gps_time": ..., "longitude": ..., "latitude": ...}
+    - 订单结束: {"type": "flush", "order_id": ...}
+    - 统计信息: {"type": "stats"}
+    响应：该连接提交过的订单的匹配结果，每个点一行 JSON；stats 请求返回一行统计信息。
+    """
+    order_writers = {}
+
+    def route(decisions: list):
+        for decision in decisions:
+            writer = order_writers.get(decision['order_id'])
+            if writer is not None and not writer.is_closing():
+                writer.write((json.dumps(decision, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    service.add_listener(route)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    writer.write(b'{"error": "invalid json"}\n')
+                    continue
+                if not isinstance(message, dict):
+                    writer.write(b'{"error": "message must be a json object"}\n')
+                    continue
+                kind = message.get('type', 'point')
+                if kind == 'flush':
+                    await service.flush(message.get('order_id'))
+                elif kind == 'stats':
+                    writer.write((json.dumps(service.matcher.stats()) + '\n').encode('utf-8'))
+                else:
+                    # 缺少字段或坐标不是数值的点直接返回错误，不能进入匹配器，否则会中断整个接入任务
+                    missing = [field for field in POINT_FIELDS if message.get(field) is None]
+                    if missing:
+                        writer.write((json.dumps({'error': 'missing fields', 'fields': missing}) + '\n').encode('utf-8'))
+                        continue
+                    if not all(isinstance(message[field], (int, float)) and not isinstance(message[field], bool)
+                               for field in ('longitude', 'latitude')):
+                        writer.write(b'{"error": "longitude and latitude must be numbers"}\n')
+                        continue
+                    order_writers[message['order_id']] = writer
+                    await service.submit(message)
+                await writer.drain()
+        finally:
+            for order_id in [oid for oid, w in order_writers.items() if w is writer]:
+                del order_writers[order_id]
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"在线匹配服务已启动: {host}:{port}")
+    return server
@@ -0,0 +1,310 @@
+import itertools
+import json
+import sqlite3
+from collections import OrderedDict
+
+import pandas as pd
+import numpy as np
+import networkx as nx
+
+from utils.geo_utils import to_local_meters
+
+
+class NodeSnapper:
+    """
+    基于规则网格的最近路网节点查询器。
+
+    节点坐标先转换到以路网平均纬度为参考的局部平面（米），再按 cell_size_meters 分桶。
+    查询时按网格单元分组，从 3×3 邻域开始逐圈扩大，直到找到的最近距离不超过
+    已覆盖的搜索半径，因此结果与暴力搜索一致。
+    """
+
+    def __init__(self, node_ids, node_lon, node_lat, cell_size_meters: float = 200.0):
+        self.node_ids = np.asarray(node_ids)
+        node_lon = np.asarray(node_lon, dtype=np.float64)
+        node_lat = np.asarray(node_lat, dtype=np.float64)
+        if len(self.node_ids) == 0:
+            raise ValueError("路网节点为空，无法构建最近节点索引。")
+
+        self.cell_size = float(cell_size_meters)
+        self.lat0 = float(np.mean(node_lat))
+        self.x, self.y = self._to_local_meters(node_lon, node_lat)
+
+        # 按网格单元排序，得到每个单元在排序数组中的区间
+        cx = np.floor(self.x / self.cell_size).astype(np.int64)
+        cy = np.floor(self.y / self.cell_size).astype(np.int64)
+        self.cx_min, self.cy_min = cx.min(), cy.min()
+        self.width = int(cx.max() - self.cx_min + 1)
+        self.height = int(cy.max() - self.cy_min + 1)
+        cell_key = (cx - self.cx_min) * self.height + (cy - self.cy_min)
+        self.order = np.argsort(cell_key, kind='stable')
+        self.sorted_keys = cell_key[self.order]
+
+    @classmethod
+    def from_graph(cls, graph, lon_attr: str = 'lon', lat_attr: str = 'lat', cell_size_meters: float = 200.0):
+        """
+        从节点带有经纬度属性的 networkx 图构建查询器（与 k_shortest_paths.py 中的图结构一致）。
+        """
+        nodes = list(graph.nodes(data=True))
+        return cls(
+            [node for node, _ in nodes],
+            [data[lon_attr] for _, data in nodes],
+            [data[lat_attr] for _, data in nodes],
+            cell_size_meters=cell_size_meters
+        )
+
+    def _to_local_meters(self, lon, lat):
+        return to_local_meters(lon, lat, self.lat0)
+
+    def _nodes_in_block(self, cx: int, cy: int, radius: int) -> np.ndarray:
+        """
+        返回以 (cx, cy) 为中心、半径为 radius 个单元的方形区域内的所有节点下标。
+        """
+        x_lo, x_hi = max(cx - radius, 0), min(cx + radius, self.width - 1)
+        y_lo, y_hi = max(cy - radius, 0), min(cy + radius, self.height - 1)
+        if x_lo > x_hi or y_lo > y_hi:
+            return np.zeros(0, dtype=np.int64)
+        columns = np.arange(x_lo, x_hi + 1)
+        lo = np.searchsorted(self.sorted_keys, columns * self.height + y_lo, side='left')
+        hi = np.searchsorted(self.sorted_keys, columns * self.height + y_hi, side='right')
+        return np.concatenate([self.order[a:b] for a, b in zip(lo, hi)])
+
+    def snap(self, lon, lat) -> tuple:
+        """
+        为一批GPS点查询最近的路网节点。
+
+        参数:
+        - lon, lat (array-like): GPS点经纬度。
+
+        返回:
+        - tuple: (最近节点ID数组, 到最近节点的距离数组（米）)。
+        """
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        px, py = self._to_local_meters(lon, lat)
+        pcx = np.floor(px / self.cell_size).astype(np.int64) - self.cx_min
+        pcy = np.floor(py / self.cell_size).astype(np.int64) - self.cy_min
+
+        nearest = np.zeros(len(lon), dtype=np.int64)
+        distance = np.full(len(lon), np.inf)
+        max_radius = max(self.width, self.height) + int(max(np.abs(pcx).max(initial=0), np.abs(pcy).max(initial=0)))
+
+        # 同一网格单元中的点共用候选节点集合
+        point_keys = np.stack([pcx, pcy], axis=1)
+        unique_cells, inverse = np.unique(point_keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        # 按单元编号排序一次，每个单元的点就是排序数组中的一段连续区间
+        point_order = np.argsort(inverse, kind='stable')
+        cell_end = np.cumsum(np.bincount(inverse, minlength=len(unique_cells)))
+        cell_start = np.concatenate([[0], cell_end[:-1]])
+        for cell_index, (cx, cy) in enumerate(unique_cells):
+            members = point_order[cell_start[cell_index]:cell_end[cell_index]]
+            radius = 1
+            while True:
+                candidates = self._nodes_in_block(int(cx), int(cy), radius)
+                if len(candidates) > 0:
+                    d2 = ((px[members, None] - self.x[candidates]) ** 2 +
+                          (py[members, None] - self.y[candidates]) ** 2)
+                    best = np.argmin(d2, axis=1)
+                    best_dist = np.sqrt(d2[np.arange(len(members)), best])
+                    # 已覆盖半径内的最近距离即为全局最近距离
+                    if best_dist.max() <= radius * self.cell_size or radius >= max_radius:
+                        nearest[members] = candidates[best]
+                        distance[members] = best_dist
+                        break
+                radius += 1
+
+        return self.node_ids[nearest], distance
+
+
+def _json_default(value):
+    """
+    json.dumps 的回调：把 numpy 标量（例如从 NodeSnapper.snap 得到的 np.int64 节点ID）转换为 Python 原生类型。
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化为JSON的类型: {type(value).__name__}")
+
+
+class PathCandidateService:
+    """
+    以吸附后的 (起点节点, 终点节点) 为键的 k 条最短路径候选服务。
+
+    结果先查有界的内存 LRU 缓存，再查可选的 SQLite 持久化存储，都未命中时才调用
+    nx.shortest_simple_paths 计算，并回写两级缓存。对无向图，(u, v) 与 (v, u)
+    共用同一条缓存记录。每条结果为 [(节点序列, 路径长度), ...]，找不到路径时为空列表。
+    graph 也可以是 SimplifiedRoutingGraph，此时在简化图上路由，返回的仍是原始节点序列。
+    """
+
+    def __init__(self, graph, k: int = 4, weight: str = 'weight', cache_size: int = 100000, store_path: str = None):
+        self.graph = graph
+        self.k = k
+        self.weight = weight
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.requests = 0
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+        self.store = None
+        if store_path is not None:
+            self.store = sqlite3.connect(store_path)
+            self.store.execute(
+                "CREATE TABLE IF NOT EXISTS path_candidates ("
+                "source TEXT, target TEXT, k INTEGER, weight TEXT, paths TEXT, "
+                "PRIMARY KEY (source, target, k, weight))"
+            )
+            self.store.commit()
+
+    def _key(self, source, target) -> tuple:
+        """
+        生成缓存键；无向图的键与方向无关，返回 (键, 是否需要反转路径)。
+        """
+        if not self.graph.is_directed() and repr(target) < repr(source):
+            return (target, source), True
+        return (source, target), False
+
+    def _compute(self, source, target) -> list:
+        if hasattr(self.graph, 'k_shortest_paths'):
+            return self.graph.k_shortest_paths(source, target, self.k)
+        try:
+            paths_generator = nx.shortest_simple_paths(self.graph, source=source, target=target, weight=self.weight)
+            paths = list(itertools.islice(paths_generator, self.k))
+        except nx.NetworkXNoPath:
+            return []
+        return [(path, nx.path_weight(self.graph, path, weight=self.weight)) for path in paths]
+
+    def _store_get(self, key):
+        row = self.store.execute(
+            "SELECT paths FROM path_candidates WHERE source = ? AND target = ? AND k = ? AND weight = ?",
+            (json.dumps(key[0], default=_json_default), json.dumps(key[1], default=_json_default), self.k, self.weight)
+        ).fetchone()
+        if row is None:
+            return None
+        return [(path, length) for path, length in json.loads(row[0])]
+
+    def _store_put(self, key, paths):
+        self.store.execute(
+            "INSERT OR REPLACE INTO path_candidates (source, target, k, weight, paths) VALUES (?, ?, ?, ?, ?)",
+            (json.dumps(key[0], default=_json_default), json.dumps(key[1], default=_json_default), self.k, self.weight,
+             json.dumps(paths, default=_json_default))
+        )
+
+    def get_paths(self, source, target) -> list:
+        """
+        获取两个节点之间的 k 条最短路径。
+
+        参数:
+        - source, target: 路网节点ID。
+
+        返回:
+        - list: [(节点序列, 路径长度), ...]，按长度从短到长排列。
+        """
+        self.requests += 1
+        # numpy 标量与 Python 原生类型的 repr 不同，统一后同一节点对只对应一条缓存记录
+        if isinstance(source, np.generic):
+            source = source.item()
+        if isinstance(target, np.generic):
+            target = target.item()
+        if source == target:
+            return [([source], 0.0)]
+
+        key, reverse = self._key(source, target)
+        paths = self.cache.get(key)
+        if paths is not None:
+            self.memory_hits += 1
+            self.cache.move_to_end(key)
+        else:
+            if self.store is not None:
+                paths = self._store_get(key)
+            if paths is not None:
+                self.store_hits += 1
+            else:
+                self.misses += 1
+                paths = self._compute(*key)
+                if self.store is not None:
+                    self._store_put(key, paths)
+            self.cache[key] = paths
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        if reverse:
+            return [(path[::-1], length) for path, length in paths]
+        return [(list(path), length) for path, length in paths]
+
+    def stats(self) -> dict:
+        """
+        返回缓存命中统计。
+        """
+        hits = self.memory_hits + self.store_hits
+        return {
+            'requests': self.requests,
+            'memory_hits': self.memory_hits,
+            'store_hits': self.store_hits,
+            'misses': self.misses,
+            'hit_rate': hits / (hits + self.misses) if hits + self.misses else 0.0,
+            'cached_pairs': len(self.cache),
+        }
+
+    def flush(self):
+        """
+        将持久化存储中的改动提交到磁盘。
+        """
+        if self.store is not None:
+            self.store.commit()
+
+    def close(self):
+        if self.store is not None:
+            self.store.commit()
+            self.store.close()
+            self.store = None
+
+
+def build_path_candidates(df: pd.DataFrame, service: PathCandidateService, snapper: NodeSnapper) -> pd.DataFrame:
+    """
+    为每个订单中相邻的GPS点对生成多条最短路径候选。
+
+    GPS点先被吸附到最近的路网节点，相邻两点吸附到同一节点时跳过；
+    其余点对通过 service 查询（命中缓存时不会重复计算）。
+
+    参数:
+    - df (pd.DataFrame): GPS数据，必须包含列: ['order_id', 'gps_time', 'longitude', 'latitude']。
+    - service (PathCandidateService): 路径候选服务。
+    - snapper (NodeSnapper): 最近节点查询器。
+
+    返回:
+    - pd.DataFrame: 列为 ['order_id', 'from_index', 'to_index', 'source_node', 'target_node',
+      'path_rank', 'path_length', 'path_nodes']，其中 from_index/to_index 为点在订单内的序号。
+    """
+    required_columns = ['order_id', 'gps_time', 'longitude', 'latitude']
+    if not all(col in df.columns for col in required_columns):
+        raise KeyError(f"输入DataFrame中缺少必需的列。需要 {required_columns}。")
+
+    data = df.sort_values(by=['order_id', 'gps_time']).reset_index(drop=True)
+    node_array, _ = snapper.snap(data['longitude'].to_numpy(), data['latitude'].to_numpy())
+    nodes = node_array.tolist()
+    order_ids = data['order_id'].to_numpy()
+    point_index = data.groupby('order_id').cumcount().to_numpy()
+
+    # 相邻点对：同一订单且吸附节点不同
+    pair_mask = (order_ids[1:] == order_ids[:-1]) & (node_array[1:] != node_array[:-1])
+    rows = []
+    for i in np.flatnonzero(pair_mask):
+        for rank, (path, length) in enumerate(service.get_paths(nodes[i], nodes[i + 1])):
+            rows.append({
+                'order_id': order_ids[i],
+                'from_index': point_index[i],
+                'to_index': point_index[i + 1],
+                'source_node': nodes[i],
+                'target_node': nodes[i + 1],
+                'path_rank': rank,
+                'path_length': length,
+                'path_nodes': path,
+            })
+    service.flush()
+
+    stats = service.stats()
+    print(f"路径候选生成完成：{int(pair_mask.sum())} 个点对，缓存命中率 {stats['hit_rate']:.2%}。")
+    return pd.DataFrame(rows, columns=['order_id', 'from_index', 'to_index', 'source_node', 'target_node',
+                                       'path_rank', 'path_length', 'path_nodes'])
@@ -0,0 +1,165 @@
+import pandas as pd
+import numpy as np
+
+from utils.geo_utils import to_local_meters
+
+
+def project_points_to_polyline(point_lon, point_lat, line_lon, line_lat, chunk_size: int = 2048) -> dict:
+    """
+    将一组GPS点批量投影到一条折线（匹配路径）上，计算线性参考位置和垂直误差。
+
+    所有点与折线的所有线段一次性做向量化计算：先用线段数组求每个点在每条线段上的
+    投影参数 t（截断到 [0, 1]），再取距离最小的线段，最后结合线段的累计长度得到
+    该点沿折线的偏移量。为控制内存，点会按 chunk_size 分块处理。
+
+    参数:
+    - point_lon, point_lat (array-like): 待投影的GPS点经纬度，长度为 n。
+    - line_lon, line_lat (array-like): 折线顶点的经纬度（按顺序），长度为 m。
+    - chunk_size (int): 每次参与广播计算的点数，默认为 2048。
+
+    返回:
+    - dict: 包含以下长度为 n 的数组：
+      'offset_m'      点的投影位置距折线起点的沿线距离（米）；
+      'error_m'       点到折线的垂直（最近）距离（米）；
+      'segment_index' 投影所在线段的序号（第 i 段连接顶点 i 和 i+1）；
+      'proj_lon', 'proj_lat' 投影点的经纬度。
+      如果折线为空，所有结果均为 NaN（segment_index 为 -1）。
+    """
+    point_lon = np.asarray(point_lon, dtype=np.float64)
+    point_lat = np.asarray(point_lat, dtype=np.float64)
+    line_lon = np.asarray(line_lon, dtype=np.float64)
+    line_lat = np.asarray(line_lat, dtype=np.float64)
+
+    n = len(point_lon)
+    m = len(line_lon)
+
+    result = {
+        'offset_m': np.full(n, np.nan),
+        'error_m': np.full(n, np.nan),
+        'segment_index': np.full(n, -1, dtype=np.int64),
+        'proj_lon': np.full(n, np.nan),
+        'proj_lat': np.full(n, np.nan),
+    }
+    if n == 0 or m == 0:
+        return result
+
+    # 1. 以折线的平均纬度为参考，将点和折线都转换到局部平面坐标
+    lat0 = float(np.mean(line_lat))
+    px, py = to_local_meters(point_lon, point_lat, lat0)
+    lx, ly = to_local_meters(line_lon, line_lat, lat0)
+
+    # 只有一个顶点的折线退化为一个点
+    if m == 1:
+        lx = np.repeat(lx, 2)
+        ly = np.repeat(ly, 2)
+
+    # 2. 构建线段数组：起点 A、方向向量 d、长度平方和累计长度
+    ax, ay = lx[:-1], ly[:-1]
+    dx, dy = lx[1:] - ax, ly[1:] - ay
+    seg_len2 = dx * dx + dy * dy
+    seg_len = np.sqrt(seg_len2)
+    cum_len = np.concatenate(([0.0], np.cumsum(seg_len)[:-1]))
+    # 零长度线段的 t 恒为 0，用 1 代替分母避免除零
+    safe_len2 = np.where(seg_len2 > 0, seg_len2, 1.0)
+
+    # 3. 分块进行 (点 × 线段) 的广播计算
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        cx = px[start:end, None]
+        cy = py[start:end, None]
+
+        t = ((cx - ax) * dx + (cy - ay) * dy) / safe_len2
+        t = np.clip(t, 0.0, 1.0)
+        qx = ax + t * dx
+        qy = ay + t * dy
+        dist2 = (cx - qx) ** 2 + (cy - qy) ** 2
+
+        best = np.argmin(dist2, axis=1)
+        rows = np.arange(end - start)
+        best_t = t[rows, best]
+
+        result['segment_index'][start:end] = best
+        result['error_m'][start:end] = np.sqrt(dist2[rows, best])
+        result['offset_m'][start:end] = cum_len[best] + best_t * seg_len[best]
+        result['proj_lon'][start:end] = line_lon[best] + best_t * (line_lon[np.minimum(best + 1, m - 1)] - line_lon[best])
+        result['proj_lat'][start:end] = line_lat[best] + best_t * (line_lat[np.minimum(best + 1, m - 1)] - line_lat[best])
+
+    return result
+
+
+def project_orders_to_routes(points_df: pd.DataFrame, route_df: pd.DataFrame, chunk_size: int = 2048) -> pd.DataFrame:
+    """
+    按订单将原始GPS点投影到对应的匹配路径上，得到逐点的线性参考位置和误差。
+
+    OSRM 输出的 'point_sequence' 来自 overview 几何，与原始GPS点并不是一一对应的，
+    因此不能按下标截断后逐点比较。此函数把每个订单的匹配点序列视为一条折线，
+    将该订单的所有原始点投影到折线上，误差即点到折线的垂直距离。
+
+    参数:
+    - points_df (pd.DataFrame): 原始GPS点。
+      必须包含列: ['order_id', 'longitude', 'latitude']。
+    - route_df (pd.DataFrame): 匹配路径点。
+      必须包含列: ['order_id', 'point_sequence', 'matched_longitude', 'matched_latitude']。
+    - chunk_size (int): 传递给 project_points_to_polyline 的分块大小。
+
+    返回:
+    - pd.DataFrame: 与 points_df 索引对齐的新DataFrame，包含列
+      ['route_offset_m', 'projection_error_m', 'segment_index', 'projected_longitude', 'projected_latitude']。
+      没有匹配路径的订单，其结果为 NaN（segment_index 为 -1）。
+    """
+    # 检查必需的列是否存在
+    required_points = ['order_id', 'longitude', 'latitude']
+    if not all(col in points_df.columns for col in required_points):
+        raise KeyError(f"points_df中缺少必需的列。需要 {required_points}。")
+    required_route = ['order_id', 'point_sequence', 'matched_longitude', 'matched_latitude']
+    if not all(col in route_df.columns for col in required_route):
+        raise KeyError(f"route_df中缺少必需的列。需要 {required_route}。")
+
+    n = len(points_df)
+    offset = np.full(n, np.nan)
+    error = np.full(n, np.nan)
+    segment = np.full(n, -1, dtype=np.int64)
+    proj_lon = np.full(n, np.nan)
+    proj_lat = np.full(n, np.nan)
+
+    # 1. 对匹配路径按订单和序号排序，用 searchsorted 得到每个订单在数组中的区间
+    route = route_df.sort_values(by=['order_id', 'point_sequence'])
+    route_orders = route['order_id'].to_numpy()
+    route_lon = route['matched_longitude'].to_numpy(dtype=np.float64)
+    route_lat = route['matched_latitude'].to_numpy(dtype=np.float64)
+
+    # 2. 对原始点按订单做稳定排序（保持订单内的原有顺序），记录回写位置
+    point_orders = points_df['order_id'].to_numpy()
+    order_idx = np.argsort(point_orders, kind='stable')
+    sorted_orders = point_orders[order_idx]
+    point_lon = points_df['longitude'].to_numpy(dtype=np.float64)[order_idx]
+    point_lat = points_df['latitude'].to_numpy(dtype=np.float64)[order_idx]
+
+    unique_orders, starts = np.unique(sorted_orders, return_index=True)
+    ends = np.append(starts[1:], len(sorted_orders))
+    route_starts = np.searchsorted(route_orders, unique_orders, side='left')
+    route_ends = np.searchsorted(route_orders, unique_orders, side='right')
+
+    # 3. 逐订单做批量投影（订单内部完全向量化）
+    for p_start, p_end, r_start, r_end in zip(starts, ends, route_starts, route_ends):
+        if r_end <= r_start:
+            continue
+        projected = project_points_to_polyline(
+            point_lon[p_start:p_end], point_lat[p_start:p_end],
+            route_lon[r_start:r_end], route_lat[r_start:r_end],
+            chunk_size=chunk_size
+        )
+        target = order_idx[p_start:p_end]
+        offset[target] = projected['offset_m']
+        error[target] = projected['error_m']
+        segment[target] = projected['segment_index']
+        proj_lon[target] = projected['proj_lon']
+        proj_lat[target] = projected['proj_lat']
+
+    return pd.DataFrame({
+        'route_offset_m': offset,
+        'projection_error_m': error,
+        'segment_index': segment,
+        'projected_longitude': proj_lon,
+        'projected_latitude': proj_lat,
+    }, index=points_df.index)
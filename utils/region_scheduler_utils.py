@@ -0,0 +1,257 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import numpy as np
+
+from utils.shared_network_utils import init_worker, get_worker_network
+
+# 工作进程中当前正在处理的区域：{'tile', 'bbox', 'edge_index'}
+_CURRENT_REGION = None
+# 工作进程是否挂载了共享路网
+_HAS_NETWORK = False
+
+
+def compute_order_tiles(df: pd.DataFrame, tile_size_deg: float = 0.02, halo_deg: float = 0.005) -> pd.DataFrame:
+    """
+    按订单轨迹的外包框把订单分配到全局网格瓦片上。
+
+    瓦片编号与 tile_network_utils.split_bbox_into_tiles 一致，为
+    (floor(lon / tile_size_deg), floor(lat / tile_size_deg))，订单归属于其外包框中心所在的瓦片。
+
+    参数:
+    - df (pd.DataFrame): GPS点数据，必须包含列 ['order_id', 'longitude', 'latitude']。
+    - tile_size_deg (float): 瓦片边长（度）。
+    - halo_deg (float): 瓦片外扩的缓冲带宽度（度）。
+
+    返回:
+    - pd.DataFrame: 以 order_id 为索引，包含列
+      ['n_points', 'west', 'south', 'east', 'north', 'ix', 'iy', 'crosses_tile', 'within_halo']。
+      crosses_tile 表示订单越出了所在瓦片，within_halo 表示订单仍在瓦片加缓冲带的范围内。
+    """
+    # 检查必需的列是否存在
+    required_columns = ['order_id', 'longitude', 'latitude']
+    if not all(col in df.columns for col in required_columns):
+        raise KeyError(f"DataFrame中缺少必需的列。需要 {required_columns}。")
+
+    orders = df.groupby('order_id').agg(
+        n_points=('longitude', 'size'),
+        west=('longitude', 'min'),
+        south=('latitude', 'min'),
+        east=('longitude', 'max'),
+        north=('latitude', 'max'),
+    )
+    center_lon = (orders['west'] + orders['east']) / 2
+    center_lat = (orders['south'] + orders['north']) / 2
+    orders['ix'] = np.floor(center_lon / tile_size_deg).astype(np.int64)
+    orders['iy'] = np.floor(center_lat / tile_size_deg).astype(np.int64)
+
+    tile_west = orders['ix'] * tile_size_deg
+    tile_south = orders['iy'] * tile_size_deg
+    orders['crosses_tile'] = ((orders['west'] < tile_west) | (orders['east'] > tile_west + tile_size_deg) |
+                              (orders['south'] < tile_south) | (orders['north'] > tile_south + tile_size_deg))
+    orders['within_halo'] = ((orders['west'] >= tile_west - halo_deg) &
+                             (orders['east'] <= tile_west + tile_size_deg + halo_deg) &
+                             (orders['south'] >= tile_south - halo_deg) &
+                             (orders['north'] <= tile_south + tile_size_deg + halo_deg))
+    return orders
+
+
+def build_tile_tasks(order_tiles: pd.DataFrame, tile_size_deg: float = 0.02, halo_deg: float = 0.005,
+                     max_points_per_task: int = None) -> list:
+    """
+    将同一瓦片的订单合并为一个任务，并确定该任务需要的路网范围。
+
+    - 所有订单都在瓦片内部时，任务范围就是瓦片本身；
+    - 有越界订单时，范围为瓦片加缓冲带，并进一步扩大到覆盖所有越界订单的外包框
+      （极少数超长订单会让该任务的路网子集变大，但结果仍然正确）。
+    点数超过 max_points_per_task 的热点瓦片会拆成多个共享同一范围的任务，避免单个任务拖慢整体。
+    任务按点数从多到少排序（最长任务优先），便于进程池均衡负载。
+
+    参数:
+    - order_tiles (pd.DataFrame): compute_order_tiles 的返回值。
+    - tile_size_deg, halo_deg (float): 与 compute_order_tiles 相同。
+    - max_points_per_task (int): 单个任务的最大点数，默认为 None（不拆分）。
+
+    返回:
+    - list: [{'task_id', 'tile', 'bbox', 'order_ids', 'n_points', 'n_crossing'}, ...]。
+    """
+    tasks = []
+    for (ix, iy), group in order_tiles.groupby(['ix', 'iy'], sort=True):
+        west, south = ix * tile_size_deg, iy * tile_size_deg
+        bbox = [west, south, west + tile_size_deg, south + tile_size_deg]
+        crossing = group[group['crosses_tile']]
+        if len(crossing) > 0:
+            bbox = [min(bbox[0] - halo_deg, crossing['west'].min()), min(bbox[1] - halo_deg, crossing['south'].min()),
+                    max(bbox[2] + halo_deg, crossing['east'].max()), max(bbox[3] + halo_deg, crossing['north'].max())]
+
+        # 按点数累计切分热点瓦片
+        points = group['n_points'].to_numpy()
+        if max_points_per_task is None:
+            part = np.zeros(len(group), dtype=np.int64)
+        else:
+            part = (np.cumsum(points) - points) // max_points_per_task
+        for p in np.unique(part):
+            members = part == p
+            tasks.append({
+                'tile': (int(ix), int(iy)),
+                'bbox': tuple(float(v) for v in bbox),
+                'order_ids': group.index[members].tolist(),
+                'n_points': int(points[members].sum()),
+                'n_crossing': int(group['crosses_tile'].to_numpy()[members].sum()),
+            })
+
+    tasks.sort(key=lambda task: task['n_points'], reverse=True)
+    for task_id, task in enumerate(tasks):
+        task['task_id'] = task_id
+    return tasks
+
+
+def get_current_region() -> dict:
+    """
+    在匹配函数中获取当前任务的区域信息：
+    {'tile': (ix, iy), 'bbox': (west, south, east, north), 'edge_index': 区域内的边下标或 None}。
+    edge_index 只有在调度器传入 network_handle 时才会计算，对应 get_worker_network() 中的边。
+    """
+    return _CURRENT_REGION
+
+
+def _init_scheduler_worker(network_handle: dict = None):
+    global _HAS_NETWORK
+    if network_handle is not None:
+        init_worker(network_handle)
+        _HAS_NETWORK = True
+
+
+def _run_tile_task(task: dict, task_df: pd.DataFrame, match_fn) -> dict:
+    """
+    在工作进程中依次匹配一个任务的所有订单，并记录耗时。
+    """
+    global _CURRENT_REGION
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    edge_index = get_worker_network().edges_in_bbox(task['bbox']) if _HAS_NETWORK else None
+    _CURRENT_REGION = {'tile': task['tile'], 'bbox': task['bbox'], 'edge_index': edge_index}
+
+    rows = []
+    for order_id, order_df in task_df.groupby('order_id', sort=False):
+        result = match_fn(order_id, order_df)
+        if result:
+            rows.extend(result)
+    _CURRENT_REGION = None
+
+    return {
+        'task_id': task['task_id'],
+        'rows': rows,
+        'seconds': time.perf_counter() - wall_start,
+        'cpu_seconds': time.process_time() - cpu_start,
+        'pid': os.getpid(),
+        'n_edges': -1 if edge_index is None else len(edge_index),
+    }
+
+
+def summarize_schedule(report: pd.DataFrame, wall_seconds: float) -> dict:
+    """
+    根据每个任务的耗时汇总吞吐量和负载均衡情况。
+
+    返回:
+    - dict: 'total_points', 'wall_seconds', 'points_per_sec'（总点数 / 总墙钟时间）,
+      'n_workers', 'worker_imbalance'（最忙进程耗时 / 平均进程耗时，1 表示完全均衡）,
+      'tile_points_cv'（各瓦片点数的变异系数）。
+    """
+    worker_busy = report.groupby('pid')['seconds'].sum()
+    tile_points = report.groupby(['ix', 'iy'])['n_points'].sum()
+    total_points = int(report['n_points'].sum())
+    return {
+        'total_points': total_points,
+        'wall_seconds': wall_seconds,
+        'points_per_sec': total_points / wall_seconds if wall_seconds > 0 else float('nan'),
+        'n_workers': int(len(worker_busy)),
+        'worker_imbalance': float(worker_busy.max() / worker_busy.mean()) if len(worker_busy) else float('nan'),
+        'tile_points_cv': float(tile_points.std(ddof=0) / tile_points.mean()) if len(tile_points) else float('nan'),
+    }
+
+
+def run_region_scheduler(df: pd.DataFrame, match_fn, tile_size_deg: float = 0.02, halo_deg: float = 0.005,
+                         max_workers: int = None, max_points_per_task: int = None,
+                         network_handle: dict = None) -> tuple:
+    """
+    按空间瓦片并行执行逐订单的地图匹配。
+
+    订单先按外包框分配到瓦片（越界订单使用瓦片加缓冲带的范围），同一瓦片的订单作为一个任务
+    交给同一个工作进程连续处理，使该进程访问的路网子集保持在缓存中。
+    传入 network_handle（SharedRoadNetwork.publish() 后的 handle）时，工作进程会零拷贝挂载共享路网，
+    匹配函数可以通过 get_worker_network() 和 get_current_region()['edge_index'] 只访问本区域的路段。
+
+    参数:
+    - df (pd.DataFrame): GPS点数据，必须包含列 ['order_id', 'longitude', 'latitude']。
+    - match_fn (callable): match_fn(order_id, order_df) -> 结果行（dict）的列表，需为模块级函数以便多进程序列化。
+    - tile_size_deg, halo_deg (float): 瓦片边长和缓冲带宽度（度）。
+    - max_workers (int): 进程数，默认为CPU核数；为 1 时在当前进程中顺序执行。
+    - max_points_per_task (int): 单个任务的最大点数，见 build_tile_tasks。
+    - network_handle (dict): 可选的共享路网 handle。
+
+    返回:
+    - tuple: (results_df, report_df, summary)。
+      results_df 为所有订单的结果行，按 order_id 排序；
+      report_df 为每个任务一行的统计，列 ['task_id', 'ix', 'iy', 'n_orders', 'n_points', 'n_crossing',
+      'n_edges', 'seconds', 'cpu_seconds', 'points_per_sec', 'pid']；
+      summary 为 summarize_schedule 的返回值。
+    """
+    order_tiles = compute_order_tiles(df, tile_size_deg, halo_deg)
+    tasks = build_tile_tasks(order_tiles, tile_size_deg, halo_deg, max_points_per_task)
+    n_outside_halo = int((order_tiles['crosses_tile'] & ~order_tiles['within_halo']).sum())
+    print(f"共 {len(order_tiles)} 个订单，分配到 {order_tiles.groupby(['ix', 'iy']).ngroups} 个瓦片、{len(tasks)} 个任务；"
+          f"{int(order_tiles['crosses_tile'].sum())} 个订单跨瓦片（其中 {n_outside_halo} 个超出缓冲带）。")
+
+    positions = df.groupby('order_id').indices
+    task_frames = [df.iloc[np.concatenate([positions[order_id] for order_id in task['order_ids']])]
+                   for task in tasks]
+
+    wall_start = time.perf_counter()
+    outputs = []
+    if max_workers == 1:
+        _init_scheduler_worker(network_handle)
+        for task, task_df in zip(tasks, task_frames):
+            outputs.append(_run_tile_task(task, task_df, match_fn))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_scheduler_worker,
+                                 initargs=(network_handle,)) as executor:
+            futures = [executor.submit(_run_tile_task, task, task_df, match_fn)
+                       for task, task_df in zip(tasks, task_frames)]
+            for future in as_completed(futures):
+                output = future.result()
+                task = tasks[output['task_id']]
+                print(f"任务 {output['task_id']} 完成：瓦片 {task['tile']}，{task['n_points']} 个点，"
+                      f"耗时 {output['seconds']:.2f} 秒。")
+                outputs.append(output)
+    wall_seconds = time.perf_counter() - wall_start
+
+    # 汇总结果和每个任务的统计
+    rows = [row for output in sorted(outputs, key=lambda o: o['task_id']) for row in output['rows']]
+    results_df = pd.DataFrame(rows)
+    if 'order_id' in results_df.columns:
+        results_df = results_df.sort_values(by='order_id', kind='stable').reset_index(drop=True)
+
+    report_df = pd.DataFrame([{
+        'task_id': output['task_id'],
+        'ix': tasks[output['task_id']]['tile'][0],
+        'iy': tasks[output['task_id']]['tile'][1],
+        'n_orders': len(tasks[output['task_id']]['order_ids']),
+        'n_points': tasks[output['task_id']]['n_points'],
+        'n_crossing': tasks[output['task_id']]['n_crossing'],
+        'n_edges': output['n_edges'],
+        'seconds': output['seconds'],
+        'cpu_seconds': output['cpu_seconds'],
+        'points_per_sec': tasks[output['task_id']]['n_points'] / output['seconds'] if output['seconds'] > 0 else np.nan,
+        'pid': output['pid'],
+    } for output in outputs]).sort_values(by='task_id').reset_index(drop=True)
+
+    summary = summarize_schedule(report_df, wall_seconds)
+    print(f"调度完成：{summary['total_points']} 个点，耗时 {wall_seconds:.2f} 秒，"
+          f"吞吐量 {summary['points_per_sec']:.1f} 点/秒；{summary['n_workers']} 个进程，"
+          f"负载不均衡度 {summary['worker_imbalance']:.2f}（最忙进程 / 平均），"
+          f"瓦片点数变异系数 {summary['tile_points_cv']:.2f}。")
+    return results_df, report_df, summary
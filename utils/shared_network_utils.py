@@ -0,0 +1,417 @@
+import json
+import os
+import sys
+from multiprocessing import shared_memory
+
+import pandas as pd
+import numpy as np
+
+from utils.geo_utils import to_local_meters, point_to_segment_distance
+
+# 共享内存块中每个数组的起始偏移按 64 字节对齐
+_ALIGNMENT = 64
+
+# 工作进程中通过 init_worker 挂载的路网
+_WORKER_NETWORK = None
+
+
+def _parse_linestrings(wkt_series: pd.Series) -> tuple:
+    """
+    批量解析 LINESTRING 的WKT字符串，返回 (每条线的顶点数, 顶点经度数组, 顶点纬度数组)。
+    """
+    body = wkt_series.str.replace(r'^[^(]*\(\s*|\s*\)\s*$', '', regex=True)
+    coords = body.str.split(',')
+    counts = coords.str.len().to_numpy(dtype=np.int64)
+    points = coords.explode().str.strip().str.split(r'\s+', expand=True)
+    return counts, points[0].to_numpy(dtype=np.float64), points[1].to_numpy(dtype=np.float64)
+
+
+def build_network_arrays(nodes_df: pd.DataFrame, edges_df: pd.DataFrame, cell_size_meters: float = 100.0) -> tuple:
+    """
+    将 road_network_nodes.csv / road_network_edges.csv 结构的节点表和边表整理为一组扁平的NumPy数组，
+    便于一次性发布到共享内存或 .npy 文件中。
+
+    参数:
+    - nodes_df (pd.DataFrame): 节点表，必须包含列 ['osmid', 'x', 'y']。
+    - edges_df (pd.DataFrame): 边表，必须包含列 ['u', 'v', 'osmid']，可选 'length' 和 'geometry'（WKT）。
+      缺少 geometry 的边以 u -> v 的直线代替。
+    - cell_size_meters (float): 线段网格索引的单元边长（米）。
+
+    返回:
+    - tuple: (arrays, meta)。arrays 包含：
+      节点 'node_ids', 'node_lon', 'node_lat'；
+      CSR 邻接 'adj_indptr', 'adj_indices'（终点节点下标）, 'adj_weight', 'adj_edge'（边下标）；
+      边 'edge_u', 'edge_v'（节点下标）, 'edge_osmid', 'edge_length'；
+      线段 'seg_edge', 'seg_lon0', 'seg_lat0', 'seg_lon1', 'seg_lat1'，
+      以及线段起点在所属边上的相对位置 'seg_offset' 和线段占该边长度的比例 'seg_share'（均在 0~1 之间）；
+      网格索引 'grid_keys'（有序的非空单元编号）, 'grid_indptr', 'grid_segments'。
+      meta 为网格参数 {'lat0', 'cell_size', 'cx_min', 'cy_min', 'height'}。
+    """
+    if not all(col in nodes_df.columns for col in ['osmid', 'x', 'y']):
+        raise KeyError("nodes_df中缺少必需的列。需要 ['osmid', 'x', 'y']。")
+    if not all(col in edges_df.columns for col in ['u', 'v', 'osmid']):
+        raise KeyError("edges_df中缺少必需的列。需要 ['u', 'v', 'osmid']。")
+
+    # 1. 节点：按 osmid 排序，节点下标即排序后的位置
+    nodes = nodes_df.drop_duplicates(subset='osmid').sort_values(by='osmid')
+    node_ids = nodes['osmid'].to_numpy(dtype=np.int64)
+    node_lon = nodes['x'].to_numpy(dtype=np.float64)
+    node_lat = nodes['y'].to_numpy(dtype=np.float64)
+
+    # 2. 边：丢弃端点不在节点表中的边
+    u_ids = edges_df['u'].to_numpy(dtype=np.int64)
+    v_ids = edges_df['v'].to_numpy(dtype=np.int64)
+    u_idx = np.clip(np.searchsorted(node_ids, u_ids), 0, len(node_ids) - 1)
+    v_idx = np.clip(np.searchsorted(node_ids, v_ids), 0, len(node_ids) - 1)
+    valid = (node_ids[u_idx] == u_ids) & (node_ids[v_idx] == v_ids)
+    if not valid.all():
+        print(f"警告: {int((~valid).sum())} 条边的端点不在节点表中，已忽略。")
+    edges = edges_df[valid]
+    edge_u, edge_v = u_idx[valid], v_idx[valid]
+    # 未简化路网中每条边只有一个 osmid；无法解析为整数的记为 -1
+    edge_osmid = pd.to_numeric(edges['osmid'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+
+    if 'geometry' in edges.columns:
+        geometry = edges['geometry'].astype(object).where(edges['geometry'].notna(), None)
+    else:
+        geometry = pd.Series([None] * len(edges), index=edges.index, dtype=object)
+    missing = geometry.isna().to_numpy()
+    straight = [f'LINESTRING ({float(node_lon[a])!r} {float(node_lat[a])!r}, '
+                f'{float(node_lon[b])!r} {float(node_lat[b])!r})'
+                for a, b in zip(edge_u[missing], edge_v[missing])]
+    geometry[missing] = straight
+
+    # 3. 线段：每条有 c 个顶点的边产生 c - 1 条线段
+    counts, vertex_lon, vertex_lat = _parse_linestrings(geometry.astype(str))
+    is_last = np.zeros(len(vertex_lon), dtype=bool)
+    is_last[np.cumsum(counts) - 1] = True
+    starts = np.flatnonzero(~is_last)
+    seg_edge = np.repeat(np.arange(len(edges), dtype=np.int64), counts - 1)
+    seg_lon0, seg_lat0 = vertex_lon[starts], vertex_lat[starts]
+    seg_lon1, seg_lat1 = vertex_lon[starts + 1], vertex_lat[starts + 1]
+
+    lat0 = float(np.mean(node_lat))
+    x0, y0 = to_local_meters(seg_lon0, seg_lat0, lat0)
+    x1, y1 = to_local_meters(seg_lon1, seg_lat1, lat0)
+    seg_length = np.hypot(x1 - x0, y1 - y0)
+    geometry_length = np.bincount(seg_edge, weights=seg_length, minlength=len(edges))
+    if 'length' in edges.columns:
+        edge_length = edges['length'].to_numpy(dtype=np.float64)
+    else:
+        edge_length = geometry_length
+    # 线段在边上的相对位置，投影点沿边的距离 = (seg_offset + t * seg_share) * edge_length
+    seg_before = np.cumsum(seg_length) - seg_length
+    seg_before = seg_before - np.repeat(seg_before[np.cumsum(counts - 1) - (counts - 1)], counts - 1)
+    edge_scale = np.divide(1.0, geometry_length, out=np.zeros(len(edges)), where=geometry_length > 0)
+    seg_offset = seg_before * edge_scale[seg_edge]
+    seg_share = seg_length * edge_scale[seg_edge]
+
+    # 4. CSR 邻接：按起点节点排序
+    adj_order = np.argsort(edge_u, kind='stable')
+    adj_indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_u, minlength=len(node_ids)), out=adj_indptr[1:])
+
+    # 5. 线段网格索引：每条线段登记到其外包框覆盖的所有网格单元
+    cx0 = np.floor(np.minimum(x0, x1) / cell_size_meters).astype(np.int64)
+    cx1 = np.floor(np.maximum(x0, x1) / cell_size_meters).astype(np.int64)
+    cy0 = np.floor(np.minimum(y0, y1) / cell_size_meters).astype(np.int64)
+    cy1 = np.floor(np.maximum(y0, y1) / cell_size_meters).astype(np.int64)
+    cx_min = int(cx0.min(initial=0))
+    cy_min = int(cy0.min(initial=0))
+    height = int(cy1.max(initial=0)) - cy_min + 1
+
+    span_y = cy1 - cy0 + 1
+    cells_per_seg = (cx1 - cx0 + 1) * span_y
+    owner = np.repeat(np.arange(len(seg_edge), dtype=np.int64), cells_per_seg)
+    local = np.arange(len(owner)) - np.repeat(np.cumsum(cells_per_seg) - cells_per_seg, cells_per_seg)
+    cell_x = cx0[owner] + local // span_y[owner]
+    cell_y = cy0[owner] + local % span_y[owner]
+    cell_key = (cell_x - cx_min) * height + (cell_y - cy_min)
+    grid_order = np.argsort(cell_key, kind='stable')
+    grid_keys, grid_counts = np.unique(cell_key[grid_order], return_counts=True)
+    grid_indptr = np.zeros(len(grid_keys) + 1, dtype=np.int64)
+    np.cumsum(grid_counts, out=grid_indptr[1:])
+
+    arrays = {
+        'node_ids': node_ids,
+        'node_lon': node_lon,
+        'node_lat': node_lat,
+        'adj_indptr': adj_indptr,
+        'adj_indices': edge_v[adj_order],
+        'adj_weight': edge_length[adj_order],
+        'adj_edge': adj_order.astype(np.int64),
+        'edge_u': edge_u,
+        'edge_v': edge_v,
+        'edge_osmid': edge_osmid,
+        'edge_length': edge_length,
+        'seg_edge': seg_edge,
+        'seg_lon0': seg_lon0,
+        'seg_lat0': seg_lat0,
+        'seg_lon1': seg_lon1,
+        'seg_lat1': seg_lat1,
+        'seg_offset': seg_offset,
+        'seg_share': seg_share,
+        'grid_keys': grid_keys.astype(np.int64),
+        'grid_indptr': grid_indptr,
+        'grid_segments': owner[grid_order],
+    }
+    meta = {'lat0': lat0, 'cell_size': float(cell_size_meters), 'cx_min': cx_min, 'cy_min': cy_min,
+            'height': height}
+    return arrays, meta
+
+
+def _open_shared_memory(name: str):
+    # Python 3.13 起可以关闭资源跟踪，避免挂载方退出时误删共享内存
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedRoadNetwork:
+    """
+    只读的扁平数组路网，可发布到共享内存（或 .npy 文件）后被多个工作进程零拷贝挂载。
+
+    主进程读取CSV、解析WKT、构建邻接表和空间索引只做一次，之后通过 publish() 拷贝到一块
+    共享内存中；工作进程用 attach(handle) 直接在这块内存上构建NumPy视图，不再复制数据，
+    因此进程池的内存占用不会随核数增长。handle 是一个可以 pickle 的小字典，
+    通常作为 multiprocessing.Pool 的 initargs 传给 init_worker。
+
+    也可以用 save() 写出 .npy 文件，再用 attach() 以 mmap 方式挂载，适合跨多次运行复用。
+    发布共享内存的进程负责在所有工作进程结束后调用 unlink()。
+    """
+
+    def __init__(self, arrays: dict, meta: dict, shm=None, handle: dict = None):
+        self.arrays = arrays
+        self.meta = meta
+        self._shm = shm
+        self._handle = handle
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    @classmethod
+    def from_dataframes(cls, nodes_df: pd.DataFrame, edges_df: pd.DataFrame, cell_size_meters: float = 100.0):
+        arrays, meta = build_network_arrays(nodes_df, edges_df, cell_size_meters)
+        return cls(arrays, meta)
+
+    @classmethod
+    def from_csv(cls, node_file: str = 'road_network_nodes.csv', edge_file: str = 'road_network_edges.csv',
+                 cell_size_meters: float = 100.0):
+        print(f"正在加载路网: {node_file}, {edge_file}")
+        nodes_df = pd.read_csv(node_file, usecols=['osmid', 'x', 'y'])
+        edges_df = pd.read_csv(edge_file)
+        return cls.from_dataframes(nodes_df, edges_df, cell_size_meters)
+
+    @property
+    def handle(self) -> dict:
+        """
+        用于在其他进程中 attach 的描述信息；尚未发布时为 None。
+        """
+        return self._handle
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(array.nbytes for array in self.arrays.values()))
+
+    def publish(self, name: str = None):
+        """
+        将所有数组拷贝到一块新建的共享内存中，返回基于该共享内存的 SharedRoadNetwork。
+        """
+        layout = {}
+        offset = 0
+        for key, array in self.arrays.items():
+            offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+            layout[key] = (offset, array.dtype.str, array.shape)
+            offset += array.nbytes
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+        handle = {'kind': 'shm', 'name': shm.name, 'layout': layout, 'meta': self.meta}
+        arrays = self._views(shm.buf, layout)
+        for key, array in self.arrays.items():
+            arrays[key].flags.writeable = True
+            arrays[key][...] = array
+            arrays[key].flags.writeable = False
+        print(f"路网已发布到共享内存 {shm.name}，大小 {offset / 1024 / 1024:.1f} MB。")
+        return SharedRoadNetwork(arrays, self.meta, shm=shm, handle=handle)
+
+    def save(self, directory: str) -> dict:
+        """
+        将所有数组保存为 directory 下的 .npy 文件，返回可用于 attach 的 handle。
+        """
+        os.makedirs(directory, exist_ok=True)
+        for key, array in self.arrays.items():
+            np.save(os.path.join(directory, f'{key}.npy'), array)
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        self._handle = {'kind': 'npy', 'path': directory, 'meta': self.meta}
+        return self._handle
+
+    @staticmethod
+    def _views(buffer, layout: dict) -> dict:
+        arrays = {}
+        for key, (offset, dtype, shape) in layout.items():
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+            array.flags.writeable = False
+            arrays[key] = array
+        return arrays
+
+    @classmethod
+    def attach(cls, handle: dict):
+        """
+        根据 handle 零拷贝挂载路网：共享内存直接构建视图，.npy 文件以 mmap_mode='r' 打开。
+        """
+        if handle['kind'] == 'shm':
+            shm = _open_shared_memory(handle['name'])
+            return cls(cls._views(shm.buf, handle['layout']), handle['meta'], shm=shm, handle=handle)
+        if handle['kind'] == 'npy':
+            directory = handle['path']
+            arrays = {os.path.splitext(name)[0]: np.load(os.path.join(directory, name), mmap_mode='r')
+                      for name in sorted(os.listdir(directory)) if name.endswith('.npy')}
+            return cls(arrays, handle['meta'], handle=handle)
+        raise ValueError(f"不支持的 handle 类型: {handle['kind']}")
+
+    def close(self):
+        """
+        释放本进程对共享内存的映射（不删除共享内存本身）。
+        """
+        if self._shm is not None:
+            self.arrays = {}
+            for name in list(self.__dict__):
+                if isinstance(self.__dict__[name], np.ndarray):
+                    delattr(self, name)
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """
+        由发布方在所有工作进程结束后调用，删除共享内存。
+        """
+        shm = self._shm
+        self.close()
+        if shm is not None:
+            shm.unlink()
+        elif self._handle is not None and self._handle['kind'] == 'shm':
+            _open_shared_memory(self._handle['name']).unlink()
+
+    def node_index(self, osmids) -> np.ndarray:
+        """
+        将节点 osmid 转换为节点下标，不存在的节点返回 -1。
+        """
+        osmids = np.atleast_1d(np.asarray(osmids, dtype=np.int64))
+        index = np.clip(np.searchsorted(self.node_ids, osmids), 0, len(self.node_ids) - 1)
+        return np.where(self.node_ids[index] == osmids, index, -1)
+
+    def neighbors(self, node_index: int) -> tuple:
+        """
+        返回节点的出边：(终点节点下标数组, 边权重数组, 边下标数组)。
+        """
+        lo, hi = self.adj_indptr[node_index], self.adj_indptr[node_index + 1]
+        return self.adj_indices[lo:hi], self.adj_weight[lo:hi], self.adj_edge[lo:hi]
+
+    def edges_in_bbox(self, bbox) -> np.ndarray:
+        """
+        返回与 bbox (west, south, east, north) 相交的所有边的下标（按线段外包框判断）。
+        """
+        west, south, east, north = bbox
+        meta = self.meta
+        cell_size, height = meta['cell_size'], meta['height']
+        xs, ys = to_local_meters(np.array([west, east]), np.array([south, north]), meta['lat0'])
+        cx = np.floor(xs / cell_size).astype(np.int64) - meta['cx_min']
+        cy = np.clip(np.floor(ys / cell_size).astype(np.int64) - meta['cy_min'], 0, height - 1)
+
+        # 每一列网格单元在有序编号中是连续的区间
+        columns = np.arange(cx[0], cx[1] + 1)
+        lo = np.searchsorted(self.grid_keys, columns * height + cy[0], side='left')
+        hi = np.searchsorted(self.grid_keys, columns * height + cy[1], side='right')
+        segments = np.concatenate([self.grid_segments[self.grid_indptr[a]:self.grid_indptr[b]]
+                                   for a, b in zip(lo, hi)] + [np.zeros(0, dtype=np.int64)])
+        segments = np.unique(segments)
+
+        lon0, lon1 = self.seg_lon0[segments], self.seg_lon1[segments]
+        lat0, lat1 = self.seg_lat0[segments], self.seg_lat1[segments]
+        overlap = ((np.maximum(lon0, lon1) >= west) & (np.minimum(lon0, lon1) <= east) &
+                   (np.maximum(lat0, lat1) >= south) & (np.minimum(lat0, lat1) <= north))
+        return np.unique(self.seg_edge[segments[overlap]])
+
+    def candidate_edges(self, lon, lat, radius_meters: float = 70.0) -> pd.DataFrame:
+        """
+        为一批GPS点查询半径内的候选路段（与 make_dataset.py 中缓冲区 + sjoin 的结果对应）。
+
+        参数:
+        - lon, lat (array-like): GPS点经纬度。
+        - radius_meters (float): 搜索半径（米）。
+
+        返回:
+        - pd.DataFrame: 列 ['point_index', 'edge_index', 'osmid', 'distance_m', 'projected_longitude',
+          'projected_latitude', 'edge_offset_m']，每个 (点, 路段) 只保留一行，distance_m 为点到该路段的最短距离，
+          projected_* 为对应的投影点，edge_offset_m 为投影点距该边起点 u 的距离（米），按点和距离排序。
+        """
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        meta = self.meta
+        cell_size, height = meta['cell_size'], meta['height']
+
+        # 1. 每个点需要检查的网格单元：所在单元周围 reach 圈
+        px, py = to_local_meters(lon, lat, meta['lat0'])
+        pcx = np.floor(px / cell_size).astype(np.int64) - meta['cx_min']
+        pcy = np.floor(py / cell_size).astype(np.int64) - meta['cy_min']
+        reach = int(np.ceil(radius_meters / cell_size))
+        offsets = np.arange(-reach, reach + 1)
+        cell_x = (pcx[:, None, None] + offsets[None, :, None]).repeat(len(offsets), axis=2)
+        cell_y = (pcy[:, None, None] + offsets[None, None, :]).repeat(len(offsets), axis=1)
+        in_range = (cell_y >= 0) & (cell_y < height)
+        keys = np.where(in_range, cell_x * height + cell_y, -1).reshape(len(lon), -1)
+
+        # 2. 在有序的单元编号中查找，展开为 (点, 线段) 候选对
+        pos = np.clip(np.searchsorted(self.grid_keys, keys), 0, max(len(self.grid_keys) - 1, 0))
+        found = (len(self.grid_keys) > 0) & (self.grid_keys[pos] == keys) & (keys >= 0)
+        point_rows = np.broadcast_to(np.arange(len(lon))[:, None], keys.shape)[found]
+        lo = self.grid_indptr[pos[found]]
+        counts = self.grid_indptr[pos[found] + 1] - lo
+        pair_point = np.repeat(point_rows, counts)
+        pair_pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+        pair_seg = self.grid_segments[pair_pos]
+
+        # 3. 计算点到线段的距离，按 (点, 路段) 去重保留最短距离
+        distance, t = point_to_segment_distance(lon[pair_point], lat[pair_point],
+                                                self.seg_lon0[pair_seg], self.seg_lat0[pair_seg],
+                                                self.seg_lon1[pair_seg], self.seg_lat1[pair_seg])
+        keep = distance <= radius_meters
+        pair_point, pair_seg, distance, t = pair_point[keep], pair_seg[keep], distance[keep], t[keep]
+        pair_edge = self.seg_edge[pair_seg]
+        order = np.lexsort((distance, pair_edge, pair_point))
+        pair_point, pair_edge, pair_seg, distance, t = (pair_point[order], pair_edge[order], pair_seg[order],
+                                                        distance[order], t[order])
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (pair_point[1:] != pair_point[:-1]) | (pair_edge[1:] != pair_edge[:-1])
+        seg, t = pair_seg[first], t[first]
+
+        result = pd.DataFrame({
+            'point_index': pair_point[first],
+            'edge_index': pair_edge[first],
+            'osmid': self.edge_osmid[pair_edge[first]],
+            'distance_m': distance[first],
+            'projected_longitude': self.seg_lon0[seg] + t * (self.seg_lon1[seg] - self.seg_lon0[seg]),
+            'projected_latitude': self.seg_lat0[seg] + t * (self.seg_lat1[seg] - self.seg_lat0[seg]),
+            'edge_offset_m': (self.seg_offset[seg] + t * self.seg_share[seg]) * self.edge_length[pair_edge[first]],
+        })
+        return result.sort_values(by=['point_index', 'distance_m'], kind='stable').reset_index(drop=True)
+
+
+def init_worker(handle: dict):
+    """
+    multiprocessing.Pool 的 initializer：在工作进程中挂载共享路网。
+
+    用法:
+        network = SharedRoadNetwork.from_csv().publish()
+        with Pool(8, initializer=init_worker, initargs=(network.handle,)) as pool:
+            ...  # 任务函数中通过 get_worker_network() 获取路网
+        network.unlink()
+    """
+    global _WORKER_NETWORK
+    _WORKER_NETWORK = SharedRoadNetwork.attach(handle)
+
+
+def get_worker_network() -> SharedRoadNetwork:
+    if _WORKER_NETWORK is None:
+        raise RuntimeError("当前进程尚未挂载共享路网，请先调用 init_worker(handle)。")
+    return _WORKER_NETWORK
@@ -0,0 +1,198 @@
+import itertools
+
+import networkx as nx
+
+
+class SimplifiedRoutingGraph:
+    """
+    由原始路网（simplify=False 导出，每个折线内部顶点都是节点）派生的拓扑简化路由图。
+
+    度为 2 的链状节点被折叠：两个路口之间的一串原始边合并为一条简化边，权重为各原始边权重之和，
+    并在展开表中保存这条链完整的原始节点序列和每条原始边的 osmid。
+    路由时如果起点或终点是某条链的内部节点，会临时把该链在这些节点处拆开，查询结束后还原，
+    因此所有路由接口的输入和输出都是原始节点ID，结果与直接在原始图上路由一致
+    （权重相同的并列路径之间的先后次序除外）。
+
+    目前只支持无向简单图（nx.Graph），与 k_shortest_paths.py 构建的路网图一致。
+    """
+
+    def __init__(self, raw_graph, weight: str = 'weight', osmid_attr: str = 'osmid'):
+        if raw_graph.is_directed() or raw_graph.is_multigraph():
+            raise ValueError("SimplifiedRoutingGraph 仅支持无向简单图 nx.Graph。")
+
+        self.raw = raw_graph
+        self.weight = weight
+        self.osmid_attr = osmid_attr
+        self.graph = nx.Graph()
+        # (a, b) -> {'nodes': [a, ..., b], 'osmids': [...], 'weights': [...]}，方向为 a -> b
+        self.expansion = {}
+        # 链内部节点 -> 其所在的简化边 (a, b)
+        self.interior = {}
+
+        self._build()
+
+    def _edge_weight(self, u, v) -> float:
+        return self.raw.edges[u, v].get(self.weight, 1)
+
+    def _build(self):
+        raw = self.raw
+        junctions = {node for node in raw.nodes if raw.degree(node) != 2 or raw.has_edge(node, node)}
+        visited = set()
+        chains = []
+
+        # 1. 从每个路口出发沿度为 2 的节点行走，收集所有链
+        for start in junctions:
+            for first in raw.neighbors(start):
+                if frozenset((start, first)) in visited:
+                    continue
+                nodes = [start, first]
+                visited.add(frozenset((start, first)))
+                while nodes[-1] not in junctions:
+                    prev, current = nodes[-2], nodes[-1]
+                    nxt = next(n for n in raw.neighbors(current) if n != prev)
+                    visited.add(frozenset((current, nxt)))
+                    nodes.append(nxt)
+                chains.append(nodes)
+
+        # 2. 没有任何路口的孤立环：原样保留其原始边
+        for u, v in raw.edges:
+            if frozenset((u, v)) not in visited:
+                chains.append([u, v])
+
+        # 3. 直连边优先占用 (a, b)；环状链或与已有边平行的链在内部节点处拆开
+        chains.sort(key=len)
+        for nodes in chains:
+            a, b = nodes[0], nodes[-1]
+            if a == b:
+                for u, v in zip(nodes[:-1], nodes[1:]):
+                    self._add_chain([u, v])
+            elif self.graph.has_edge(a, b):
+                self._add_chain(nodes[:2])
+                self._add_chain(nodes[1:])
+            else:
+                self._add_chain(nodes)
+
+        for node in raw.nodes:
+            if node not in self.graph and node not in self.interior:
+                self.graph.add_node(node)
+
+    def _add_chain(self, nodes: list):
+        a, b = nodes[0], nodes[-1]
+        weights = [self._edge_weight(u, v) for u, v in zip(nodes[:-1], nodes[1:])]
+        osmids = [self.raw.edges[u, v].get(self.osmid_attr) for u, v in zip(nodes[:-1], nodes[1:])]
+        self.graph.add_edge(a, b, **{self.weight: sum(weights)})
+        self.expansion[(a, b)] = {'nodes': nodes, 'osmids': osmids, 'weights': weights}
+        for node in nodes[1:-1]:
+            self.interior[node] = (a, b)
+
+    def _chain(self, u, v) -> dict:
+        """
+        返回简化边 u -> v 的展开信息（必要时反转方向）。
+        """
+        if (u, v) in self.expansion:
+            return self.expansion[(u, v)]
+        chain = self.expansion[(v, u)]
+        return {'nodes': chain['nodes'][::-1], 'osmids': chain['osmids'][::-1], 'weights': chain['weights'][::-1]}
+
+    def number_of_nodes(self) -> int:
+        return self.graph.number_of_nodes()
+
+    def number_of_edges(self) -> int:
+        return self.graph.number_of_edges()
+
+    def is_directed(self) -> bool:
+        return False
+
+    def _split_for_query(self, endpoints) -> list:
+        """
+        将作为起终点的链内部节点临时拆分出来，返回用于还原的记录。
+        """
+        by_chain = {}
+        for node in endpoints:
+            if node in self.interior and node not in self.graph:
+                by_chain.setdefault(self.interior[node], set()).add(node)
+
+        restore = []
+        for (a, b), split_nodes in by_chain.items():
+            chain = self.expansion.pop((a, b))
+            edge_data = dict(self.graph.edges[a, b])
+            self.graph.remove_edge(a, b)
+            nodes = chain['nodes']
+            cut = [0] + sorted(nodes.index(node) for node in split_nodes) + [len(nodes) - 1]
+            added = []
+            for i, j in zip(cut[:-1], cut[1:]):
+                sub = {'nodes': nodes[i:j + 1], 'osmids': chain['osmids'][i:j], 'weights': chain['weights'][i:j]}
+                self.graph.add_edge(nodes[i], nodes[j], **{self.weight: sum(sub['weights'])})
+                self.expansion[(nodes[i], nodes[j])] = sub
+                added.append((nodes[i], nodes[j]))
+            restore.append(((a, b), chain, edge_data, added))
+        return restore
+
+    def _restore(self, restore: list):
+        for (a, b), chain, edge_data, added in restore:
+            for u, v in added:
+                self.graph.remove_edge(u, v)
+                self.expansion.pop((u, v))
+            for node in chain['nodes'][1:-1]:
+                if node in self.graph and self.graph.degree(node) == 0:
+                    self.graph.remove_node(node)
+            self.graph.add_edge(a, b, **edge_data)
+            self.expansion[(a, b)] = chain
+
+    def expand_path(self, path: list) -> list:
+        """
+        将简化图上的节点序列展开为原始路网上的节点序列。
+        """
+        if len(path) < 2:
+            return list(path)
+        raw_nodes = [path[0]]
+        for u, v in zip(path[:-1], path[1:]):
+            raw_nodes.extend(self._chain(u, v)['nodes'][1:])
+        return raw_nodes
+
+    def path_osmids(self, path: list) -> list:
+        """
+        返回原始节点序列上每条原始边的 osmid。
+        """
+        return [self.raw.edges[u, v].get(self.osmid_attr) for u, v in zip(path[:-1], path[1:])]
+
+    def shortest_path(self, source, target) -> list:
+        """
+        返回原始节点序列表示的最短路径；找不到路径时抛出 nx.NetworkXNoPath。
+        """
+        if source == target:
+            return [source]
+        restore = self._split_for_query([source, target])
+        try:
+            path = nx.shortest_path(self.graph, source, target, weight=self.weight)
+            return self.expand_path(path)
+        finally:
+            self._restore(restore)
+
+    def shortest_path_length(self, source, target) -> float:
+        if source == target:
+            return 0.0
+        restore = self._split_for_query([source, target])
+        try:
+            return nx.shortest_path_length(self.graph, source, target, weight=self.weight)
+        finally:
+            self._restore(restore)
+
+    def k_shortest_paths(self, source, target, k: int) -> list:
+        """
+        返回 k 条最短简单路径 [(原始节点序列, 路径长度), ...]；找不到路径时返回空列表。
+
+        原始图上经过链内部节点的简单路径必然完整经过整条链，因此简化图上的简单路径与
+        原始图上的简单路径一一对应。
+        """
+        if source == target:
+            return [([source], 0.0)]
+        restore = self._split_for_query([source, target])
+        try:
+            paths_generator = nx.shortest_simple_paths(self.graph, source=source, target=target, weight=self.weight)
+            paths = list(itertools.islice(paths_generator, k))
+            return [(self.expand_path(path), nx.path_weight(self.graph, path, weight=self.weight)) for path in paths]
+        except nx.NetworkXNoPath:
+            return []
+        finally:
+            self._restore(restore)
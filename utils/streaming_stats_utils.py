@@ -0,0 +1,325 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+# 原始滴滴数据的中文列名到统一列名的映射（与 statistic.analyze_gps_data 一致）
+GPS_COLUMN_RENAME = {
+    '司机ID': 'driver_id',
+    '订单ID': 'order_id',
+    'GPS时间': 'gps_time',
+    '轨迹点经度': 'longitude',
+    '轨迹点纬度': 'latitude'
+}
+
+# 每个订单的采样间隔汇总列
+INTERVAL_COLUMNS = ['first_time', 'last_time', 'count', 'sum', 'min', 'max']
+
+
+class TDigest:
+    """
+    可合并的 t-digest 分位数草图。
+
+    数据以 (均值, 权重) 质心的形式保存；压缩时按 k1 尺度函数 k(q) = δ/(2π)·asin(2q-1)
+    对排序后的质心分组，使靠近两端的质心更细、中间更粗，从而以有限内存给出
+    精度较高的分位数估计。两个草图合并时只需拼接质心后再压缩一次。
+    """
+
+    def __init__(self, compression: float = 200.0):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, values):
+        """
+        加入一批数值（NaN 会被忽略）。
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self._buffered > 20 * self.compression:
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        buffered = np.concatenate(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        means = np.concatenate([self.means, buffered])
+        weights = np.concatenate([self.weights, np.ones(len(buffered))])
+        self.means, self.weights = self._merge_centroids(means, weights)
+
+    def _merge_centroids(self, means: np.ndarray, weights: np.ndarray) -> tuple:
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+        total = weights.sum()
+
+        # 每个质心左端点的累积分位数，映射到 k 尺度后取整即为所属分组
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        group = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+
+        merged_weights = np.add.reduceat(weights, starts)
+        merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+        return merged_means, merged_weights
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        """
+        将另一个草图合并进当前草图，返回 self。
+        """
+        self._compress()
+        other._compress()
+        if len(other.weights):
+            means = np.concatenate([self.means, other.means])
+            weights = np.concatenate([self.weights, other.weights])
+            self.means, self.weights = self._merge_centroids(means, weights)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum()) + self._buffered
+
+    def quantile(self, q: float) -> float:
+        """
+        估计分位数 q（0~1）。
+        """
+        self._compress()
+        if len(self.weights) == 0:
+            return np.nan
+        if len(self.weights) == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        centers = (np.cumsum(self.weights) - self.weights / 2) / total
+        positions = np.concatenate(([0.0], centers, [1.0]))
+        values = np.concatenate(([self.min], self.means, [self.max]))
+        return float(np.interp(q, positions, values))
+
+
+class GpsStreamSummary:
+    """
+    GPS数据集的可合并流式统计摘要。
+
+    对每个数据块更新：行数、司机/订单集合、时间范围、经纬度边界、
+    每个订单的采样间隔（跨块边界时用上一块的最后时间衔接）以及经纬度的 t-digest 草图。
+    不同文件或不同进程得到的摘要可以通过 merge 合并。
+    假设同一订单的点在文件中按时间先后出现（块内部会重新排序）。
+    """
+
+    def __init__(self, compression: float = 200.0):
+        self.num_rows = 0
+        self.driver_ids = set()
+        self.order_ids = set()
+        self.time_min = None
+        self.time_max = None
+        self.lon_min = np.inf
+        self.lon_max = -np.inf
+        self.lat_min = np.inf
+        self.lat_max = -np.inf
+        self.lon_digest = TDigest(compression)
+        self.lat_digest = TDigest(compression)
+        self.intervals = pd.DataFrame(columns=INTERVAL_COLUMNS, index=pd.Index([], name='order_id'))
+
+    def update(self, chunk: pd.DataFrame):
+        """
+        用一个数据块更新摘要。数据块必须包含
+        ['driver_id', 'order_id', 'gps_time', 'longitude', 'latitude'] 列。
+        """
+        if chunk.empty:
+            return
+        self.num_rows += len(chunk)
+        self.driver_ids.update(chunk['driver_id'].unique().tolist())
+        self.order_ids.update(chunk['order_id'].unique().tolist())
+
+        times = pd.to_datetime(chunk['gps_time'])
+        chunk_min, chunk_max = times.min(), times.max()
+        self.time_min = chunk_min if self.time_min is None else min(self.time_min, chunk_min)
+        self.time_max = chunk_max if self.time_max is None else max(self.time_max, chunk_max)
+
+        lon = chunk['longitude'].to_numpy(dtype=np.float64)
+        lat = chunk['latitude'].to_numpy(dtype=np.float64)
+        self.lon_min = min(self.lon_min, np.nanmin(lon))
+        self.lon_max = max(self.lon_max, np.nanmax(lon))
+        self.lat_min = min(self.lat_min, np.nanmin(lat))
+        self.lat_max = max(self.lat_max, np.nanmax(lat))
+        self.lon_digest.update(lon)
+        self.lat_digest.update(lat)
+
+        # 块内按订单和时间排序，计算块内的采样间隔汇总
+        data = pd.DataFrame({'order_id': chunk['order_id'].to_numpy(), 'gps_time': times.to_numpy()})
+        data = data.sort_values(by=['order_id', 'gps_time'])
+        data['time_diff_seconds'] = data.groupby('order_id')['gps_time'].diff().dt.total_seconds()
+        grouped = data.groupby('order_id')
+        chunk_intervals = pd.DataFrame({
+            'first_time': grouped['gps_time'].min(),
+            'last_time': grouped['gps_time'].max(),
+            'count': grouped['time_diff_seconds'].count(),
+            'sum': grouped['time_diff_seconds'].sum(),
+            'min': grouped['time_diff_seconds'].min(),
+            'max': grouped['time_diff_seconds'].max(),
+        })
+        self.intervals = _merge_interval_tables(self.intervals, chunk_intervals)
+
+    def merge(self, other: 'GpsStreamSummary') -> 'GpsStreamSummary':
+        """
+        将另一个摘要合并进当前摘要，返回 self。
+        """
+        self.num_rows += other.num_rows
+        self.driver_ids |= other.driver_ids
+        self.order_ids |= other.order_ids
+        if other.time_min is not None:
+            self.time_min = other.time_min if self.time_min is None else min(self.time_min, other.time_min)
+            self.time_max = other.time_max if self.time_max is None else max(self.time_max, other.time_max)
+        self.lon_min = min(self.lon_min, other.lon_min)
+        self.lon_max = max(self.lon_max, other.lon_max)
+        self.lat_min = min(self.lat_min, other.lat_min)
+        self.lat_max = max(self.lat_max, other.lat_max)
+        self.lon_digest.merge(other.lon_digest)
+        self.lat_digest.merge(other.lat_digest)
+        self.intervals = _merge_interval_tables(self.intervals, other.intervals)
+        return self
+
+    def bounding_box(self) -> dict:
+        return {
+            "top_left": (self.lat_max, self.lon_min),
+            "top_right": (self.lat_max, self.lon_max),
+            "bottom_left": (self.lat_min, self.lon_min),
+            "bottom_right": (self.lat_min, self.lon_max)
+        }
+
+    def sampling_interval_stats(self) -> pd.DataFrame:
+        """
+        返回每个订单的采样间隔统计，列与 analyze_gps_data 一致：
+        ['min_interval_s', 'max_interval_s', 'avg_interval_s']。
+        """
+        stats = pd.DataFrame({
+            'min_interval_s': self.intervals['min'].astype(float),
+            'max_interval_s': self.intervals['max'].astype(float),
+            'avg_interval_s': (self.intervals['sum'] / self.intervals['count'].replace(0, np.nan)).astype(float),
+        })
+        return stats.sort_index()
+
+    def iqr_bounds(self, factor: float = 1.5) -> dict:
+        """
+        基于 t-digest 估计的四分位数计算经纬度的 IQR 异常值边界。
+        """
+        bounds = {}
+        for name, digest in [('lon', self.lon_digest), ('lat', self.lat_digest)]:
+            q1 = digest.quantile(0.25)
+            q3 = digest.quantile(0.75)
+            iqr = q3 - q1
+            bounds[f'{name}_lower_bound'] = q1 - factor * iqr
+            bounds[f'{name}_upper_bound'] = q3 + factor * iqr
+        return bounds
+
+
+def _merge_interval_tables(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    """
+    合并两张按订单汇总的采样间隔表。同一订单在两侧都出现时，
+    用先出现部分的最后时间和后出现部分的第一个时间补上跨边界的那个间隔。
+    """
+    if left.empty:
+        return right.copy()
+    if right.empty:
+        return left.copy()
+
+    common = left.index.intersection(right.index)
+    only_left = left.loc[left.index.difference(common)]
+    only_right = right.loc[right.index.difference(common)]
+    if len(common) == 0:
+        return pd.concat([only_left, only_right])
+
+    a = left.loc[common]
+    b = right.loc[common]
+    # 按时间先后确定哪一侧在前，跨边界间隔 = 后者的第一个时间 - 前者的最后时间
+    a_first = a['last_time'] <= b['first_time']
+    b_first = b['last_time'] <= a['first_time']
+    gap = pd.Series(np.nan, index=common)
+    gap[a_first] = (b['first_time'] - a['last_time'])[a_first].dt.total_seconds()
+    gap[b_first] = (a['first_time'] - b['last_time'])[b_first].dt.total_seconds()
+    has_gap = gap.notna()
+
+    merged = pd.DataFrame({
+        'first_time': np.minimum(a['first_time'], b['first_time']),
+        'last_time': np.maximum(a['last_time'], b['last_time']),
+        'count': a['count'] + b['count'] + has_gap.astype(int),
+        'sum': a['sum'] + b['sum'] + gap.fillna(0.0),
+        'min': pd.concat([a['min'], b['min'], gap], axis=1).min(axis=1),
+        'max': pd.concat([a['max'], b['max'], gap], axis=1).max(axis=1),
+    }, index=common)
+    return pd.concat([only_left, only_right, merged])
+
+
+def summarize_gps_file(file_path: str, chunksize: int = 100000, compression: float = 200.0) -> GpsStreamSummary:
+    """
+    分块读取一个GPS CSV文件，单次遍历得到其流式统计摘要。
+    """
+    summary = GpsStreamSummary(compression)
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        chunk = chunk.rename(columns=GPS_COLUMN_RENAME)
+        summary.update(chunk)
+    return summary
+
+
+def summarize_gps_files(file_paths, chunksize: int = 100000, max_workers: int = None) -> GpsStreamSummary:
+    """
+    多进程并行统计多个GPS文件，并把每个文件的摘要合并为一个总摘要。
+    """
+    file_paths = list(file_paths)
+    if len(file_paths) == 1 or max_workers == 1:
+        summaries = [summarize_gps_file(path, chunksize) for path in file_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            summaries = list(executor.map(summarize_gps_file, file_paths, [chunksize] * len(file_paths)))
+
+    total = GpsStreamSummary()
+    for summary in summaries:
+        total.merge(summary)
+    return total
+
+
+def flag_outliers_streaming(file_path: str, bounds: dict, chunksize: int = 100000, output_path: str = None) -> pd.DataFrame:
+    """
+    第二遍流式扫描：按 IQR 边界筛选出经纬度异常的数据点。
+
+    参数:
+    - file_path (str): GPS CSV文件路径。
+    - bounds (dict): GpsStreamSummary.iqr_bounds() 的返回值。
+    - chunksize (int): 分块读取的行数。
+    - output_path (str): 如果提供，异常点会逐块追加写入该CSV文件，函数返回空DataFrame。
+
+    返回:
+    - pd.DataFrame: 所有异常点（未提供 output_path 时）。
+    """
+    outlier_chunks = []
+    header_written = False
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        chunk = chunk.rename(columns=GPS_COLUMN_RENAME)
+        outliers = chunk[
+            (chunk['longitude'] < bounds['lon_lower_bound']) | (chunk['longitude'] > bounds['lon_upper_bound']) |
+            (chunk['latitude'] < bounds['lat_lower_bound']) | (chunk['latitude'] > bounds['lat_upper_bound'])
+        ]
+        if outliers.empty:
+            continue
+        if output_path is not None:
+            outliers.to_csv(output_path, mode='a' if header_written else 'w', header=not header_written, index=False)
+            header_written = True
+        else:
+            outlier_chunks.append(outliers)
+
+    if not outlier_chunks:
+        return pd.DataFrame()
+    return pd.concat(outlier_chunks, ignore_index=True)
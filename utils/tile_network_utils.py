@@ -0,0 +1,184 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+
+def split_bbox_into_tiles(bbox, tile_size_deg: float = 0.02) -> list:
+    """
+    将 bbox 划分为与全局网格对齐的瓦片。
+
+    瓦片编号为 (floor(lon / tile_size_deg), floor(lat / tile_size_deg))，与 bbox 本身无关，
+    因此扩大区域时已有瓦片的编号保持不变，可以直接复用缓存。
+
+    参数:
+    - bbox (tuple): (west, south, east, north)，与 ox.graph_from_bbox 的参数顺序一致。
+    - tile_size_deg (float): 瓦片边长（度），默认为 0.02（约 2 km）。
+
+    返回:
+    - list: [(ix, iy, tile_bbox), ...]，tile_bbox 同样为 (west, south, east, north)。
+    """
+    west, south, east, north = bbox
+    ix_range = range(int(np.floor(west / tile_size_deg)), int(np.floor(east / tile_size_deg)) + 1)
+    iy_range = range(int(np.floor(south / tile_size_deg)), int(np.floor(north / tile_size_deg)) + 1)
+    tiles = []
+    for ix in ix_range:
+        for iy in iy_range:
+            tile_bbox = (ix * tile_size_deg, iy * tile_size_deg, (ix + 1) * tile_size_deg, (iy + 1) * tile_size_deg)
+            tiles.append((ix, iy, tile_bbox))
+    return tiles
+
+
+def load_osm_graph(osm_filepath: str):
+    """
+    从本地 OSM XML (.osm/.xml) 或 PBF (.pbf) 文件构建未简化的路网图，无需联网。
+
+    XML 使用 osmnx 直接读取；PBF 需要额外安装 pyrosm。
+    """
+    import osmnx as ox
+
+    if osm_filepath.endswith('.pbf'):
+        try:
+            from pyrosm import OSM
+        except ImportError as e:
+            raise ImportError("读取PBF文件需要安装 pyrosm：pip install pyrosm") from e
+        osm = OSM(osm_filepath)
+        nodes, edges = osm.get_network(network_type='all', nodes=True)
+        return osm.to_graph(nodes, edges, graph_type='networkx')
+
+    return ox.graph_from_xml(osm_filepath, simplify=False, retain_all=True)
+
+
+def _tile_paths(cache_dir: str, ix: int, iy: int) -> tuple:
+    return (os.path.join(cache_dir, f'tile_{ix}_{iy}_nodes.csv'),
+            os.path.join(cache_dir, f'tile_{ix}_{iy}_edges.csv'))
+
+
+def _source_cache_dir(cache_root: str, osm_filepath: str, tile_size_deg: float) -> str:
+    """
+    缓存目录由数据源和瓦片大小决定；本地文件以 文件名+大小+修改时间 作为指纹，
+    文件更新后会自动使用新的缓存目录。
+    """
+    if osm_filepath is None:
+        source = 'overpass'
+    else:
+        stat = os.stat(osm_filepath)
+        source = f'{os.path.basename(osm_filepath)}_{stat.st_size}_{int(stat.st_mtime)}'
+    return os.path.join(cache_root, f'{source}_tile{tile_size_deg}')
+
+
+def _write_tiles_from_graph(G, tiles: list, tile_size_deg: float, cache_dir: str):
+    """
+    将图中的节点和边按瓦片写入缓存。节点归属于其坐标所在的瓦片，
+    边归属于其起点 u 所在的瓦片；每个瓦片还会带上其边的终点节点，保证合并后拓扑完整。
+    """
+    import osmnx as ox
+
+    nodes, edges = ox.graph_to_gdfs(G)
+    if 'highway' in edges.columns:
+        edges = edges[edges['highway'].notna()]
+
+    node_ix = np.floor(nodes['x'] / tile_size_deg).astype(np.int64)
+    node_iy = np.floor(nodes['y'] / tile_size_deg).astype(np.int64)
+    edge_u = edges.index.get_level_values('u')
+    edge_ix = node_ix.reindex(edge_u).to_numpy()
+    edge_iy = node_iy.reindex(edge_u).to_numpy()
+
+    for ix, iy, _ in tiles:
+        tile_edges = edges[(edge_ix == ix) & (edge_iy == iy)]
+        endpoint_ids = np.union1d(tile_edges.index.get_level_values('u'), tile_edges.index.get_level_values('v'))
+        in_tile = ((node_ix == ix) & (node_iy == iy)).to_numpy()
+        tile_nodes = nodes[in_tile | nodes.index.isin(endpoint_ids)]
+
+        nodes_path, edges_path = _tile_paths(cache_dir, ix, iy)
+        # 先写边再写节点，节点文件存在即表示该瓦片已完整缓存
+        tile_edges.to_csv(edges_path, encoding='utf-8-sig')
+        tile_nodes.to_csv(nodes_path, encoding='utf-8-sig')
+
+
+def build_tiled_network(bbox, cache_root: str = 'road_network_tiles', osm_filepath: str = None,
+                        tile_size_deg: float = 0.02) -> tuple:
+    """
+    按瓦片构建 bbox 范围内的路网，并合并、裁剪为与 road_network_nodes.csv / road_network_edges.csv
+    相同结构的节点表和边表。
+
+    已缓存的瓦片直接从磁盘读取；只有缺失的瓦片才需要处理：
+    - 指定 osm_filepath 时，本地 OSM 文件只在存在缺失瓦片时读取一次，不需要联网；
+    - 未指定时，缺失的瓦片逐个通过 ox.graph_from_bbox 下载。
+
+    参数:
+    - bbox (tuple): (west, south, east, north)。
+    - cache_root (str): 瓦片缓存根目录。
+    - osm_filepath (str): 本地 OSM XML/PBF 文件路径，默认为 None（在线下载）。
+    - tile_size_deg (float): 瓦片边长（度）。
+
+    返回:
+    - tuple: (nodes_df, edges_df)。nodes_df 以 'osmid' 为索引，edges_df 以 ['u', 'v', 'key'] 为索引，
+      'geometry' 列为WKT字符串。
+    """
+    cache_dir = _source_cache_dir(cache_root, osm_filepath, tile_size_deg)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    tiles = split_bbox_into_tiles(bbox, tile_size_deg)
+    missing = [tile for tile in tiles if not os.path.exists(_tile_paths(cache_dir, tile[0], tile[1])[0])]
+    print(f"共 {len(tiles)} 个瓦片，其中 {len(missing)} 个需要处理，其余从缓存读取。")
+
+    if missing:
+        if osm_filepath is not None:
+            print(f"正在读取本地OSM文件: {osm_filepath}")
+            G = load_osm_graph(osm_filepath)
+            _write_tiles_from_graph(G, missing, tile_size_deg, cache_dir)
+        else:
+            import osmnx as ox
+            for tile in missing:
+                print(f"正在下载瓦片 ({tile[0]}, {tile[1]}) ...")
+                try:
+                    G = ox.graph_from_bbox(tile[2], network_type='all', simplify=False, truncate_by_edge=True)
+                except ValueError:
+                    # 瓦片内没有任何道路，写入空瓦片避免重复下载
+                    G = None
+                if G is None or G.number_of_edges() == 0:
+                    nodes_path, edges_path = _tile_paths(cache_dir, tile[0], tile[1])
+                    pd.DataFrame(columns=['u', 'v', 'key', 'geometry']).to_csv(edges_path, index=False)
+                    pd.DataFrame(columns=['osmid', 'y', 'x', 'geometry']).to_csv(nodes_path, index=False)
+                    continue
+                _write_tiles_from_graph(G, [tile], tile_size_deg, cache_dir)
+
+    # 合并所有瓦片，去除跨瓦片边带来的重复节点
+    node_frames, edge_frames = [], []
+    for ix, iy, _ in tiles:
+        nodes_path, edges_path = _tile_paths(cache_dir, ix, iy)
+        node_frames.append(pd.read_csv(nodes_path, index_col='osmid'))
+        edge_frames.append(pd.read_csv(edges_path, index_col=['u', 'v', 'key']))
+
+    nodes_df = pd.concat(node_frames)
+    nodes_df = nodes_df[~nodes_df.index.duplicated(keep='first')]
+    edges_df = pd.concat(edge_frames)
+    edges_df = edges_df[~edges_df.index.duplicated(keep='first')]
+
+    # 裁剪到 bbox：与 graph_from_bbox 默认行为一致，只保留两个端点都在 bbox 内的边
+    west, south, east, north = bbox
+    inside = ((nodes_df['x'] >= west) & (nodes_df['x'] <= east) &
+              (nodes_df['y'] >= south) & (nodes_df['y'] <= north))
+    nodes_df = nodes_df[inside]
+    edge_u = edges_df.index.get_level_values('u')
+    edge_v = edges_df.index.get_level_values('v')
+    edges_df = edges_df[edge_u.isin(nodes_df.index) & edge_v.isin(nodes_df.index)]
+
+    print(f"路网合并完成。节点数: {len(nodes_df)}, 边数: {len(edges_df)}")
+    return nodes_df, edges_df
+
+
+def render_network_image(edges_df: pd.DataFrame, image_filepath: str, dpi: int = 300):
+    """
+    将边表（geometry 为WKT字符串）渲染为路网图像。
+    """
+    import geopandas as gpd
+    import matplotlib.pyplot as plt
+
+    geometry = gpd.GeoSeries.from_wkt(edges_df['geometry'].dropna(), crs='EPSG:4326')
+    fig, ax = plt.subplots(figsize=(12, 12), facecolor='#FFFFFF')
+    geometry.plot(ax=ax, color='gray', linewidth=0.8)
+    ax.set_axis_off()
+    fig.savefig(image_filepath, dpi=dpi, format='png', bbox_inches='tight', pad_inches=0)
+    plt.close(fig)